@@ -0,0 +1,30 @@
+def requested_fields(request):
+    """
+    Get the field names asked for in the ``fields`` query parameter.
+    
+    Args:
+        request: The API request
+        
+    Returns:
+        set: The requested names, or None if the parameter is absent
+    """
+    if request is None or 'fields' not in request.query_params:
+        return None
+    return {name.strip() for name in request.query_params['fields'].split(',') if name.strip()}
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin limiting the output to the fields named in the
+    request's ``fields`` query parameter, e.g. ``?fields=id,name``.
+    
+    Only the top-level serializer is limited; nested serializers are built
+    without the request and keep all their fields. Unknown names are ignored.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
@@ -0,0 +1,173 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from itineraries.models import Activity
+from trips.models import Trip
+from weather.models import LocationAlias, WeatherData
+from weather.services import clear_weather_cache
+
+
+class TripApiTest(TestCase):
+    """Test cases for the trips and activities API."""
+    
+    def setUp(self):
+        today = timezone.now().date()
+        self.trips = []
+        for index in range(3):
+            trip = Trip.objects.create(
+                name=f"Trip {index}",
+                destination="Porto",
+                start_date=today + timedelta(days=index),
+                end_date=today + timedelta(days=index + 2)
+            )
+            for hour in range(4):
+                Activity.objects.create(
+                    trip=trip,
+                    name=f"Stop {index}.{hour}",
+                    date_time=timezone.now() + timedelta(days=index, hours=hour + 1),
+                    location="Ribeira"
+                )
+            self.trips.append(trip)
+        self.trip = self.trips[0]
+    
+    def test_detail_includes_activities_without_n_plus_one(self):
+        """Test that a trip and its activities take a fixed number of queries."""
+        url = reverse('api:trip-detail', args=[self.trip.pk])
+        
+        # ETag, trip, activities
+        with self.assertNumQueries(3):
+            data = self.client.get(url).json()
+        
+        self.assertEqual(data['name'], "Trip 0")
+        self.assertEqual([activity['name'] for activity in data['activities']], [f"Stop 0.{hour}" for hour in range(4)])
+    
+    def test_list_with_activities_prefetches_page(self):
+        """Test that listing trips with their activities does not query per trip."""
+        # ETag, trips, activities
+        with self.assertNumQueries(3):
+            data = self.client.get(reverse('api:trip-list'), {'fields': 'id,activities'}).json()
+        
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(set(data['results'][0]), {'id', 'activities'})
+        self.assertEqual(len(data['results'][0]['activities']), 4)
+    
+    def test_passed_next_activity_read_without_writing(self):
+        """Test that a passed next activity is replaced in responses without an UPDATE."""
+        first = self.trip.activities.order_by('date_time').first()
+        Activity.objects.filter(pk=first.pk).update(date_time=timezone.now() - timedelta(minutes=1))
+        Trip.objects.filter(pk=self.trip.pk).update(next_activity_at=timezone.now() - timedelta(minutes=1))
+        url = reverse('api:trip-detail', args=[self.trip.pk])
+        
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'fields': 'next_activity_name'}).json()
+        
+        self.assertEqual(data['next_activity_name'], "Stop 0.1")
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).next_activity_name, "Stop 0.0")
+    
+    def test_sparse_fieldsets(self):
+        """Test that ?fields= limits the fields returned."""
+        data = self.client.get(reverse('api:trip-detail', args=[self.trip.pk]), {'fields': 'name,duration'}).json()
+        
+        self.assertEqual(data, {'name': "Trip 0", 'duration': 3})
+    
+    def test_cursor_pagination(self):
+        """Test that following the next links returns every trip once, latest first."""
+        url = f"{reverse('api:trip-list')}?page_size=2&fields=name"
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            names += [trip['name'] for trip in data['results']]
+            url = data['next']
+        
+        self.assertEqual(names, ["Trip 2", "Trip 1", "Trip 0"])
+        self.assertEqual(self.client.get(reverse('api:trip-list'), {'cursor': 'bogus'}).status_code, 404)
+    
+    def test_activities_of_trip(self):
+        """Test filtering activities by trip."""
+        data = self.client.get(reverse('api:activity-list'), {'trip': self.trip.pk}).json()
+        
+        self.assertEqual([activity['name'] for activity in data['results']], [f"Stop 0.{hour}" for hour in range(4)])
+        self.assertEqual(self.client.get(reverse('api:activity-list'), {'trip': 'nope'}).status_code, 400)
+    
+    def test_unchanged_trip_is_not_modified(self):
+        """Test that a matching If-None-Match gets a 304 from the ETag query alone."""
+        url = reverse('api:trip-detail', args=[self.trip.pk])
+        etag = self.client.get(url)['ETag']
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_changed_activity_changes_etag(self):
+        """Test that editing an activity invalidates the trip's and the list's ETags."""
+        detail_url = reverse('api:trip-detail', args=[self.trip.pk])
+        list_url = reverse('api:trip-list')
+        detail_etag = self.client.get(detail_url)['ETag']
+        list_etag = self.client.get(list_url)['ETag']
+        
+        activity = self.trip.activities.first()
+        activity.name = "Renamed"
+        activity.save()
+        
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+    
+    def test_etag_depends_on_fields(self):
+        """Test that different sparse fieldsets get different ETags."""
+        url = reverse('api:trip-detail', args=[self.trip.pk])
+        etag = self.client.get(url, {'fields': 'name'})['ETag']
+        
+        self.assertEqual(self.client.get(url, {'fields': 'id'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_unknown_trip(self):
+        """Test that an unknown trip is a 404."""
+        response = self.client.get(reverse('api:trip-detail', args=['00000000-0000-0000-0000-000000000000']))
+        
+        self.assertEqual(response.status_code, 404)
+
+
+class WeatherApiTest(TestCase):
+    """Test cases for the weather API."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        WeatherData.objects.create(
+            location="porto",
+            temperature=19.0,
+            conditions="Cloudy",
+            forecast=[{"date": "2024-05-01", "temperature": 18.0, "condition": "Rain"}],
+            retrieved_at=timezone.now()
+        )
+    
+    def test_current_weather(self):
+        """Test fetching the stored weather for a location, then revalidating it."""
+        response = self.client.get(reverse('api:weather'), {'location': "Porto"})
+        
+        self.assertEqual(response.json()['conditions'], "Cloudy")
+        self.assertEqual(response.json()['forecast'][0]['condition'], "Rain")
+        
+        response = self.client.get(reverse('api:weather'), {'location': "Porto"}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_unknown_location_is_not_fetched(self, mock_fetch):
+        """Test that locations without stored weather get a 404 without any fetch or new rows."""
+        response = self.client.get(reverse('api:weather'), {'location': "Atlantis"})
+        
+        self.assertEqual(response.status_code, 404)
+        mock_fetch.assert_not_called()
+        self.assertEqual(WeatherData.objects.count(), 1)
+        self.assertFalse(LocationAlias.objects.exists())
+    
+    def test_missing_location(self):
+        """Test that the location parameter is required."""
+        self.assertEqual(self.client.get(reverse('api:weather')).status_code, 400)
@@ -0,0 +1,14 @@
+from django.urls import path
+from rest_framework.routers import DefaultRouter
+
+from api.views import ActivityViewSet, TripViewSet, WeatherView
+
+app_name = 'api'
+
+router = DefaultRouter()
+router.register('trips', TripViewSet, basename='trip')
+router.register('activities', ActivityViewSet, basename='activity')
+
+urlpatterns = router.urls + [
+    path('weather/', WeatherView.as_view(), name='weather'),
+]
@@ -0,0 +1,193 @@
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.db.models import Count, Max, Prefetch, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.pagination import KeysetCursorPagination
+from api.serializers import requested_fields
+from itineraries.models import Activity
+from itineraries.serializers import ActivitySerializer
+from itineraries.summary import fill_current_next_activities
+from trips.models import Trip
+from trips.serializers import TripDetailSerializer, TripSerializer
+from weather.serializers import WeatherDataSerializer
+from weather.locations import resolve_location
+from weather.models import WeatherData
+from weather.services import CACHE_DURATION
+
+UUID_PATTERN = '[0-9a-fA-F-]{32,36}'
+
+
+def make_etag(request, *values):
+    """
+    Build a strong ETag from values describing the state of a resource.
+    
+    The full path and the negotiated media type are included too, since the
+    query string (fields, cursor) and the renderer change the representation.
+    
+    Args:
+        request: The API request
+        *values: Values that change whenever the resource does
+        
+    Returns:
+        str: The quoted ETag
+    """
+    state = repr([request.get_full_path(), getattr(request, 'accepted_media_type', None), *values])
+    return quote_etag(hashlib.md5(state.encode(), usedforsecurity=False).hexdigest())
+
+
+def conditional_response(request, etag, respond):
+    """
+    Answer a request carrying a matching If-None-Match with 304 Not
+    Modified, and only otherwise build the response.
+    
+    Args:
+        request: The API request
+        etag (str): The current ETag of the resource
+        respond (callable): Builds the full response
+        
+    Returns:
+        The response, with its ETag header set
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = respond()
+    if 200 <= response.status_code < 400:
+        response['ETag'] = etag
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Mixin for read-only API viewsets to support ETag/If-None-Match.
+    
+    The ETag is derived from get_etag_aggregates(), computed over the rows
+    the response covers in one query, so a client with a current copy gets a
+    304 without any object being loaded or serialized. List ETags cover
+    the whole filtered queryset rather than the page.
+    """
+
+    def get_etag_aggregates(self):
+        """
+        Get aggregates whose values change whenever any row covered does.
+        """
+        return {'count': Count('pk'), 'updated_at': Max('updated_at')}
+
+    def get_etag(self):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        values = queryset.aggregate(**self.get_etag_aggregates())
+        if self.action == 'retrieve' and not values['count']:
+            # Let the lookup raise the 404
+            return None
+        return make_etag(self.request, sorted(values.items()))
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag()
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        return conditional_response(request, etag, lambda: handler(request, *args, **kwargs))
+
+
+class TripViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Trips, latest first.
+    
+    A single trip includes its activities, fetched with one extra query; a
+    list only includes them when they are named in ?fields=, and then
+    fetches the activities of the whole page in one query.
+    """
+    queryset = Trip.objects.all()
+    ordering = ('-start_date', '-id')
+    pagination_class = KeysetCursorPagination
+    lookup_value_regex = UUID_PATTERN
+
+    def includes_activities(self):
+        fields = requested_fields(self.request)
+        if fields is None:
+            return self.action == 'retrieve'
+        return 'activities' in fields
+
+    def get_serializer_class(self):
+        return TripDetailSerializer if self.includes_activities() else TripSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.includes_activities():
+            queryset = queryset.prefetch_related(
+                Prefetch('activities', queryset=Activity.objects.order_by('date_time', 'id'))
+            )
+        return queryset
+
+    def get_etag_aggregates(self):
+        aggregates = super().get_etag_aggregates()
+        # A next activity going by changes the summary without touching updated_at
+        aggregates['passed'] = Count('pk', filter=Q(next_activity_at__lt=timezone.now()))
+        return aggregates
+
+    def get_object(self):
+        trip = super().get_object()
+        fill_current_next_activities([trip])
+        return trip
+
+    def paginate_queryset(self, queryset):
+        return fill_current_next_activities(super().paginate_queryset(queryset))
+
+
+class ActivityViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Activities in time order, optionally only those of one trip with ?trip=<id>.
+    """
+    serializer_class = ActivitySerializer
+    ordering = ('date_time', 'id')
+    pagination_class = KeysetCursorPagination
+    lookup_value_regex = UUID_PATTERN
+
+    def get_queryset(self):
+        queryset = Activity.objects.all()
+        trip_id = self.request.query_params.get('trip')
+        if trip_id:
+            try:
+                uuid.UUID(trip_id)
+            except ValueError:
+                raise ValidationError({'trip': "Must be a valid UUID."})
+            queryset = queryset.filter(trip_id=trip_id)
+        return queryset
+
+
+class WeatherView(APIView):
+    """
+    The current weather for ?location=, as shown on the trip pages.
+    
+    Only weather already stored is served: fetching for arbitrary locations
+    would let any caller spend the provider quota and add rows.
+    """
+
+    def get(self, request):
+        location = request.query_params.get('location', '').strip()
+        if not location:
+            raise ValidationError({'location': "This query parameter is required."})
+        weather = WeatherData.objects.filter(location=resolve_location(location)).first()
+        if weather is None:
+            raise NotFound(f"No weather available for {location}.")
+        weather.is_stale = weather.retrieved_at < timezone.now() - timedelta(hours=CACHE_DURATION)
+        etag = make_etag(request, weather.location, weather.retrieved_at, weather.is_stale)
+        return conditional_response(
+            request, etag, lambda: Response(WeatherDataSerializer(weather, context={'request': request}).data)
+        )
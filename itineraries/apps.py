@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ItinerariesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "itineraries"
+
+    def ready(self):
+        # Register signal handlers
+        from itineraries import signals  # noqa: F401
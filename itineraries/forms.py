@@ -1,5 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.core.validators import FileExtensionValidator
 
 from itineraries.models import Activity
 
@@ -72,4 +73,24 @@ class ActivityForm(forms.ModelForm):
         if commit:
             instance.save()
             
-        return instance
\ No newline at end of file
+        return instance
+
+
+class ActivityImportForm(forms.Form):
+    """
+    Form for uploading a CSV or iCalendar file of a trip's activities.
+    """
+    file = forms.FileField(
+        validators=[FileExtensionValidator(['csv', 'ics', 'ical'])],
+        help_text="A CSV file with name, date_time and location columns "
+                  "(and optionally description and activity_type), or an iCalendar (.ics) file."
+    )
+    skip_invalid = forms.BooleanField(
+        required=False,
+        label="Import the valid activities even if some are rejected"
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['file'].widget.attrs.update({'class': 'form-control'})
+        self.fields['skip_invalid'].widget.attrs.update({'class': 'form-check-input'})
@@ -0,0 +1,301 @@
+import codecs
+import csv
+import os
+import re
+import zoneinfo
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from itineraries.forms import ActivityForm
+from itineraries.models import Activity
+from itineraries.summary import update_trip_summary
+
+# Activities inserted per bulk_create batch during an import
+IMPORT_BATCH_SIZE = getattr(settings, 'ITINERARIES_IMPORT_BATCH_SIZE', 500)
+
+# Most activities a single import may contain
+MAX_IMPORT_ROWS = getattr(settings, 'ITINERARIES_MAX_IMPORT_ROWS', 10_000)
+
+IMPORT_FORMATS = ('csv', 'ics')
+
+# CSV columns, by the ActivityForm field they fill
+CSV_REQUIRED_COLUMNS = ['name', 'date_time', 'location']
+CSV_OPTIONAL_COLUMNS = ['description', 'activity_type']
+
+ACTIVITY_TYPES = {value for value, _ in Activity.ACTIVITY_TYPE_CHOICES}
+
+ICS_TEXT_ESCAPE = re.compile(r'\\([\\;,nN])')
+
+
+class ItineraryImportError(Exception):
+    """Exception raised when an import file cannot be read at all"""
+    pass
+
+
+class ImportResult:
+    """
+    The outcome of an itinerary import.
+
+    ``errors`` holds a (line, messages) pair for every rejected row, where
+    line is the row's line number in the file and messages maps field names
+    to lists of error messages.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+
+def detect_format(file_name):
+    """
+    Get the import format from a file's extension.
+
+    Raises:
+        ItineraryImportError: If the extension is not a supported format
+    """
+    extension = os.path.splitext(file_name or '')[1].lstrip('.').lower()
+    if extension == 'ical':
+        extension = 'ics'
+    if extension not in IMPORT_FORMATS:
+        raise ItineraryImportError("Upload a .csv or .ics file.")
+    return extension
+
+
+def read_rows(file, file_format):
+    """
+    Stream the activities in an import file as form data, one row at a time.
+
+    Args:
+        file: A binary file object, iterated line by line
+        file_format (str): 'csv' or 'ics'
+
+    Returns:
+        iterator: (line number, data) pairs
+    """
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    if file_format == 'csv':
+        return read_csv_rows(lines)
+    return read_ics_rows(lines)
+
+
+def read_csv_rows(lines):
+    """
+    Read activities from CSV text with a header row naming the columns.
+
+    The name, date_time and location columns are required; description and
+    activity_type are optional. Other columns are ignored.
+
+    Raises:
+        ItineraryImportError: If a required column is missing
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    missing = [column for column in CSV_REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ItineraryImportError(f"Missing CSV column(s): {', '.join(missing)}.")
+
+    wanted = CSV_REQUIRED_COLUMNS + CSV_OPTIONAL_COLUMNS
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        data = {column: value.strip() for column, value in zip(columns, row) if column in wanted}
+        data['activity_type'] = data.get('activity_type', '').lower() or 'other'
+        yield reader.line_num, data
+
+
+def read_ics_rows(lines):
+    """
+    Read activities from the events of an iCalendar file.
+
+    SUMMARY, DTSTART, LOCATION and DESCRIPTION fill the activity's name,
+    date_time, location and description; the first CATEGORIES value naming
+    an activity type sets its type. Components nested in an event, such as
+    alarms, are skipped.
+    """
+    event = None
+    depth = 0
+    for number, line in _unfold(lines):
+        name, params, value = _parse_content_line(line)
+        if name == 'BEGIN':
+            if event is not None:
+                depth += 1
+            elif value.upper() == 'VEVENT':
+                event, start = {}, number
+        elif name == 'END' and event is not None:
+            if depth:
+                depth -= 1
+            else:
+                yield start, _event_data(event)
+                event = None
+        elif event is not None and not depth and name not in event:
+            event[name] = (params, value)
+
+
+def import_activities(trip, rows, skip_invalid=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and insert a trip's activities from an import, in one pass.
+
+    Every row is checked with ActivityForm against the given trip, so the
+    trip is fetched once rather than per activity. Valid rows are inserted
+    with bulk_create in batches, all in a single transaction. Unless
+    skip_invalid is set, any rejected row rolls the whole import back, but
+    the remaining rows are still validated so that the report is complete.
+
+    bulk_create sends no signals, so the trip's activity summary is rebuilt
+    and its updated_at bumped once at the end instead.
+
+    Args:
+        trip (Trip): The trip to add the activities to
+        rows (iterable): (line number, data) pairs, see read_rows()
+        skip_invalid (bool): Import the valid rows even if others are rejected
+        batch_size (int): Activities per bulk_create
+
+    Returns:
+        ImportResult: The counts and the per-row errors
+
+    Raises:
+        ItineraryImportError: If the file cannot be read or has too many rows
+    """
+    result = ImportResult()
+    batch = []
+
+    with transaction.atomic():
+        try:
+            for number, data in rows:
+                result.rows += 1
+                if result.rows > MAX_IMPORT_ROWS:
+                    raise ItineraryImportError(f"Imports may contain at most {MAX_IMPORT_ROWS:,} activities.")
+
+                form = ActivityForm(data=data, trip=trip)
+                if not form.is_valid():
+                    result.errors.append((number, form.errors.get_json_data()))
+                    continue
+                if result.errors and not skip_invalid:
+                    # Nothing will be saved; only keep validating
+                    continue
+
+                batch.append(form.save(commit=False))
+                if len(batch) >= batch_size:
+                    result.created += len(Activity.objects.bulk_create(batch))
+                    batch = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise ItineraryImportError(f"The file could not be read: {str(e)}")
+
+        if result.errors and not skip_invalid:
+            transaction.set_rollback(True)
+            result.created = 0
+            return result
+
+        if batch:
+            result.created += len(Activity.objects.bulk_create(batch))
+        if result.created:
+            update_trip_summary(trip.pk)
+
+    return result
+
+
+def _unfold(lines):
+    """
+    Join folded iCalendar lines, yielding (line number, content line) pairs.
+    """
+    current, start = None, 0
+    for number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield start, current
+        current, start = line, number
+    if current:
+        yield start, current
+
+
+def _parse_content_line(line):
+    """
+    Split an iCalendar content line into its upper-cased name, parameters
+    and value. Colons within quoted parameter values are skipped.
+    """
+    quoted = False
+    for index, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        return line.strip().upper(), {}, ''
+
+    name, *parts = head.split(';')
+    params = {}
+    for part in parts:
+        key, _, param = part.partition('=')
+        params[key.upper()] = param.strip('"')
+    return name.strip().upper(), params, value
+
+
+def _unescape(value):
+    return ICS_TEXT_ESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _event_data(event):
+    """
+    Convert an event's properties to ActivityForm data.
+    """
+    data = {
+        'name': _unescape(event.get('SUMMARY', ({}, ''))[1]).strip(),
+        'location': _unescape(event.get('LOCATION', ({}, ''))[1]).strip(),
+        'description': _unescape(event.get('DESCRIPTION', ({}, ''))[1]).strip(),
+        'activity_type': 'other',
+        'date_time': '',
+    }
+
+    categories = event.get('CATEGORIES', ({}, ''))[1]
+    for category in _unescape(categories).split(','):
+        if category.strip().lower() in ACTIVITY_TYPES:
+            data['activity_type'] = category.strip().lower()
+            break
+
+    if 'DTSTART' in event:
+        params, value = event['DTSTART']
+        # Left as text the form will reject if it cannot be parsed
+        data['date_time'] = _parse_ics_datetime(value.strip(), params) or value
+    return data
+
+
+def _parse_ics_datetime(value, params):
+    """
+    Parse a DTSTART value, which may be UTC, in a named time zone, floating
+    (local) or a whole day.
+
+    Returns:
+        datetime: The aware datetime, or None if the value is malformed
+    """
+    try:
+        if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+            naive = datetime.combine(datetime.strptime(value, '%Y%m%d').date(), time.min)
+        else:
+            naive = datetime.strptime(value.rstrip('Zz'), '%Y%m%dT%H%M%S')
+    except ValueError:
+        return None
+
+    if value[-1:] in ('Z', 'z'):
+        return naive.replace(tzinfo=dt_timezone.utc)
+    if 'TZID' in params:
+        try:
+            return timezone.make_aware(naive, zoneinfo.ZoneInfo(params['TZID']))
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            # Non-standard zone names fall back to local time
+            pass
+    return timezone.make_aware(naive)
@@ -0,0 +1,69 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from itineraries.imports import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_FORMATS,
+    ItineraryImportError,
+    detect_format,
+    import_activities,
+    read_rows,
+)
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Import a trip's activities from a CSV or iCalendar file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('trip_id', help="The trip to add the activities to.")
+        parser.add_argument('path', help="The CSV or iCalendar file to import.")
+        parser.add_argument(
+            '--format',
+            choices=IMPORT_FORMATS,
+            help="The file format (default: from the file extension)."
+        )
+        parser.add_argument(
+            '--skip-invalid',
+            action='store_true',
+            help="Import the valid activities even if some rows are rejected."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help=f"Activities inserted per batch (default: {IMPORT_BATCH_SIZE})."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            trip = Trip.objects.filter(pk=options['trip_id']).first()
+        except ValidationError:
+            trip = None
+        if trip is None:
+            raise CommandError(f"Trip {options['trip_id']} does not exist.")
+
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+            with open(options['path'], 'rb') as file:
+                result = import_activities(
+                    trip, read_rows(file, file_format),
+                    skip_invalid=options['skip_invalid'],
+                    batch_size=max(options['batch_size'], 1)
+                )
+        except (ItineraryImportError, OSError) as e:
+            raise CommandError(str(e))
+
+        for line, row_errors in result.errors:
+            for field, field_errors in row_errors.items():
+                for error in field_errors:
+                    prefix = f"Line {line}" if field == '__all__' else f"Line {line}, {field}"
+                    self.stderr.write(f"{prefix}: {error['message']}")
+
+        if result.errors and not options['skip_invalid']:
+            raise CommandError(
+                f"{len(result.errors)} of {result.rows} rows rejected; no activities were imported."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created} of {result.rows} activities into {trip.name}."
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from itineraries.summary import rebuild_trip_summaries, REBUILD_BATCH_SIZE
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized activity summary of trips."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'trip_ids',
+            nargs='*',
+            help="Trips to rebuild (default: all trips)."
+        )
+        parser.add_argument(
+            '--passed',
+            action='store_true',
+            help="Only rebuild trips whose stored next activity has passed; "
+                 "run this periodically to keep the stored summaries current."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REBUILD_BATCH_SIZE,
+            help=f"Trips summarized and updated per batch (default: {REBUILD_BATCH_SIZE})."
+        )
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.all()
+        if options['trip_ids']:
+            trips = trips.filter(pk__in=options['trip_ids'])
+        if options['passed']:
+            trips = trips.filter(next_activity_at__lt=timezone.now())
+
+        count = rebuild_trip_summaries(trips, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the summaries of {count} trips."))
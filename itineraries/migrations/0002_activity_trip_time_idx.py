@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("itineraries", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="activity",
+            index=models.Index(
+                fields=["trip", "date_time", "id"], name="activity_trip_time_idx"
+            ),
+        ),
+    ]
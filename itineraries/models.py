@@ -43,6 +43,10 @@ class Activity(models.Model):
         ordering = ['date_time']
         verbose_name = "Activity"
         verbose_name_plural = "Activities"
+        indexes = [
+            # A trip's activities in order, for keyset pagination on (date_time, id)
+            models.Index(fields=['trip', 'date_time', 'id'], name='activity_trip_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.date_time.strftime('%Y-%m-%d %H:%M')}"
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+from api.serializers import SparseFieldsetsMixin
+from itineraries.models import Activity
+
+
+class ActivitySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Activity
+        fields = [
+            'id', 'trip', 'name', 'date_time', 'location', 'description',
+            'activity_type', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
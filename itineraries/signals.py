@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from itineraries.models import Activity
+from itineraries.summary import update_trip_summary
+from trips.models import Trip
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def update_trip(sender, instance, origin=None, **kwargs):
+    """
+    Update the trip's activity summary and bump its updated_at whenever one
+    of its activities changes, so that caches keyed on it (such as the
+    itinerary on the trip detail page) are invalidated.
+    
+    Bulk queryset operations do not send signals; run
+    itineraries.summary.rebuild_trip_summaries after them instead.
+    """
+    if isinstance(origin, Trip) or getattr(origin, 'model', None) is Trip:
+        # The activity is being deleted along with its trip, or with a
+        # queryset of trips (e.g. the admin's bulk delete)
+        return
+    update_trip_summary(instance.trip_id)
@@ -0,0 +1,136 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+
+from itineraries.models import Activity
+from trips.models import Trip
+
+# Trip fields holding the denormalized activity summary
+SUMMARY_FIELDS = ['activity_count', 'activity_type_counts', 'next_activity_name', 'next_activity_at']
+
+# Trips summarized per batch by rebuild_trip_summaries
+REBUILD_BATCH_SIZE = 500
+
+
+def compute_trip_summaries(trip_ids, now=None):
+    """
+    Compute the activity summary of several trips in two queries.
+    
+    Args:
+        trip_ids (list): Primary keys of the trips to summarize
+        now (datetime): The time from which activities count as upcoming
+        
+    Returns:
+        dict: The summary field values for each trip id
+    """
+    now = now or timezone.now()
+    summaries = {
+        trip_id: {
+            'activity_count': 0,
+            'activity_type_counts': {},
+            'next_activity_name': '',
+            'next_activity_at': None,
+        }
+        for trip_id in trip_ids
+    }
+    
+    counts = (
+        Activity.objects.filter(trip_id__in=trip_ids)
+        .values('trip_id', 'activity_type')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in counts:
+        summary = summaries[row['trip_id']]
+        activity_type = row['activity_type'] or 'other'
+        summary['activity_count'] += row['count']
+        summary['activity_type_counts'][activity_type] = (
+            summary['activity_type_counts'].get(activity_type, 0) + row['count']
+        )
+    
+    for trip_id, name, date_time in _next_activities(trip_ids, now):
+        summaries[trip_id]['next_activity_name'] = name or ''
+        summaries[trip_id]['next_activity_at'] = date_time
+    
+    return summaries
+
+
+def _next_activities(trip_ids, now):
+    """
+    Get the first activity at or after now of each trip, in one query.
+    
+    Returns:
+        QuerySet: (trip id, activity name, activity time) tuples
+    """
+    upcoming = Activity.objects.filter(trip=OuterRef('pk'), date_time__gte=now).order_by('date_time', 'id')
+    return (
+        Trip.objects.filter(pk__in=trip_ids)
+        .annotate(
+            upcoming_name=Subquery(upcoming.values('name')[:1]),
+            upcoming_at=Subquery(upcoming.values('date_time')[:1]),
+        )
+        .values_list('pk', 'upcoming_name', 'upcoming_at')
+    )
+
+
+def update_trip_summary(trip_id):
+    """
+    Recompute one trip's activity summary after one of its activities
+    changed, and bump its updated_at.
+    
+    Args:
+        trip_id: The primary key of the trip
+    """
+    summary = compute_trip_summaries([trip_id])[trip_id]
+    Trip.objects.filter(pk=trip_id).update(updated_at=timezone.now(), **summary)
+
+
+def rebuild_trip_summaries(trips=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recompute the activity summary of many trips in batches.
+    
+    Args:
+        trips (QuerySet): The trips to rebuild, all trips by default
+        batch_size (int): Trips summarized and updated per batch
+        
+    Returns:
+        int: The number of trips rebuilt
+    """
+    trips = Trip.objects.all() if trips is None else trips
+    trip_ids = list(trips.order_by('pk').values_list('pk', flat=True))
+    batch_size = max(batch_size, 1)
+    
+    for start in range(0, len(trip_ids), batch_size):
+        summaries = compute_trip_summaries(trip_ids[start:start + batch_size])
+        Trip.objects.bulk_update(
+            [Trip(pk=trip_id, **summary) for trip_id, summary in summaries.items()],
+            SUMMARY_FIELDS
+        )
+    
+    return len(trip_ids)
+
+
+def fill_current_next_activities(trips):
+    """
+    Replace, in memory only, the next activity of trips whose stored next
+    activity has passed.
+    
+    Summaries are only saved when activities change, so the stored next
+    activity goes out of date as time passes. Views showing trips pass them
+    here first, so that reads never write; the rebuild_trip_summaries
+    command, run periodically, brings the stored summaries up to date.
+    
+    Args:
+        trips (list): Trip objects, updated in place
+        
+    Returns:
+        list: The given trips
+    """
+    now = timezone.now()
+    stale = {trip.pk: trip for trip in trips if trip.next_activity_at and trip.next_activity_at < now}
+    if not stale:
+        return trips
+    
+    for trip_id, name, date_time in _next_activities(list(stale), now):
+        stale[trip_id].next_activity_name = name or ''
+        stale[trip_id].next_activity_at = date_time
+    return trips
@@ -0,0 +1,47 @@
+from django import template
+
+register = template.Library()
+
+# Bootstrap Icon and text colour class for each activity type
+ACTIVITY_ICONS = {
+    'transportation': ('bi-airplane', 'text-primary'),
+    'accommodation': ('bi-house-door', 'text-success'),
+    'sightseeing': ('bi-binoculars', 'text-info'),
+    'food': ('bi-cup-hot', 'text-danger'),
+    'entertainment': ('bi-music-note-beamed', 'text-warning'),
+}
+DEFAULT_ACTIVITY_ICON = ('bi-calendar-event', 'text-secondary')
+
+
+@register.filter
+def activity_icon(activity_type):
+    """
+    Template filter to get the Bootstrap Icon for an activity type.
+    
+    Usage:
+    {{ activity.activity_type|activity_icon }}
+    
+    Args:
+        activity_type (str): The activity type
+        
+    Returns:
+        str: The Bootstrap Icon class for the activity type
+    """
+    return ACTIVITY_ICONS.get(activity_type, DEFAULT_ACTIVITY_ICON)[0]
+
+
+@register.filter
+def activity_color(activity_type):
+    """
+    Template filter to get the text colour class for an activity type.
+    
+    Usage:
+    {{ activity.activity_type|activity_color }}
+    
+    Args:
+        activity_type (str): The activity type
+        
+    Returns:
+        str: The Bootstrap text colour class for the activity type
+    """
+    return ACTIVITY_ICONS.get(activity_type, DEFAULT_ACTIVITY_ICON)[1]
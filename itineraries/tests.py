@@ -1,3 +1,350 @@
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from itineraries.imports import import_activities
+from itineraries.models import Activity
+from itineraries.summary import fill_current_next_activities
+from itineraries.templatetags.activity_tags import activity_color, activity_icon
+from trips.models import Trip
+
+
+class ActivityTagsTest(TestCase):
+    """Test cases for the activity template filters."""
+    
+    def test_known_type(self):
+        """Test the icon and colour of a known activity type."""
+        self.assertEqual(activity_icon('food'), 'bi-cup-hot')
+        self.assertEqual(activity_color('food'), 'text-danger')
+    
+    def test_unknown_type(self):
+        """Test that other or missing types get the default icon."""
+        self.assertEqual(activity_icon(None), 'bi-calendar-event')
+        self.assertEqual(activity_color('other'), 'text-secondary')
+
+
+class ActivitySignalTest(TestCase):
+    """Test cases for keeping the trip's updated_at in step with its activities."""
+    
+    def setUp(self):
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Weekend",
+            destination="Bruges",
+            start_date=today,
+            end_date=today + timedelta(days=2)
+        )
+        Trip.objects.filter(pk=self.trip.pk).update(updated_at=timezone.now() - timedelta(days=1))
+    
+    def test_saving_activity_touches_trip(self):
+        """Test that adding an activity bumps the trip's updated_at."""
+        before = Trip.objects.get(pk=self.trip.pk).updated_at
+        Activity.objects.create(
+            trip=self.trip,
+            name="Canal Tour",
+            date_time=timezone.now(),
+            location="Rozenhoedkaai"
+        )
+        
+        self.assertGreater(Trip.objects.get(pk=self.trip.pk).updated_at, before)
+    
+    def test_deleting_trip_skips_touch(self):
+        """Test that activities deleted with their trip do not update it."""
+        Activity.objects.create(
+            trip=self.trip,
+            name="Canal Tour",
+            date_time=timezone.now(),
+            location="Rozenhoedkaai"
+        )
+        
+        with self.assertNumQueries(3):
+            self.trip.delete()
+    
+    def test_queryset_delete_skips_touch(self):
+        """Test that deleting trips in bulk does not update each trip per activity."""
+        for index in range(3):
+            Activity.objects.create(
+                trip=self.trip,
+                name=f"Stop {index}",
+                date_time=timezone.now(),
+                location="Markt"
+            )
+        
+        with patch('itineraries.signals.update_trip_summary') as update:
+            Trip.objects.filter(pk=self.trip.pk).delete()
+        
+        update.assert_not_called()
+
+
+@patch('itineraries.views.ActivityListView.paginate_by', 5)
+class ActivityPaginationTest(TestCase):
+    """Test cases for the paginated, lazily loaded activity list."""
+    
+    def setUp(self):
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Grand Tour",
+            destination="Rome",
+            start_date=today,
+            end_date=today + timedelta(days=10)
+        )
+        start = timezone.now()
+        # Pairs of activities share a time, so the id must break ties
+        for index in range(12):
+            Activity.objects.create(
+                trip=self.trip,
+                name=f"Stop {index}",
+                date_time=start + timedelta(hours=index // 2),
+                location="Rome"
+            )
+        self.expected = list(
+            Activity.objects.filter(trip=self.trip).order_by('date_time', 'id').values_list('name', flat=True)
+        )
+    
+    def test_first_page_is_rendered(self):
+        """Test that the list page renders only the first page of activities."""
+        response = self.client.get(reverse('activity-list', args=[self.trip.pk]))
+        
+        self.assertEqual([activity.name for activity in response.context['activities']], self.expected[:5])
+        self.assertContains(response, reverse('activity-page', args=[self.trip.pk]))
+    
+    def test_json_pages_follow_on(self):
+        """Test that following the JSON next links returns every remaining activity."""
+        first = self.client.get(reverse('activity-list', args=[self.trip.pk]))
+        url = f"{reverse('activity-page', args=[self.trip.pk])}?cursor={first.context['page_obj'].next_cursor}"
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            names += [name for name in self.expected if f"{name}</h5>" in data['html']]
+            url = data['next']
+        
+        self.assertEqual(names, self.expected[5:])
+    
+    def test_unknown_trip(self):
+        """Test that the JSON endpoint returns 404 for an unknown trip."""
+        response = self.client.get(reverse('activity-page', args=['00000000-0000-0000-0000-000000000000']))
+        
+        self.assertEqual(response.status_code, 404)
+
+
+class TripSummaryTest(TestCase):
+    """Test cases for the denormalized activity summary on trips."""
+    
+    def setUp(self):
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Food Trip",
+            destination="Lyon",
+            start_date=today,
+            end_date=today + timedelta(days=3)
+        )
+        now = timezone.now()
+        self.past = Activity.objects.create(
+            trip=self.trip, name="Market", date_time=now - timedelta(hours=2),
+            location="Les Halles", activity_type='food'
+        )
+        self.next = Activity.objects.create(
+            trip=self.trip, name="Bouchon", date_time=now + timedelta(hours=3),
+            location="Vieux Lyon", activity_type='food'
+        )
+        self.later = Activity.objects.create(
+            trip=self.trip, name="Basilica", date_time=now + timedelta(days=1),
+            location="Fourvière", activity_type='sightseeing'
+        )
+    
+    def test_signals_maintain_summary(self):
+        """Test that saving and deleting activities keeps the summary current."""
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.activity_count, 3)
+        self.assertEqual(trip.activity_type_counts, {'food': 2, 'sightseeing': 1})
+        self.assertEqual(trip.next_activity_name, "Bouchon")
+        
+        self.next.delete()
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.activity_count, 2)
+        self.assertEqual(trip.activity_type_counts, {'food': 1, 'sightseeing': 1})
+        self.assertEqual(trip.next_activity_name, "Basilica")
+    
+    def test_passed_next_activity_is_computed_on_read(self):
+        """Test that a next activity in the past is replaced when listed, without a write."""
+        Activity.objects.filter(pk=self.next.pk).update(date_time=timezone.now() - timedelta(minutes=1))
+        trip = Trip.objects.get(pk=self.trip.pk)
+        trip.next_activity_at = timezone.now() - timedelta(minutes=1)
+        
+        with self.assertNumQueries(1):
+            fill_current_next_activities([trip])
+        
+        self.assertEqual(trip.next_activity_name, "Basilica")
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).next_activity_name, "Bouchon")
+    
+    def test_rebuild_command_passed_only(self):
+        """Test that the rebuild command can persist only passed next activities."""
+        Activity.objects.filter(pk=self.next.pk).update(date_time=timezone.now() - timedelta(minutes=1))
+        Trip.objects.filter(pk=self.trip.pk).update(next_activity_at=timezone.now() - timedelta(minutes=1))
+        today = timezone.now().date()
+        other = Trip.objects.create(name="Other", destination="Nice", start_date=today, end_date=today)
+        Trip.objects.filter(pk=other.pk).update(activity_count=5)
+        out = StringIO()
+        
+        call_command('rebuild_trip_summaries', '--passed', stdout=out)
+        
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).next_activity_name, "Basilica")
+        self.assertEqual(Trip.objects.get(pk=other.pk).activity_count, 5)
+        self.assertIn("1 trips", out.getvalue())
+    
+    def test_rebuild_command(self):
+        """Test that the rebuild command fixes summaries after bulk changes."""
+        Activity.objects.bulk_create([
+            Activity(trip=self.trip, name=f"Extra {index}", date_time=timezone.now(), location="Lyon")
+            for index in range(4)
+        ])
+        out = StringIO()
+        
+        call_command('rebuild_trip_summaries', stdout=out)
+        
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.activity_count, 7)
+        self.assertEqual(trip.activity_type_counts['other'], 4)
+        self.assertIn("1 trips", out.getvalue())
+    
+    def test_trip_list_shows_summary(self):
+        """Test that trip cards show the summary without querying activities."""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('trip-list'))
+        
+        self.assertContains(response, "3 activities")
+        self.assertContains(response, "Next: Bouchon")
+
 
-# Create your tests here.
+class ActivityImportTest(TestCase):
+    """Test cases for importing activities from CSV and iCalendar files."""
+    
+    def setUp(self):
+        self.trip = Trip.objects.create(
+            name="Road Trip",
+            destination="Scotland",
+            start_date=date(2024, 5, 1),
+            end_date=date(2024, 5, 7)
+        )
+    
+    def upload(self, name, content, **data):
+        return self.client.post(
+            reverse('activity-import', args=[self.trip.pk]),
+            {'file': SimpleUploadedFile(name, content.encode()), **data}
+        )
+    
+    def test_csv_import(self):
+        """Test that a large CSV file is inserted in batches and summarized once."""
+        lines = ["name,date_time,location,activity_type"]
+        lines += [f"Stop {index},2024-05-0{index % 7 + 1} 10:00,Glencoe,sightseeing" for index in range(1200)]
+        
+        response = self.upload("trip.csv", "\n".join(lines))
+        
+        self.assertRedirects(response, reverse('activity-list', args=[self.trip.pk]))
+        trip = Trip.objects.get(pk=self.trip.pk)
+        self.assertEqual(trip.activity_count, 1200)
+        self.assertEqual(trip.activity_type_counts, {'sightseeing': 1200})
+        self.assertGreater(trip.updated_at, self.trip.updated_at)
+    
+    def test_import_queries_do_not_grow_with_rows(self):
+        """Test that validation does not query the database per row."""
+        rows = [(index + 2, {'name': f"Stop {index}", 'date_time': "2024-05-02 09:00", 'location': "Oban"})
+                for index in range(50)]
+        
+        # Savepoint, 5 batches, summary (2 queries) and update, release
+        with self.assertNumQueries(10):
+            result = import_activities(self.trip, rows, batch_size=10)
+        
+        self.assertEqual(result.created, 50)
+    
+    def test_invalid_rows_are_reported(self):
+        """Test that any rejected row is reported by line and nothing is imported."""
+        content = (
+            "name,date_time,location\n"
+            "Castle,2024-05-02 10:00,Stirling\n"
+            "Too Late,2024-06-01 10:00,Skye\n"
+            ",2024-05-03 10:00,Skye\n"
+        )
+        
+        response = self.upload("trip.csv", content)
+        
+        self.assertEqual(self.trip.activities.count(), 0)
+        errors = dict(response.context['result'].errors)
+        self.assertEqual(set(errors), {3, 4})
+        self.assertIn('date_time', errors[3])
+        self.assertIn('name', errors[4])
+        self.assertContains(response, "2 of 3 rows rejected")
+    
+    def test_skip_invalid(self):
+        """Test importing only the valid rows."""
+        content = "name,date_time,location\nCastle,2024-05-02 10:00,Stirling\nToo Late,2024-06-01 10:00,Skye\n"
+        
+        response = self.upload("trip.csv", content, skip_invalid='on')
+        
+        self.assertEqual(list(self.trip.activities.values_list('name', flat=True)), ["Castle"])
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).activity_count, 1)
+        self.assertEqual(len(response.context['result'].errors), 1)
+    
+    def test_missing_column(self):
+        """Test that a CSV file without a required column is rejected."""
+        response = self.upload("trip.csv", "name,location\nCastle,Stirling\n")
+        
+        self.assertFormError(response.context['form'], 'file', "Missing CSV column(s): date_time.")
+    
+    def test_ics_import(self):
+        """Test importing events, with folded lines, escapes, time zones and alarms."""
+        content = "\r\n".join([
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "BEGIN:VEVENT",
+            "SUMMARY:Distillery\\, tour",
+            "DTSTART;TZID=Europe/London:20240503T140000",
+            "LOCATION:Speyside",
+            "DESCRIPTION:Book ahead\\nBring",
+            "  ID",
+            "CATEGORIES:FOOD,TOURS",
+            "BEGIN:VALARM",
+            "DESCRIPTION:Reminder",
+            "END:VALARM",
+            "END:VEVENT",
+            "BEGIN:VEVENT",
+            "SUMMARY:Ferry",
+            "DTSTART:20240505T080000Z",
+            "LOCATION:Ullapool",
+            "END:VEVENT",
+            "END:VCALENDAR",
+        ])
+        out = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.ics', delete=False) as file:
+            file.write(content)
+        self.addCleanup(os.unlink, file.name)
+        
+        call_command('import_activities', str(self.trip.pk), file.name, stdout=out)
+        
+        tour, ferry = self.trip.activities.order_by('date_time')
+        self.assertEqual(tour.name, "Distillery, tour")
+        self.assertEqual(tour.description, "Book ahead\nBring ID")
+        self.assertEqual(tour.activity_type, 'food')
+        self.assertEqual(tour.date_time, datetime(2024, 5, 3, 13, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(ferry.activity_type, 'other')
+        self.assertIn("Imported 2 of 2", out.getvalue())
+    
+    def test_command_reports_errors(self):
+        """Test that the command lists rejected rows and fails."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write("name,date_time,location\nToo Early,2024-04-01 10:00,Leith\n")
+        self.addCleanup(os.unlink, file.name)
+        err = StringIO()
+        
+        with self.assertRaises(CommandError):
+            call_command('import_activities', str(self.trip.pk), file.name, stderr=err)
+        
+        self.assertIn("Line 2, date_time", err.getvalue())
@@ -2,8 +2,10 @@ from django.urls import path
 
 from itineraries.views import (
     ActivityListView,
+    ActivityPageView,
     ActivityDetailView,
     ActivityCreateView,
+    ActivityImportView,
     ActivityUpdateView,
     ActivityDeleteView
 )
@@ -14,11 +16,21 @@ urlpatterns = [
          ActivityListView.as_view(), 
          name='activity-list'),
     
+    # Further pages of a trip's activities, as JSON
+    path('trip/<uuid:trip_id>/activities/page/', 
+         ActivityPageView.as_view(), 
+         name='activity-page'),
+    
     # Create new activity for a specific trip
     path('trip/<uuid:trip_id>/activities/create/', 
          ActivityCreateView.as_view(), 
          name='activity-create'),
     
+    # Import activities for a specific trip from a CSV or iCalendar file
+    path('trip/<uuid:trip_id>/activities/import/', 
+         ActivityImportView.as_view(), 
+         name='activity-import'),
+    
     # View activity details
     path('activities/<uuid:pk>/', 
          ActivityDetailView.as_view(), 
@@ -1,26 +1,40 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.views.generic import (
     ListView,
     DetailView,
     CreateView,
     UpdateView,
-    DeleteView
+    DeleteView,
+    FormView
 )
 from django.contrib import messages
 
 from itineraries.models import Activity
-from itineraries.forms import ActivityForm
+from itineraries.forms import ActivityForm, ActivityImportForm
+from itineraries.imports import ItineraryImportError, detect_format, import_activities, read_rows
 from trips.models import Trip
+from trips.pagination import KeysetPaginationMixin
 
+# Activities per page of a trip's activity list
+ACTIVITIES_PER_PAGE = getattr(settings, 'ITINERARIES_ACTIVITIES_PER_PAGE', 50)
 
-class ActivityListView(ListView):
+
+class ActivityListView(KeysetPaginationMixin, ListView):
     """
     Display a list of activities for a specific trip.
+    
+    Only the first page is rendered with the page; further pages are
+    loaded by ActivityPageView as the user scrolls.
     """
     model = Activity
     template_name = 'itineraries/activity_list.html'
     context_object_name = 'activities'
+    paginate_by = ACTIVITIES_PER_PAGE
+    ordering = ['date_time', 'id']
     
     def get_queryset(self):
         """
@@ -38,6 +52,72 @@ class ActivityListView(ListView):
         return context
 
 
+class ActivityPageView(ActivityListView):
+    """
+    Return one page of a trip's activities as JSON for infinite scrolling.
+    
+    The response holds the rendered list items and the URL of the next
+    page, or null on the last page.
+    """
+    template_name = 'itineraries/activity_list_items.html'
+    
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        next_url = None
+        if page.has_next():
+            next_url = f"{self.request.path}?{self.cursor_kwarg}={page.next_cursor}"
+        return JsonResponse({
+            'html': render_to_string(self.template_name, context, request=self.request),
+            'next': next_url,
+        })
+
+
+class ActivityImportView(FormView):
+    """
+    Import many activities into a trip at once from a CSV or iCalendar file.
+    
+    The file is streamed and validated in one pass; rejected rows are
+    reported by line number.
+    """
+    form_class = ActivityImportForm
+    template_name = 'itineraries/activity_import.html'
+    
+    def dispatch(self, request, *args, **kwargs):
+        self.trip = get_object_or_404(Trip, pk=self.kwargs['trip_id'])
+        return super().dispatch(request, *args, **kwargs)
+    
+    def get_context_data(self, **kwargs):
+        """
+        Add trip to context.
+        """
+        context = super().get_context_data(**kwargs)
+        context['trip'] = self.trip
+        return context
+    
+    def form_valid(self, form):
+        """
+        Import the file, then go to the activity list, or show the rejected rows.
+        """
+        upload = form.cleaned_data['file']
+        try:
+            rows = read_rows(upload, detect_format(upload.name))
+            result = import_activities(self.trip, rows, skip_invalid=form.cleaned_data['skip_invalid'])
+        except ItineraryImportError as e:
+            form.add_error('file', str(e))
+            return self.form_invalid(form)
+        
+        if not result.rows:
+            form.add_error('file', "The file contains no activities.")
+            return self.form_invalid(form)
+        if result.created:
+            messages.success(self.request, f'Imported {result.created} activities.')
+        if result.errors:
+            if not result.created:
+                messages.error(self.request, 'No activities were imported.')
+            return self.render_to_response(self.get_context_data(form=form, result=result))
+        return redirect('activity-list', trip_id=self.trip.pk)
+
+
 class ActivityDetailView(DetailView):
     """
     Display details of a specific activity.
@@ -65,9 +145,11 @@ class ActivityCreateView(CreateView):
     
     def get_trip(self):
         """
-        Get the trip object from URL.
+        Get the trip object from URL, fetching it once per request.
         """
-        return get_object_or_404(Trip, pk=self.kwargs['trip_id'])
+        if not hasattr(self, 'trip'):
+            self.trip = get_object_or_404(Trip, pk=self.kwargs['trip_id'])
+        return self.trip
     
     def get_form_kwargs(self):
         """
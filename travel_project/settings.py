@@ -98,6 +98,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The "weather" cache is shared by all worker processes; create its table
+# with `python manage.py createcachetable`. The "weather_shared" cache keeps
+# weather lookups in a memory-mapped file shared by the workers on one host.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "weather": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "weather_cache",
+    },
+    "weather_shared": {
+        "BACKEND": "weather.cache.SharedMemoryCache",
+        "LOCATION": os.environ.get('WEATHER_SHARED_CACHE_PATH', ''),
+        "OPTIONS": {"SLOTS": 512, "SLOT_SIZE": 4096},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -148,3 +170,17 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Weather API Configuration
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')
 WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'https://api.example.com/weather')
+
+# Circuit breaker state for the weather API, shared by all workers
+WEATHER_CIRCUIT_CACHE = "weather"
+
+# Cache alias for weather lookups, e.g. "weather_shared"; empty keeps a
+# separate in-process cache in each worker
+WEATHER_CACHE_ALIAS = os.environ.get('WEATHER_CACHE_ALIAS', '')
+
+# Longest time (in milliseconds) a page waits for weather before rendering
+# with stored or "loading" data; 0 waits for the fetch to finish
+WEATHER_RENDER_BUDGET_MS = int(os.environ.get('WEATHER_RENDER_BUDGET_MS', '0'))
+
+# Use the async dashboard and trip detail views (for ASGI deployments)
+TRIPS_ASYNC_VIEWS = os.environ.get('TRIPS_ASYNC_VIEWS', 'False') == 'True'
@@ -25,7 +25,8 @@ urlpatterns = [
     # App-specific URL patterns
     path("", include("trips.urls")),
     path("", include("itineraries.urls")),
-    # path("weather/", include("weather.urls")),
+    path("weather/", include("weather.urls")),
+    path("api/", include("api.urls")),
 ]
 
 # Serve media files in development
@@ -1,11 +1,18 @@
 from django.contrib import admin
 
-from trips.models import Trip
+from trips.models import CoverBlob, Trip
 
 
 @admin.register(Trip)
 class TripAdmin(admin.ModelAdmin):
-    list_display = ('name', 'destination', 'start_date', 'end_date')
+    list_display = ('name', 'destination', 'start_date', 'end_date', 'activity_count')
     search_fields = ('name', 'destination', 'description')
     list_filter = ('start_date', 'end_date')
     date_hierarchy = 'start_date'
+
+
+@admin.register(CoverBlob)
+class CoverBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'created_at')
+    search_fields = ('name', 'digest')
+    readonly_fields = ('id', 'digest', 'name', 'size', 'ref_count', 'created_at')
@@ -0,0 +1,81 @@
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from trips.images import cover_image_storage
+from trips.models import CoverBlob, Trip
+from trips.storage import VARIANTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Unreferenced blobs younger than this are kept, since a blob is stored
+# before the trip referencing it is saved
+BLOB_GRACE_HOURS = getattr(settings, 'TRIPS_COVER_BLOB_GRACE_HOURS', 24)
+
+
+def recount_cover_blobs():
+    """
+    Recompute every blob's reference count from the trips using it, fixing
+    drift from bulk updates or deletes that bypass signals.
+    
+    Returns:
+        int: The number of blobs whose count changed
+    """
+    counts = dict(
+        Trip.objects.exclude(cover_image='')
+        .values_list('cover_image')
+        .annotate(references=Count('pk'))
+        .order_by()
+    )
+    changed = []
+    for blob in CoverBlob.objects.all():
+        references = counts.get(blob.name, 0)
+        if blob.ref_count != references:
+            blob.ref_count = references
+            changed.append(blob)
+    CoverBlob.objects.bulk_update(changed, ['ref_count'])
+    return len(changed)
+
+
+def collect_cover_blobs(grace_hours=BLOB_GRACE_HOURS, dry_run=False):
+    """
+    Delete cover image blobs no trip references, with their derivatives.
+    
+    Args:
+        grace_hours (int): Keep unreferenced blobs created more recently than this
+        dry_run (bool): Only report what would be deleted
+        
+    Returns:
+        dict: The number of blobs and bytes deleted
+    """
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    storage = cover_image_storage()
+    result = {'blobs': 0, 'bytes': 0}
+    for blob in CoverBlob.objects.filter(ref_count__lte=0, created_at__lt=cutoff):
+        # The count is only a hint; never delete a file a trip still uses
+        if Trip.objects.filter(cover_image=blob.name).exists():
+            continue
+        result['blobs'] += 1
+        result['bytes'] += blob.size
+        if dry_run:
+            continue
+        storage.delete(blob.name)
+        _delete_variants(storage, blob.name)
+        blob.delete()
+    return result
+
+
+def _delete_variants(storage, name):
+    folder = os.path.join(os.path.dirname(name), VARIANTS_DIR)
+    prefix = os.path.splitext(os.path.basename(name))[0] + '-'
+    try:
+        _, files = storage.listdir(folder)
+    except FileNotFoundError:
+        return
+    for file_name in files:
+        if file_name.startswith(prefix):
+            storage.delete(os.path.join(folder, file_name))
@@ -2,6 +2,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 
 from trips.models import Trip
+from trips.uploads import CoverImageField
 
 
 class TripForm(forms.ModelForm):
@@ -24,6 +25,26 @@ class TripForm(forms.ModelForm):
             'end_date': forms.DateInput(attrs={'type': 'date'}),
             'description': forms.Textarea(attrs={'rows': 4}),
         }
+        field_classes = {
+            'cover_image': CoverImageField,
+        }
+    
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        """
+        Accept errors from CoverImageUploadHandler for files it rejected
+        while they were uploaded.
+        """
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+    
+    def clean_cover_image(self):
+        """
+        Report a cover image rejected during upload, rather than treating
+        the field as left empty.
+        """
+        if 'cover_image' in self.upload_errors:
+            raise self.upload_errors['cover_image']
+        return self.cleaned_data.get('cover_image')
     
     def clean(self):
         """
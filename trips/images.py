@@ -0,0 +1,177 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from trips.models import Trip
+from trips.storage import VARIANTS_DIR
+from trips.uploads import MAX_COVER_PIXELS
+
+logger = logging.getLogger(__name__)
+
+# Widths (in pixels) of the generated cover image derivatives
+COVER_WIDTHS = getattr(settings, 'TRIPS_COVER_WIDTHS', [320, 640, 1280])
+
+# Derivative formats, in order of preference; formats this Pillow build
+# cannot write are skipped
+COVER_FORMATS = getattr(settings, 'TRIPS_COVER_FORMATS', ['avif', 'webp'])
+
+# Encoder quality for the derivatives
+COVER_QUALITY = getattr(settings, 'TRIPS_COVER_QUALITY', 75)
+
+# Threads generating derivatives after uploads, off the request thread
+_image_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'TRIPS_IMAGE_WORKERS', 2),
+    thread_name_prefix='cover-images'
+)
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+def cover_image_storage():
+    """
+    Get the storage of Trip.cover_image, which holds both the cover images
+    and their derivatives.
+    """
+    return Trip._meta.get_field('cover_image').storage
+
+
+def supported_formats():
+    """
+    Get the configured derivative formats that Pillow can encode.
+
+    Returns:
+        list: Format names such as 'avif' and 'webp'
+    """
+    return [name for name in COVER_FORMATS if name in MIME_TYPES and features.check(name)]
+
+
+def has_current_variants(trip):
+    """
+    Check whether the trip's stored derivatives were made from its current cover.
+    """
+    return bool(trip.cover_image) and trip.cover_variants.get('source') == trip.cover_image.name
+
+
+def generate_cover_variants(trip, force=False):
+    """
+    Generate resized derivatives of a trip's cover image in each supported
+    format, with EXIF metadata stripped, and record them on the trip.
+
+    Derivatives are stored in a variants folder next to the original.
+    Nothing is done if the trip's derivatives are already current, unless
+    forced.
+
+    Args:
+        trip (Trip): The trip whose cover image to process
+        force (bool): Regenerate even if current derivatives exist
+
+    Returns:
+        dict: The recorded variants, or None if nothing was generated
+    """
+    if not trip.cover_image:
+        delete_cover_variants(trip.cover_variants)
+        if trip.cover_variants:
+            Trip.objects.filter(pk=trip.pk).update(cover_variants={})
+        return None
+    if has_current_variants(trip) and not force:
+        return None
+
+    source = trip.cover_image.name
+    storage = trip.cover_image.storage
+    with storage.open(source, 'rb') as original:
+        image = Image.open(original)
+        if image.width * image.height > MAX_COVER_PIXELS:
+            # Never decode oversized images, e.g. ones saved before the upload limits applied
+            raise ValueError(f"Cover image {source} is {image.width}x{image.height}, over the pixel limit")
+        # Apply the EXIF orientation, since the metadata itself is not kept
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    # Never upscale; an image narrower than every width gets one derivative at its own size
+    widths = sorted({min(width, image.width) for width in COVER_WIDTHS})
+    stem = os.path.splitext(os.path.basename(source))[0]
+    folder = os.path.join(os.path.dirname(source), VARIANTS_DIR)
+
+    variants = {'source': source, 'formats': {}}
+    for image_format in supported_formats():
+        entries = []
+        for width in widths:
+            height = max(round(image.height * width / image.width), 1)
+            name = os.path.join(folder, f"{stem}-{width}w.{image_format}")
+            if storage.exists(name):
+                if not force:
+                    # Already generated for another trip with the same cover
+                    entries.append({'name': name, 'width': width, 'height': height})
+                    continue
+                storage.delete(name)
+            resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+            buffer = BytesIO()
+            # No exif argument is passed, so no metadata is written
+            resized.save(buffer, format=image_format.upper(), quality=COVER_QUALITY)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+            entries.append({'name': name, 'width': width, 'height': height})
+        variants['formats'][image_format] = entries
+
+    # Only record the variants if the cover was not replaced meanwhile
+    updated = Trip.objects.filter(pk=trip.pk, cover_image=source).update(cover_variants=variants)
+    if not updated:
+        delete_cover_variants(variants)
+        return None
+
+    if trip.cover_variants.get('source') != source:
+        delete_cover_variants(trip.cover_variants)
+    trip.cover_variants = variants
+    return variants
+
+
+def delete_cover_variants(variants):
+    """
+    Delete the derivative files recorded in a trip's cover_variants, unless
+    a trip still uses the cover image they were made from.
+
+    Args:
+        variants (dict): The recorded variants
+    """
+    if not variants or Trip.objects.filter(cover_image=variants.get('source')).exists():
+        return
+    storage = cover_image_storage()
+    for entries in variants.get('formats', {}).values():
+        for entry in entries:
+            try:
+                storage.delete(entry['name'])
+            except Exception as e:
+                logger.warning(f"Could not delete cover variant {entry['name']}: {str(e)}")
+
+
+def schedule_cover_variants(trip):
+    """
+    Generate a trip's cover derivatives in a background thread once the
+    current transaction commits.
+
+    Args:
+        trip (Trip): The trip whose cover image changed
+    """
+    trip_id = trip.pk
+    transaction.on_commit(lambda: _image_executor.submit(_generate_in_thread, trip_id))
+
+
+def _generate_in_thread(trip_id):
+    try:
+        trip = Trip.objects.filter(pk=trip_id).first()
+        if trip:
+            generate_cover_variants(trip)
+    except Exception as e:
+        logger.error(f"Error generating cover variants for trip {trip_id}: {str(e)}")
+    finally:
+        connections.close_all()
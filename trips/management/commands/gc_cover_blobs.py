@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from trips.blobs import collect_cover_blobs, recount_cover_blobs, BLOB_GRACE_HOURS
+
+
+class Command(BaseCommand):
+    help = "Delete stored cover images that no trip references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=BLOB_GRACE_HOURS,
+            help=f"Keep unreferenced images stored within this many hours (default: {BLOB_GRACE_HOURS})."
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help="Recompute reference counts from the trips table first."
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would be deleted without deleting anything."
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount_cover_blobs()
+            self.stdout.write(f"Corrected the reference counts of {changed} images.")
+
+        result = collect_cover_blobs(grace_hours=options['grace_hours'], dry_run=options['dry_run'])
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['blobs']} unreferenced images ({filesizeformat(result['bytes'])})."
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from trips.images import generate_cover_variants, supported_formats
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/AVIF derivatives of trip cover images that lack current ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Regenerate derivatives even for trips whose derivatives are current."
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Formats: {', '.join(supported_formats()) or 'none'}")
+
+        generated = failed = 0
+        trips = Trip.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+        for trip in trips.iterator():
+            try:
+                if generate_cover_variants(trip, force=options['force']):
+                    generated += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{trip.pk}: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated cover variants for {generated} trips ({failed} failed)."
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trips", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(
+                fields=["start_date", "id"], name="trip_start_date_id_idx"
+            ),
+        ),
+    ]
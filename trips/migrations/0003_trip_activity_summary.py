@@ -0,0 +1,61 @@
+# Generated by Django 4.2 on 2026-10-18 19:53
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_summaries(apps, schema_editor):
+    """
+    Fill in the activity summary of existing trips.
+    """
+    Trip = apps.get_model("trips", "Trip")
+    Activity = apps.get_model("itineraries", "Activity")
+
+    now = timezone.now()
+    for trip in Trip.objects.iterator():
+        activities = Activity.objects.filter(trip_id=trip.pk)
+        type_counts = {}
+        for activity_type in activities.values_list("activity_type", flat=True):
+            activity_type = activity_type or "other"
+            type_counts[activity_type] = type_counts.get(activity_type, 0) + 1
+        upcoming = (
+            activities.filter(date_time__gte=now).order_by("date_time", "id").first()
+        )
+        Trip.objects.filter(pk=trip.pk).update(
+            activity_count=sum(type_counts.values()),
+            activity_type_counts=type_counts,
+            next_activity_name=upcoming.name if upcoming else "",
+            next_activity_at=upcoming.date_time if upcoming else None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trips", "0002_trip_start_date_id_idx"),
+        ("itineraries", "0002_activity_trip_time_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="activity_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="activity_type_counts",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="next_activity_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="next_activity_name",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trips", "0003_trip_activity_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="cover_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
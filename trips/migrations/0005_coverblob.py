@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-18 19:58
+
+from django.db import migrations, models
+import trips.storage
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trips", "0004_trip_cover_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CoverBlob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("digest", models.CharField(max_length=64, unique=True)),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Cover Blob",
+                "verbose_name_plural": "Cover Blobs",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AlterField(
+            model_name="trip",
+            name="cover_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=trips.storage.get_cover_storage,
+                upload_to="trip_covers/",
+            ),
+        ),
+    ]
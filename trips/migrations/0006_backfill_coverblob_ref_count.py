@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 21:40
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    """
+    Set every cover blob's reference count from the trips using it.
+    """
+    Trip = apps.get_model("trips", "Trip")
+    CoverBlob = apps.get_model("trips", "CoverBlob")
+
+    counts = dict(
+        Trip.objects.exclude(cover_image="")
+        .exclude(cover_image__isnull=True)
+        .values_list("cover_image")
+        .annotate(references=Count("pk"))
+        .order_by()
+    )
+    for blob in CoverBlob.objects.iterator():
+        references = counts.get(blob.name, 0)
+        if blob.ref_count != references:
+            CoverBlob.objects.filter(pk=blob.pk).update(ref_count=references)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trips", "0005_coverblob"),
+    ]
+
+    operations = [
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
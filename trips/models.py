@@ -2,6 +2,8 @@ import uuid
 
 from django.db import models
 
+from trips.storage import get_cover_storage
+
 
 class Trip(models.Model):
     id = models.UUIDField(
@@ -14,17 +16,54 @@ class Trip(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     description = models.TextField(blank=True, null=True)
-    cover_image = models.ImageField(upload_to='trip_covers/', blank=True, null=True)
+    cover_image = models.ImageField(upload_to='trip_covers/', storage=get_cover_storage, blank=True, null=True)
+    # Resized derivatives of the cover image, maintained by trips.images
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Summary of the trip's activities, maintained by itineraries.signals
+    activity_count = models.PositiveIntegerField(default=0, editable=False)
+    activity_type_counts = models.JSONField(default=dict, blank=True, editable=False)
+    next_activity_name = models.CharField(max_length=255, blank=True, editable=False)
+    next_activity_at = models.DateTimeField(blank=True, null=True, editable=False)
+
     class Meta:
         ordering = ['-start_date']
         verbose_name = "Trip"
         verbose_name_plural = "Trips"
+        indexes = [
+            # Keyset pagination of the trip list on (start_date, id)
+            models.Index(fields=['start_date', 'id'], name='trip_start_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.destination}"
 
     def duration(self):
         return (self.end_date - self.start_date).days + 1
+
+
+class CoverBlob(models.Model):
+    """
+    A cover image file stored once per distinct content by
+    trips.storage.ContentAddressedStorage, with the number of trips using it.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Cover Blob"
+        verbose_name_plural = "Cover Blobs"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
@@ -0,0 +1,216 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    """
+    A page of results from KeysetPaginator.
+
+    Behaves like the parts of django.core.paginator.Page that templates use,
+    with cursors for the neighbouring pages instead of page numbers.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} objects>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row of the previous page
+    instead of using OFFSET, so every page costs the same to fetch.
+
+    The ordering must end in a unique field (usually the primary key) so
+    that every row has a distinct position. Pages are addressed by opaque
+    cursors that encode the boundary row's ordering values, and there is no
+    total count; estimated_count() gives a cheap approximation instead.
+
+    Usage:
+        paginator = KeysetPaginator(Trip.objects.all(), 10, ordering=('-start_date', '-id'))
+        page = paginator.page(request.GET.get('cursor'))
+    """
+
+    NEXT = 'n'
+    PREVIOUS = 'p'
+
+    def __init__(self, queryset, per_page, ordering=('-pk',)):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def page(self, cursor=None):
+        """
+        Get the page a cursor points at.
+
+        Args:
+            cursor (str): A cursor from a previous page, or None for the first page
+
+        Returns:
+            KeysetPage: The page of results
+
+        Raises:
+            InvalidCursor: If the cursor cannot be decoded
+        """
+        if not cursor:
+            rows = list(self._ordered(reverse=False)[:self.per_page + 1])
+            return self._forward_page(rows, has_previous=False)
+
+        direction, values = self.decode_cursor(cursor)
+        if direction == self.NEXT:
+            rows = list(self._ordered(reverse=False).filter(self._seek(values, reverse=False))[:self.per_page + 1])
+            return self._forward_page(rows, has_previous=True)
+
+        rows = list(self._ordered(reverse=True).filter(self._seek(values, reverse=True))[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(
+            rows, self,
+            next_cursor=self.encode_cursor(self.NEXT, rows[-1]) if rows else None,
+            previous_cursor=self.encode_cursor(self.PREVIOUS, rows[0]) if rows and has_previous else None,
+        )
+
+    def estimated_count(self):
+        """
+        Get the approximate number of rows.
+
+        On PostgreSQL, an unfiltered queryset is estimated from the planner
+        statistics without scanning the table; otherwise this is a COUNT.
+
+        Returns:
+            int: The estimated number of rows
+        """
+        model = self.queryset.model
+        connection = connections[self.queryset.db]
+        if connection.vendor == 'postgresql' and not self.queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0 on older servers) until the table has been analyzed
+            if row and row[0] > 0:
+                return int(row[0])
+        return self.queryset.count()
+
+    def encode_cursor(self, direction, obj):
+        """
+        Build an opaque cursor pointing past obj in the given direction.
+        """
+        values = [self._field(name).value_to_string(obj) for name, _ in self.ordering]
+        data = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Decode a cursor into its direction and ordering values.
+
+        Raises:
+            InvalidCursor: If the cursor is malformed
+        """
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data)
+            if direction not in (self.NEXT, self.PREVIOUS) or len(values) != len(self.ordering):
+                raise ValueError(cursor)
+            return direction, [
+                self._field(name).to_python(value) for (name, _), value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor("Invalid cursor") from e
+
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def _ordered(self, reverse):
+        return self.queryset.order_by(*[
+            ('-' if descending != reverse else '') + name for name, descending in self.ordering
+        ])
+
+    def _seek(self, values, reverse):
+        """
+        Build the filter for rows strictly after the given ordering values.
+        """
+        condition = Q()
+        for index in reversed(range(len(self.ordering))):
+            name, descending = self.ordering[index]
+            lookup = 'lt' if descending != reverse else 'gt'
+            strictly_after = Q(**{f'{name}__{lookup}': values[index]})
+            if index == len(self.ordering) - 1:
+                condition = strictly_after
+            else:
+                condition = strictly_after | (Q(**{name: values[index]}) & condition)
+
+        # Repeat the bound on the leading column so an index range scan can be used
+        name, descending = self.ordering[0]
+        lookup = 'lte' if descending != reverse else 'gte'
+        return Q(**{f'{name}__{lookup}': values[0]}) & condition
+
+    def _forward_page(self, rows, has_previous):
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        return KeysetPage(
+            rows, self,
+            next_cursor=self.encode_cursor(self.NEXT, rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(self.PREVIOUS, rows[0]) if rows and has_previous else None,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin for ListView subclasses to paginate with KeysetPaginator, using
+    the view's ordering and the ``cursor`` query parameter.
+
+    The ordering must end in a unique field.
+    """
+    paginator_class = KeysetPaginator
+    cursor_kwarg = 'cursor'
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(queryset, per_page, ordering=self.get_ordering())
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Get the page addressed by the cursor query parameter.
+        """
+        paginator = self.get_paginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,29 @@
+from rest_framework import serializers
+
+from api.serializers import SparseFieldsetsMixin
+from itineraries.serializers import ActivitySerializer
+from trips.models import Trip
+
+
+class TripSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    duration = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Trip
+        fields = [
+            'id', 'name', 'destination', 'start_date', 'end_date', 'duration',
+            'description', 'cover_image', 'activity_count', 'activity_type_counts',
+            'next_activity_name', 'next_activity_at', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class TripDetailSerializer(TripSerializer):
+    """
+    A trip with its activities, which the queryset must prefetch.
+    """
+    activities = ActivitySerializer(many=True, read_only=True)
+
+    class Meta(TripSerializer.Meta):
+        fields = TripSerializer.Meta.fields + ['activities']
+        read_only_fields = fields
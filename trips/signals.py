@@ -0,0 +1,65 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from trips.images import delete_cover_variants, has_current_variants, schedule_cover_variants
+from trips.models import CoverBlob, Trip
+
+
+def _cover_name(instance):
+    # Read the stored value directly, so a deferred cover_image is not loaded
+    value = instance.__dict__.get('cover_image')
+    return getattr(value, 'name', value) or ''
+
+
+def _adjust_ref_count(name, delta):
+    if name:
+        CoverBlob.objects.filter(name=name).update(ref_count=F('ref_count') + delta)
+
+
+@receiver(post_init, sender=Trip)
+def remember_cover(sender, instance, **kwargs):
+    """
+    Remember the cover image a trip was loaded with, to detect changes.
+    """
+    instance._saved_cover = _cover_name(instance)
+
+
+@receiver(post_save, sender=Trip)
+def count_cover_references(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Move a blob reference from the trip's previous cover image to its new one.
+
+    A new trip held no reference before, even if it was constructed with its
+    cover image already set.
+    """
+    if raw:
+        return
+    cover = _cover_name(instance)
+    previous = '' if created else instance._saved_cover
+    if cover != previous:
+        _adjust_ref_count(cover, 1)
+        _adjust_ref_count(previous, -1)
+    instance._saved_cover = cover
+
+
+@receiver(post_save, sender=Trip)
+def update_cover_variants(sender, instance, raw=False, **kwargs):
+    """
+    Regenerate a trip's cover image derivatives in the background when its
+    cover image was added, replaced or removed.
+    """
+    if raw or has_current_variants(instance):
+        return
+    if instance.cover_image or instance.cover_variants:
+        schedule_cover_variants(instance)
+
+
+@receiver(post_delete, sender=Trip)
+def release_cover(sender, instance, **kwargs):
+    """
+    Drop a deleted trip's reference to its cover image, and its cover image
+    derivatives unless another trip shares them.
+    """
+    _adjust_ref_count(instance._saved_cover, -1)
+    delete_cover_variants(instance.cover_variants)
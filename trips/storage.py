@@ -0,0 +1,86 @@
+import hashlib
+import os
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+
+# Folder, next to the originals, holding the cover image derivatives. They
+# are named after the original, so trips sharing a cover image share them.
+VARIANTS_DIR = 'variants'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names every file after the SHA-256 digest of its
+    content, so identical uploads are stored once.
+
+    A file saved as ``trip_covers/beach.jpg`` is stored as
+    ``trip_covers/3f/3f9a...c1.jpg``. The digest is computed while the
+    upload is streamed to a temporary file, which is then moved into place,
+    or discarded if a file with the same digest exists. Each stored file is
+    recorded as a trips.CoverBlob, whose reference count is maintained by
+    trips.signals; the gc_cover_blobs command deletes unreferenced blobs.
+
+    Since a name always refers to the same content, the files can be served
+    with far-future cache headers.
+
+    Derivatives, in VARIANTS_DIR folders, are stored under the name given,
+    as they are already named after their original.
+    """
+
+    def is_variant(self, name):
+        return VARIANTS_DIR in os.path.dirname(name).replace('\\', '/').split('/')
+
+    def get_available_name(self, name, max_length=None):
+        if self.is_variant(name):
+            return super().get_available_name(name, max_length)
+        # The stored name is chosen by _save from the content
+        return name
+
+    def _save(self, name, content):
+        if self.is_variant(name):
+            return super()._save(name, content)
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        os.makedirs(self.path(directory or '.'), exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.path(directory or '.'), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+            hexdigest = digest.hexdigest()
+
+            CoverBlob = apps.get_model('trips', 'CoverBlob')
+            blob = CoverBlob.objects.filter(digest=hexdigest).first()
+            if blob and self.exists(blob.name):
+                os.remove(temp_path)
+                return blob.name
+
+            stored_name = os.path.join(directory, hexdigest[:2], hexdigest + extension).replace('\\', '/')
+            stored_path = self.path(stored_name)
+            if os.path.exists(stored_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode or 0o644)
+                os.replace(temp_path, stored_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        CoverBlob.objects.update_or_create(digest=hexdigest, defaults={'name': stored_name, 'size': size})
+        return stored_name
+
+
+cover_storage = ContentAddressedStorage()
+
+
+def get_cover_storage():
+    return cover_storage
@@ -0,0 +1,55 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from trips.images import MIME_TYPES, has_current_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_picture(trip, sizes='100vw', **attrs):
+    """
+    Template tag to render a trip's cover image as a <picture> element with
+    a srcset of resized derivatives for each modern format, falling back to
+    the original upload.
+    
+    Usage:
+    {% load trip_tags %}
+    {% cover_picture trip sizes="(min-width: 992px) 33vw, 100vw" class="card-img-top" %}
+    
+    Args:
+        trip (Trip): The trip whose cover image to render
+        sizes (str): The sizes attribute for the sources
+        **attrs: Extra attributes for the <img> element
+        
+    Returns:
+        str: The HTML, or an empty string if the trip has no cover image
+    """
+    if not trip.cover_image:
+        return ''
+    
+    attrs.setdefault('alt', trip.name)
+    attrs.setdefault('loading', 'lazy')
+    image = format_html(
+        '<img src="{}"{}>',
+        trip.cover_image.url,
+        format_html_join('', ' {}="{}"', attrs.items())
+    )
+    if not has_current_variants(trip):
+        return image
+    
+    storage = trip.cover_image.storage
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (
+                MIME_TYPES[image_format],
+                ', '.join(f"{storage.url(entry['name'])} {entry['width']}w" for entry in entries),
+                sizes,
+            )
+            for image_format, entries in trip.cover_variants.get('formats', {}).items()
+            if entries and image_format in MIME_TYPES
+        )
+    )
+    return format_html('<picture>{}{}</picture>', sources, image)
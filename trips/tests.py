@@ -1,3 +1,536 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.template import Context, Template
+from django.http import Http404
+from django.test import Client, TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from itineraries.models import Activity
+from PIL import Image
+
+from trips.images import generate_cover_variants, supported_formats
+from trips.models import CoverBlob, Trip
+from trips.storage import ContentAddressedStorage
+from trips.uploads import INVALID_IMAGE
+from trips.views import AsyncDashboardView, AsyncTripDetailView, DashboardView, TripDetailView
+from weather.models import WeatherData
+from weather.services import clear_weather_cache, is_weather_pending
+from weather.tests import FakeWeatherServer
+
+
+class AsyncViewTest(TestCase):
+    """Test cases for the async dashboard and trip detail views."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.factory = RequestFactory()
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="City Break",
+            destination="Amsterdam",
+            start_date=today + timedelta(days=10),
+            end_date=today + timedelta(days=14)
+        )
+        Trip.objects.create(
+            name="Coast",
+            destination="Porto",
+            start_date=today + timedelta(days=20),
+            end_date=today + timedelta(days=25)
+        )
+    
+    async def test_dashboard_fetches_destinations_concurrently(self):
+        """Test that weather for every destination is fetched in parallel."""
+        with FakeWeatherServer(delay=0.3) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                started = time.monotonic()
+                response = await AsyncDashboardView.as_view()(self.factory.get('/'))
+                elapsed = time.monotonic() - started
+        
+        destinations = [entry['destination'] for entry in response.context_data['destinations_weather']]
+        self.assertEqual(sorted(destinations), ['Amsterdam', 'Porto'])
+        self.assertEqual(len(response.context_data['upcoming_trips']), 2)
+        self.assertLess(elapsed, 0.55)
+        
+        await sync_to_async(response.render)()
+        self.assertContains(response, 'Amsterdam')
+    
+    async def test_trip_detail_includes_weather(self):
+        """Test that the async detail view adds weather and forecast to the context."""
+        with FakeWeatherServer(temperature=18.0) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                response = await AsyncTripDetailView.as_view()(
+                    self.factory.get('/'), pk=self.trip.pk
+                )
+        
+        self.assertEqual(response.context_data['trip'], self.trip)
+        self.assertEqual(response.context_data['weather'].temperature, 18.0)
+        self.assertEqual(len(response.context_data['forecast']), 1)
+    
+    async def test_trip_detail_missing_trip(self):
+        """Test that an unknown trip id raises 404."""
+        with self.assertRaises(Http404):
+            await AsyncTripDetailView.as_view()(
+                self.factory.get('/'), pk='00000000-0000-0000-0000-000000000000'
+            )
+
+
+class RenderBudgetTest(TestCase):
+    """Test cases for rendering pages within the weather time budget."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.factory = RequestFactory()
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Baltic",
+            destination="Riga",
+            start_date=today + timedelta(days=3),
+            end_date=today + timedelta(days=6)
+        )
+    
+    def _slow_fetch(self, location):
+        time.sleep(0.4)
+        return WeatherData(location=location, temperature=1.0, conditions="Clear", forecast=[])
+    
+    def _wait_for_fetches(self):
+        for _ in range(100):
+            if not is_weather_pending("Riga"):
+                return
+            time.sleep(0.02)
+    
+    @patch('weather.services.RENDER_BUDGET_MS', 100)
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_trip_detail_shows_loading_placeholder(self, mock_fetch, mock_recent):
+        """Test that a slow fetch does not hold up the detail page."""
+        mock_fetch.side_effect = self._slow_fetch
+        
+        started = time.monotonic()
+        response = TripDetailView.as_view()(self.factory.get('/'), pk=self.trip.pk)
+        response.render()
+        
+        self.assertLess(time.monotonic() - started, 0.35)
+        self.assertTrue(response.context_data['weather_pending'])
+        self.assertContains(response, 'is loading')
+        self.assertContains(response, 'data-weather-pending')
+        self._wait_for_fetches()
+    
+    @patch('weather.services.RENDER_BUDGET_MS', 100)
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_dashboard_shows_loading_placeholder(self, mock_fetch, mock_recent):
+        """Test that the dashboard renders a placeholder for weather still loading."""
+        mock_fetch.side_effect = self._slow_fetch
+        
+        response = DashboardView.as_view()(self.factory.get('/'))
+        response.render()
+        
+        entries = response.context_data['destinations_weather']
+        self.assertEqual([(entry['destination'], entry.get('pending')) for entry in entries], [('Riga', True)])
+        self.assertContains(response, 'Weather is loading')
+        self._wait_for_fetches()
+
+
+@patch('trips.views.get_weather_for_location', return_value=None)
+class TripItineraryCacheTest(TestCase):
+    """Test cases for the cached itinerary on the trip detail page."""
+    
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Art Tour",
+            destination="Florence",
+            start_date=today + timedelta(days=5),
+            end_date=today + timedelta(days=8)
+        )
+        self.activity = Activity.objects.create(
+            trip=self.trip,
+            name="Uffizi Gallery",
+            date_time=timezone.now() + timedelta(days=5),
+            location="Piazzale degli Uffizi",
+            activity_type='sightseeing'
+        )
+    
+    def render_detail(self):
+        response = TripDetailView.as_view()(self.factory.get('/'), pk=self.trip.pk)
+        return response.render()
+    
+    def test_cached_itinerary_skips_activity_query(self, mock_weather):
+        """Test that a repeat render only loads the trip."""
+        with self.assertNumQueries(2):
+            response = self.render_detail()
+        self.assertContains(response, 'Uffizi Gallery')
+        self.assertContains(response, 'bi-binoculars')
+        
+        with self.assertNumQueries(1):
+            response = self.render_detail()
+        self.assertContains(response, 'Uffizi Gallery')
+    
+    def test_activity_changes_invalidate_itinerary(self, mock_weather):
+        """Test that saving or deleting an activity shows up on the next render."""
+        self.render_detail()
+        
+        Activity.objects.create(
+            trip=self.trip,
+            name="Ponte Vecchio",
+            date_time=timezone.now() + timedelta(days=6),
+            location="Ponte Vecchio"
+        )
+        self.assertContains(self.render_detail(), 'Ponte Vecchio')
+        
+        self.activity.delete()
+        self.assertNotContains(self.render_detail(), 'Uffizi Gallery')
+
+
+class TripListPaginationTest(TestCase):
+    """Test cases for keyset pagination of the trip list."""
+    
+    def setUp(self):
+        today = timezone.now().date()
+        # Several trips share a start date, so the id must break ties
+        for index in range(25):
+            Trip.objects.create(
+                name=f"Trip {index}",
+                destination="Oslo",
+                start_date=today + timedelta(days=index // 3),
+                end_date=today + timedelta(days=index // 3 + 2)
+            )
+        self.expected = list(Trip.objects.order_by('-start_date', '-id').values_list('id', flat=True))
+    
+    def test_pages_cover_every_trip_once(self):
+        """Test that following next cursors visits all trips in order."""
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('trip-list'), {'cursor': cursor} if cursor else {})
+            page = response.context['page_obj']
+            seen += [trip.id for trip in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        
+        self.assertEqual(seen, self.expected)
+    
+    def test_previous_cursor_returns_previous_page(self):
+        """Test that going back from the second page gives the first page again."""
+        first = self.client.get(reverse('trip-list')).context['page_obj']
+        second = self.client.get(reverse('trip-list'), {'cursor': first.next_cursor}).context['page_obj']
+        back = self.client.get(reverse('trip-list'), {'cursor': second.previous_cursor}).context['page_obj']
+        
+        self.assertEqual([trip.id for trip in second], self.expected[10:20])
+        self.assertEqual([trip.id for trip in back], self.expected[:10])
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+    
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor returns 404."""
+        response = self.client.get(reverse('trip-list'), {'cursor': 'not-a-cursor'})
+        
+        self.assertEqual(response.status_code, 404)
+    
+    @patch('trips.views.LIST_ESTIMATED_COUNT', True)
+    def test_estimated_count(self):
+        """Test that the estimated total is shown when enabled."""
+        response = self.client.get(reverse('trip-list'))
+        
+        self.assertEqual(response.context['estimated_count'], 25)
+        self.assertContains(response, 'About 25 trips')
+
+
+class CoverVariantsTest(TestCase):
+    """Test cases for the cover image derivative pipeline."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        today = timezone.now().date()
+        self.trip = Trip.objects.create(
+            name="Fjords",
+            destination="Bergen",
+            start_date=today,
+            end_date=today + timedelta(days=4),
+            cover_image=ContentFile(self.make_jpeg(2000, 1000), name="fjords.jpg")
+        )
+    
+    def make_jpeg(self, width, height):
+        exif = Image.Exif()
+        exif[0x010F] = "Test Camera"  # Make
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), (30, 90, 160)).save(buffer, format='JPEG', exif=exif)
+        return buffer.getvalue()
+    
+    def test_generates_resized_variants_without_exif(self):
+        """Test that every width and supported format is generated, without metadata."""
+        variants = generate_cover_variants(self.trip)
+        
+        self.assertEqual(variants['source'], self.trip.cover_image.name)
+        self.assertEqual(sorted(variants['formats']), sorted(supported_formats()))
+        for entries in variants['formats'].values():
+            self.assertEqual([(entry['width'], entry['height']) for entry in entries], [(320, 160), (640, 320), (1280, 640)])
+            for entry in entries:
+                with self.trip.cover_image.storage.open(entry['name']) as variant:
+                    self.assertEqual(len(Image.open(variant).getexif()), 0)
+        self.assertEqual(Trip.objects.get(pk=self.trip.pk).cover_variants, variants)
+    
+    def test_generation_is_idempotent(self):
+        """Test that current variants are not generated again."""
+        generate_cover_variants(self.trip)
+        
+        self.assertIsNone(generate_cover_variants(self.trip))
+    
+    def test_small_image_is_not_upscaled(self):
+        """Test that an image narrower than every width keeps its own size."""
+        self.trip.cover_image.save("small.jpg", ContentFile(self.make_jpeg(200, 100)))
+        
+        variants = generate_cover_variants(self.trip)
+        
+        for entries in variants['formats'].values():
+            self.assertEqual([entry['width'] for entry in entries], [200])
+    
+    def test_cover_picture_tag(self):
+        """Test that the template tag emits a srcset per format."""
+        generate_cover_variants(self.trip)
+        
+        html = Template("{% load trip_tags %}{% cover_picture trip class='card-img-top' %}").render(
+            Context({'trip': self.trip})
+        )
+        
+        self.assertIn('<picture>', html)
+        self.assertIn(' 1280w', html)
+        for image_format in supported_formats():
+            self.assertIn(f'type="image/{image_format}"', html)
+        self.assertIn(f'src="{self.trip.cover_image.url}" class="card-img-top" alt="Fjords"', html)
+    
+    @patch('trips.images._image_executor')
+    def test_new_cover_schedules_generation(self, mock_executor):
+        """Test that changing the cover queues generation after commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.cover_image.save("other.jpg", ContentFile(self.make_jpeg(800, 600)))
+        
+        mock_executor.submit.assert_called_once()
+    
+    def test_deleting_trip_removes_variants(self):
+        """Test that derivatives are deleted with their trip."""
+        variants = generate_cover_variants(self.trip)
+        names = [entry['name'] for entries in variants['formats'].values() for entry in entries]
+        
+        self.trip.delete()
+        
+        for name in names:
+            self.assertFalse(Trip._meta.get_field('cover_image').storage.exists(name))
+    
+    def test_backfill_command(self):
+        """Test that the backfill command generates missing variants once."""
+        out = StringIO()
+        
+        call_command('generate_cover_variants', stdout=out)
+        call_command('generate_cover_variants', stdout=out)
+        
+        self.assertIn("Generated cover variants for 1 trips", out.getvalue())
+        self.assertIn("Generated cover variants for 0 trips", out.getvalue())
+
+
+class CoverUploadTest(TestCase):
+    """Test cases for checking cover image uploads while they stream in."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def make_image(self, image_format='PNG', size=(100, 80)):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, format=image_format)
+        buffer.seek(0)
+        buffer.name = f"cover.{image_format.lower()}"
+        return buffer
+    
+    def post_trip(self, cover, client=None):
+        today = timezone.now().date()
+        return (client or self.client).post(reverse('trip-create'), {
+            'name': "Desert",
+            'destination': "Marrakesh",
+            'start_date': today,
+            'end_date': today + timedelta(days=5),
+            'cover_image': cover,
+        })
+    
+    def test_valid_upload(self):
+        """Test that an image within the limits is saved."""
+        response = self.post_trip(self.make_image())
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Trip.objects.get().cover_image.name.startswith('trip_covers/'))
+    
+    @patch('trips.uploads.MAX_COVER_PIXELS', 1000)
+    def test_too_many_pixels(self):
+        """Test that the pixel count is checked from the header."""
+        cover = self.make_image()
+        with patch('trips.uploads.Image.Image.load') as mock_load:
+            response = self.post_trip(cover)
+        
+        self.assertFormError(response.context['form'], 'cover_image', "Images may have at most 1,000 pixels; this one is 100x80.")
+        mock_load.assert_not_called()
+        self.assertFalse(Trip.objects.exists())
+    
+    @patch('trips.uploads.MAX_COVER_BYTES', 100)
+    def test_too_large(self):
+        """Test that uploads over the byte limit are rejected."""
+        response = self.post_trip(self.make_image())
+        
+        self.assertFormError(response.context['form'], 'cover_image', "Images may be at most 100\xa0bytes.")
+    
+    def test_not_an_image(self):
+        """Test that files without an image header are rejected."""
+        response = self.post_trip(ContentFile(b"not an image", name="cover.png"))
+        
+        self.assertFormError(response.context['form'], 'cover_image', INVALID_IMAGE)
+    
+    def test_unsupported_format(self):
+        """Test that formats outside the allowed list are rejected."""
+        response = self.post_trip(self.make_image('BMP'))
+        
+        self.assertFormError(response.context['form'], 'cover_image', "BMP images are not supported.")
+    
+    def test_csrf_still_enforced(self):
+        """Test that installing the upload handler does not skip CSRF checks."""
+        response = self.post_trip(self.make_image(), client=Client(enforce_csrf_checks=True))
+        
+        self.assertEqual(response.status_code, 403)
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Test cases for deduplicated, reference-counted cover image storage."""
+    
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.photo = b"stock photo bytes"
+    
+    def make_trip(self, content, name="beach.JPG"):
+        today = timezone.now().date()
+        return Trip.objects.create(
+            name="Beach",
+            destination="Nice",
+            start_date=today,
+            end_date=today + timedelta(days=2),
+            cover_image=ContentFile(content, name=name)
+        )
+    
+    def test_identical_uploads_share_one_blob(self):
+        """Test that the same content is stored once under its digest."""
+        first = self.make_trip(self.photo)
+        second = self.make_trip(self.photo, name="copy.jpg")
+        
+        digest = hashlib.sha256(self.photo).hexdigest()
+        self.assertEqual(first.cover_image.name, f"trip_covers/{digest[:2]}/{digest}.jpg")
+        self.assertEqual(second.cover_image.name, first.cover_image.name)
+        blob = CoverBlob.objects.get()
+        self.assertEqual((blob.digest, blob.size, blob.ref_count), (digest, len(self.photo), 2))
+    
+    def test_references_follow_trips(self):
+        """Test that replacing a cover and deleting trips update the counts."""
+        first = self.make_trip(self.photo)
+        second = self.make_trip(self.photo)
+        
+        second.cover_image = ContentFile(b"other photo", name="other.jpg")
+        second.save()
+        first.delete()
+        
+        counts = dict(CoverBlob.objects.values_list('size', 'ref_count'))
+        self.assertEqual(counts, {len(self.photo): 0, len(b"other photo"): 1})
+    
+    def test_trip_created_with_stored_name_counts(self):
+        """Test that a trip created with an existing cover's name adds a reference."""
+        name = self.make_trip(self.photo).cover_image.name
+        today = timezone.now().date()
+        
+        Trip.objects.create(
+            name="Copy",
+            destination="Nice",
+            start_date=today,
+            end_date=today + timedelta(days=2),
+            cover_image=name
+        )
+        
+        self.assertEqual(CoverBlob.objects.get().ref_count, 2)
+    
+    def test_gc_deletes_unreferenced_blobs(self):
+        """Test that only unreferenced blobs past the grace period are deleted."""
+        trip = self.make_trip(self.photo)
+        name = trip.cover_image.name
+        storage = trip.cover_image.storage
+        trip.delete()
+        out = StringIO()
+        
+        call_command('gc_cover_blobs', stdout=out)
+        self.assertTrue(storage.exists(name))
+        
+        call_command('gc_cover_blobs', '--grace-hours=0', stdout=out)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(CoverBlob.objects.exists())
+        self.assertIn("Deleted 1 unreferenced images", out.getvalue())
+    
+    def test_variants_use_cover_storage(self):
+        """Test that derivatives are kept in the cover image's storage, and collected from it."""
+        storage = ContentAddressedStorage(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, storage.location, ignore_errors=True)
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200)).save(buffer, format='JPEG')
+        
+        with patch.object(Trip._meta.get_field('cover_image'), 'storage', storage):
+            trip = self.make_trip(buffer.getvalue(), name="wide.jpg")
+            variants = generate_cover_variants(trip)
+            names = [entry['name'] for entries in variants['formats'].values() for entry in entries]
+            stem = os.path.splitext(os.path.basename(trip.cover_image.name))[0]
+            
+            self.assertTrue(names)
+            for name in names:
+                self.assertTrue(os.path.basename(name).startswith(f"{stem}-"))
+                self.assertTrue(storage.exists(name))
+                self.assertFalse(default_storage.exists(name))
+            self.assertEqual(CoverBlob.objects.count(), 1)
+            
+            Trip.objects.filter(pk=trip.pk).update(cover_variants={})
+            trip.delete()
+            call_command('gc_cover_blobs', '--grace-hours=0', stdout=StringIO())
+            
+            for name in names:
+                self.assertFalse(storage.exists(name))
+    
+    def test_recount_fixes_drift(self):
+        """Test that recounting protects blobs whose count drifted to zero."""
+        trip = self.make_trip(self.photo)
+        CoverBlob.objects.update(ref_count=0)
+        
+        call_command('gc_cover_blobs', '--recount', '--grace-hours=0', stdout=StringIO())
+        
+        self.assertEqual(CoverBlob.objects.get().ref_count, 1)
+        self.assertTrue(trip.cover_image.storage.exists(trip.cover_image.name))
@@ -0,0 +1,180 @@
+import warnings
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+# Largest accepted cover image upload, in bytes
+MAX_COVER_BYTES = getattr(settings, 'TRIPS_COVER_MAX_BYTES', 10 * 2**20)
+
+# Largest accepted cover image, in pixels (width x height); checked from the
+# image header before anything is decoded
+MAX_COVER_PIXELS = getattr(settings, 'TRIPS_COVER_MAX_PIXELS', 40_000_000)
+
+# Accepted cover image formats, as named by Pillow (MPO is a multi-picture JPEG)
+COVER_IMAGE_FORMATS = getattr(settings, 'TRIPS_COVER_IMAGE_FORMATS', ['JPEG', 'MPO', 'PNG', 'WEBP', 'GIF'])
+
+# Bytes buffered while looking for the image dimensions; JPEG metadata can
+# push them well past the first chunk
+HEADER_LIMIT = 256 * 2**10
+
+INVALID_IMAGE = "Upload a valid image. The file you uploaded was either not an image or a corrupted image."
+
+
+def check_image_header(data):
+    """
+    Read an image's format and dimensions from its header and check them
+    against the cover image limits, without decoding any pixel data.
+
+    Args:
+        data: The start of the file, as bytes or a file object
+
+    Returns:
+        tuple: (format, width, height), or None if the header could not be read
+
+    Raises:
+        ValidationError: If the format or the pixel count is not allowed
+    """
+    fp = BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+    try:
+        with warnings.catch_warnings():
+            # Pillow's own bomb limit is checked here too; ours is reported instead
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(fp) as image:
+                image_format, width, height = image.format, image.width, image.height
+    except Image.DecompressionBombError:
+        raise ValidationError(
+            f"Images may have at most {MAX_COVER_PIXELS:,} pixels.", code='too_many_pixels'
+        )
+    except Exception:
+        return None
+
+    if image_format not in COVER_IMAGE_FORMATS:
+        raise ValidationError(f"{image_format} images are not supported.", code='invalid_format')
+    if width * height > MAX_COVER_PIXELS:
+        raise ValidationError(
+            f"Images may have at most {MAX_COVER_PIXELS:,} pixels; this one is {width}x{height}.",
+            code='too_many_pixels'
+        )
+    return image_format, width, height
+
+
+class CoverImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler streaming every file to a temporary file in chunks, and
+    checking cover image uploads while they arrive.
+
+    Cover images over MAX_COVER_BYTES, in an unsupported format or with too
+    many pixels are rejected as soon as that is known, from the byte count
+    or the image header, and the rest of the upload is discarded. The
+    reasons are kept in ``errors`` by field name for the form to report.
+    """
+
+    def __init__(self, request=None, field_names=('cover_image',)):
+        super().__init__(request)
+        self.field_names = field_names
+        self.errors = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.check_image = field_name in self.field_names
+        self.received = 0
+        self.header = bytearray()
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.check_image:
+            return super().receive_data_chunk(raw_data, start)
+
+        self.received += len(raw_data)
+        if self.received > MAX_COVER_BYTES:
+            self.reject(ValidationError(
+                f"Images may be at most {filesizeformat(MAX_COVER_BYTES)}.", code='too_large'
+            ))
+
+        if not self.header_checked:
+            self.header += raw_data
+            try:
+                self.header_checked = check_image_header(self.header) is not None
+            except ValidationError as e:
+                self.reject(e)
+            if self.header_checked:
+                self.header = bytearray()
+            elif len(self.header) > HEADER_LIMIT:
+                self.reject(ValidationError(INVALID_IMAGE, code='invalid_image'))
+
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.check_image and not self.header_checked:
+            # The whole file fit within the header buffer
+            try:
+                valid = check_image_header(self.header) is not None
+                error = None if valid else ValidationError(INVALID_IMAGE, code='invalid_image')
+            except ValidationError as e:
+                error = e
+            if error:
+                self.errors[self.field_name] = error
+                self.file.close()
+                return None
+        return super().file_complete(file_size)
+
+    def reject(self, error):
+        """
+        Record why the current file was rejected and skip the rest of it.
+        """
+        self.errors[self.field_name] = error
+        self.file.close()
+        raise SkipFile()
+
+
+class CoverImageField(forms.ImageField):
+    """
+    ImageField that checks the size, format and pixel count of an upload
+    from its header before Django decodes it, for uploads that did not go
+    through CoverImageUploadHandler.
+    """
+
+    def to_python(self, data):
+        if data not in self.empty_values:
+            if data.size > MAX_COVER_BYTES:
+                raise ValidationError(
+                    f"Images may be at most {filesizeformat(MAX_COVER_BYTES)}.", code='too_large'
+                )
+            position = data.tell()
+            if check_image_header(data) is None:
+                raise ValidationError(INVALID_IMAGE, code='invalid_image')
+            data.seek(position)
+        return super().to_python(data)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class CoverUploadMixin:
+    """
+    Mixin for trip form views to receive cover images through
+    CoverImageUploadHandler and report its errors on the form.
+
+    Upload handlers must be installed before the request body is read, which
+    CSRF validation would otherwise do first; the check is instead run
+    afterwards, on the same request.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.upload_handler = CoverImageUploadHandler(request)
+        request.upload_handlers = [self.upload_handler]
+        return self.protected_dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def protected_dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_errors'] = self.upload_handler.errors
+        return kwargs
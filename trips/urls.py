@@ -1,19 +1,27 @@
+from django.conf import settings
 from django.urls import path
 
 from trips.views import (
     TripListView,
     TripDetailView,
+    AsyncTripDetailView,
     TripCreateView,
     TripUpdateView,
     TripDeleteView,
-    DashboardView
+    DashboardView,
+    AsyncDashboardView
 )
 
+# Serve the weather-heavy pages with async views when running under ASGI
+ASYNC_VIEWS = getattr(settings, 'TRIPS_ASYNC_VIEWS', False)
+dashboard_view = AsyncDashboardView if ASYNC_VIEWS else DashboardView
+trip_detail_view = AsyncTripDetailView if ASYNC_VIEWS else TripDetailView
+
 urlpatterns = [
-    path('', DashboardView.as_view(), name='dashboard'),
+    path('', dashboard_view.as_view(), name='dashboard'),
     path('trips/', TripListView.as_view(), name='trip-list'),
     path('trips/create/', TripCreateView.as_view(), name='trip-create'),
-    path('trips/<uuid:pk>/', TripDetailView.as_view(), name='trip-detail'),
+    path('trips/<uuid:pk>/', trip_detail_view.as_view(), name='trip-detail'),
     path('trips/<uuid:pk>/edit/', TripUpdateView.as_view(), name='trip-update'),
     path('trips/<uuid:pk>/delete/', TripDeleteView.as_view(), name='trip-delete'),
 ]
\ No newline at end of file
@@ -1,3 +1,8 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -11,19 +16,54 @@ from django.views.generic import (
 from django.contrib import messages
 from django.utils import timezone
 
+from itineraries.summary import fill_current_next_activities
 from trips.models import Trip
+from trips.pagination import KeysetPaginationMixin
 from trips.forms import TripForm
-from weather.services import get_weather_for_location, get_forecast_from_weather_data
+from trips.uploads import CoverUploadMixin
+from weather.services import (
+    get_weather_for_location,
+    get_weather_for_locations,
+    aget_weather_for_location,
+    aget_weather_for_locations,
+    get_forecast_from_weather_data,
+    is_weather_pending,
+    render_deadline
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a rendered trip itinerary stays cached; the cache key changes
+# whenever the trip or one of its activities is saved or deleted
+ITINERARY_CACHE_TIMEOUT = getattr(settings, 'TRIPS_ITINERARY_CACHE_TIMEOUT', 24 * 3600)
+
+# Show an estimated total on the paginated trip list (free on PostgreSQL,
+# a COUNT query on other databases)
+LIST_ESTIMATED_COUNT = getattr(settings, 'TRIPS_LIST_ESTIMATED_COUNT', False)
 
 
-class TripListView(ListView):
+class TripListView(KeysetPaginationMixin, ListView):
     """
     Display a list of all trips.
+    
+    Pages are fetched by keyset (cursor) pagination on (start_date, id), so
+    deep pages cost the same as the first and no total count is needed.
     """
     model = Trip
     template_name = 'trips/trip_list.html'
     context_object_name = 'trips'
     paginate_by = 10
+    ordering = ['-start_date', '-id']
+    
+    def get_context_data(self, **kwargs):
+        """
+        Add the estimated number of trips if enabled.
+        """
+        context = super().get_context_data(**kwargs)
+        fill_current_next_activities(context['trips'])
+        if LIST_ESTIMATED_COUNT and context['is_paginated']:
+            context['estimated_count'] = context['paginator'].estimated_count()
+        return context
 
 
 class TripDetailView(DetailView):
@@ -39,33 +79,85 @@ class TripDetailView(DetailView):
         Add activities and weather data to context.
         """
         context = super().get_context_data(**kwargs)
-        trip = self.object
+        context.update(self.get_weather_context())
         
-        # Get weather data for the trip destination
+        # Evaluated by the template only when the cached itinerary is missing,
+        # in a single ordered query
+        context['activities'] = self.object.activities.all()
+        context['itinerary_cache_timeout'] = ITINERARY_CACHE_TIMEOUT
+        return context
+    
+    def get_weather_context(self):
+        """
+        Get weather data for the trip destination as template context.
+        """
+        trip = self.object
         try:
-            weather_data = get_weather_for_location(trip.destination)
-            context['weather'] = weather_data
-            
-            if weather_data:
-                # Extract forecast data from the weather object
-                context['forecast'] = get_forecast_from_weather_data(weather_data)
+            # Spend at most the render budget on weather
+            weather_data = get_weather_for_location(trip.destination, deadline=render_deadline())
+            pending = weather_data is None and is_weather_pending(trip.destination)
         except Exception as e:
             # Log the error but don't break the page
-            import logging
-            logger = logging.getLogger(__name__)
             logger.error(f"Error getting weather for {trip.destination}: {str(e)}")
-            
-            # Set empty values for templates to safely check
-            context['weather'] = None
-            context['forecast'] = []
-            context['weather_error'] = True
-        
-        # Activities are accessible via the related_name 'activities' defined in the model
-        # Trip activities are already included in trip object via related_name
+            return self.weather_error_context()
+        return self.build_weather_context(weather_data, pending)
+    
+    def build_weather_context(self, weather_data, pending=False):
+        """
+        Build template context for a weather data object.
+        """
+        context = {'weather': weather_data}
+        if weather_data:
+            # Extract forecast data from the weather object
+            context['forecast'] = get_forecast_from_weather_data(weather_data)
+        elif pending:
+            # The fetch outlived the render budget and is still running
+            context['weather_pending'] = True
         return context
+    
+    def weather_error_context(self):
+        """
+        Set empty values for templates to safely check.
+        """
+        return {
+            'weather': None,
+            'forecast': [],
+            'weather_error': True,
+        }
 
 
-class TripCreateView(CreateView):
+class AsyncTripDetailView(TripDetailView):
+    """
+    Async variant of TripDetailView for use under ASGI.
+    
+    Weather is fetched with the async weather service, so a slow upstream
+    call does not hold a server worker; the upstream requests themselves
+    still run on the weather service's request thread pool.
+    """
+    
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except Trip.DoesNotExist:
+            raise Http404("No trip found matching the query")
+        
+        try:
+            destination = self.object.destination
+            weather_data = await aget_weather_for_location(destination, deadline=render_deadline())
+            pending = weather_data is None and await sync_to_async(is_weather_pending)(destination)
+            self.weather_context = self.build_weather_context(weather_data, pending)
+        except Exception as e:
+            logger.error(f"Error getting weather for {self.object.destination}: {str(e)}")
+            self.weather_context = self.weather_error_context()
+        
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+    
+    def get_weather_context(self):
+        return self.weather_context
+
+
+class TripCreateView(CoverUploadMixin, CreateView):
     """
     Create a new trip.
     """
@@ -84,7 +176,7 @@ class TripCreateView(CreateView):
         return super().form_valid(form)
 
 
-class TripUpdateView(UpdateView):
+class TripUpdateView(CoverUploadMixin, UpdateView):
     """
     Update an existing trip.
     """
@@ -129,39 +221,111 @@ class DashboardView(TemplateView):
         context = super().get_context_data(**kwargs)
         today = timezone.now().date()
         
-        # Get upcoming trips (start date >= today)
-        upcoming_trips = Trip.objects.filter(start_date__gte=today).order_by('start_date')[:5]
+        upcoming_trips = list(self.get_upcoming_trips(today))
         context['upcoming_trips'] = upcoming_trips
         
-        # Get ongoing trips (start date <= today <= end date)
-        ongoing_trips = Trip.objects.filter(
-            start_date__lte=today,
-            end_date__gte=today
-        ).order_by('end_date')
+        ongoing_trips = list(self.get_ongoing_trips(today))
         context['ongoing_trips'] = ongoing_trips
         
-        # Get weather data for upcoming destinations
-        context['destinations_weather'] = []
+        # Activity summaries are shown on every card
+        fill_current_next_activities(upcoming_trips + ongoing_trips)
+        
+        # Get weather data for upcoming destinations in one batch, within the render budget
+        destinations = self.get_weather_destinations(upcoming_trips + ongoing_trips)
+        weather_by_destination = get_weather_for_locations(destinations, deadline=render_deadline())
+        pending = self.get_pending_destinations(destinations, weather_by_destination)
+        context['destinations_weather'] = self.build_destinations_weather(
+            destinations, weather_by_destination, pending
+        )
         
-        # Collect unique destinations from upcoming and ongoing trips
-        destinations = set()
-        for trip in list(upcoming_trips) + list(ongoing_trips):
+        return context
+    
+    def get_upcoming_trips(self, today):
+        """
+        Get upcoming trips (start date >= today).
+        """
+        return Trip.objects.filter(start_date__gte=today).order_by('start_date')[:5]
+    
+    def get_ongoing_trips(self, today):
+        """
+        Get ongoing trips (start date <= today <= end date).
+        """
+        return Trip.objects.filter(
+            start_date__lte=today,
+            end_date__gte=today
+        ).order_by('end_date')
+    
+    def get_weather_destinations(self, trips):
+        """
+        Collect up to three unique destinations from the given trips.
+        """
+        destinations = []
+        for trip in trips:
             if trip.destination not in destinations and len(destinations) < 3:
-                destinations.add(trip.destination)
-                
-                try:
-                    weather_data = get_weather_for_location(trip.destination)
-                    if weather_data:
-                        forecast = get_forecast_from_weather_data(weather_data)
-                        context['destinations_weather'].append({
-                            'destination': trip.destination,
-                            'weather': weather_data,
-                            'forecast': forecast
-                        })
-                except Exception as e:
-                    # Log the error but don't break the dashboard
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Error getting weather for {trip.destination}: {str(e)}")
+                destinations.append(trip.destination)
+        return destinations
+    
+    def get_pending_destinations(self, destinations, weather_by_destination):
+        """
+        Get the destinations without weather whose fetch is still running.
+        """
+        return [
+            destination for destination in destinations
+            if not weather_by_destination.get(destination) and is_weather_pending(destination)
+        ]
+    
+    def build_destinations_weather(self, destinations, weather_by_destination, pending=()):
+        """
+        Build the dashboard entries for the destinations that have weather,
+        with placeholders for those whose weather is still loading.
+        """
+        entries = []
+        for destination in destinations:
+            weather_data = weather_by_destination.get(destination)
+            if weather_data:
+                entries.append(self.build_destination_weather(destination, weather_data))
+            elif destination in pending:
+                entries.append({'destination': destination, 'weather': None, 'forecast': [], 'pending': True})
+        return entries
+    
+    def build_destination_weather(self, destination, weather_data):
+        """
+        Build the dashboard entry for a destination's weather.
+        """
+        return {
+            'destination': destination,
+            'weather': weather_data,
+            'forecast': get_forecast_from_weather_data(weather_data)
+        }
+
+
+class AsyncDashboardView(DashboardView):
+    """
+    Async variant of DashboardView for use under ASGI.
+    
+    Trips are loaded with the async ORM and weather for all destinations is
+    resolved in one batch with misses fetched concurrently, so a slow
+    upstream call does not hold a server worker; the upstream requests
+    themselves still run on the weather service's request thread pool.
+    """
+    
+    async def get(self, request, *args, **kwargs):
+        today = timezone.now().date()
+        upcoming_trips = [trip async for trip in self.get_upcoming_trips(today)]
+        ongoing_trips = [trip async for trip in self.get_ongoing_trips(today)]
+        await sync_to_async(fill_current_next_activities)(upcoming_trips + ongoing_trips)
+        
+        destinations = self.get_weather_destinations(upcoming_trips + ongoing_trips)
+        weather_by_destination = await aget_weather_for_locations(destinations, deadline=render_deadline())
+        pending = await sync_to_async(self.get_pending_destinations)(destinations, weather_by_destination)
+        destinations_weather = self.build_destinations_weather(destinations, weather_by_destination, pending)
         
-        return context
\ No newline at end of file
+        # Skip DashboardView.get_context_data, which resolves everything synchronously
+        context = TemplateView.get_context_data(
+            self,
+            upcoming_trips=upcoming_trips,
+            ongoing_trips=ongoing_trips,
+            destinations_weather=destinations_weather,
+            **kwargs
+        )
+        return self.render_to_response(context)
@@ -1,12 +1,27 @@
 from django.contrib import admin
 
-from weather.models import WeatherData
+from weather.models import LocationAlias, WeatherData, WeatherHistory
 
 
 @admin.register(WeatherData)
 class WeatherDataAdmin(admin.ModelAdmin):
     list_display = ('location', 'temperature', 'conditions', 'retrieved_at')
-    list_filter = ('location', 'conditions', 'retrieved_at')
-    search_fields = ('location', 'conditions', 'forecast')
+    list_filter = ('conditions', 'retrieved_at')
+    search_fields = ('location', 'conditions')
     date_hierarchy = 'retrieved_at'
     readonly_fields = ('id', 'retrieved_at')
+
+
+@admin.register(WeatherHistory)
+class WeatherHistoryAdmin(admin.ModelAdmin):
+    list_display = ('location', 'temperature', 'conditions', 'retrieved_at')
+    list_filter = ('conditions', 'retrieved_at')
+    search_fields = ('location',)
+    date_hierarchy = 'retrieved_at'
+    readonly_fields = ('id', 'location', 'temperature', 'conditions', 'forecast', 'retrieved_at')
+
+
+@admin.register(LocationAlias)
+class LocationAliasAdmin(admin.ModelAdmin):
+    list_display = ('alias', 'canonical', 'city_id')
+    search_fields = ('alias', 'canonical')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WeatherConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "weather"
+
+    def ready(self):
+        # Register system checks
+        from weather import checks  # noqa: F401
@@ -0,0 +1,456 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class TTLCache:
+    """
+    A small, thread-safe, in-process cache with LRU eviction and per-entry TTLs.
+
+    The interface mirrors the subset of Django's cache API used by the weather
+    service (get/set/delete/clear and their async versions), so the two can
+    be swapped for each other.
+    """
+
+    def __init__(self, maxsize=256, default_timeout=300):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value stored under key, or default if missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            # Mark as most recently used
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        """
+        Store value under key for timeout seconds, evicting the least recently
+        used entry if the cache is full.
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout <= 0:
+            self.delete(key)
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    # The cache never blocks, so the async versions run inline
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value, timeout=None):
+        return self.set(key, value, timeout)
+
+    async def adelete(self, key):
+        return self.delete(key)
+
+    def stats(self):
+        """
+        Return a dictionary of cache counters for monitoring.
+        """
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class HashedKeyCache:
+    """
+    Wrapper letting a Django cache backend be used with arbitrary string keys,
+    such as location names.
+
+    Django backends warn about (or reject) keys with spaces, control or
+    non-ASCII characters, or over 250 characters, so each key is replaced by
+    a prefixed SHA-1 digest of it. Other attributes, such as stats(), are
+    those of the wrapped backend.
+    """
+
+    def __init__(self, cache, prefix):
+        self.cache = cache
+        self.prefix = prefix
+
+    def make_key(self, key):
+        return f"{self.prefix}:{hashlib.sha1(key.encode()).hexdigest()}"
+
+    def get(self, key, default=None):
+        return self.cache.get(self.make_key(key), default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self.cache.set(self.make_key(key), value, timeout)
+
+    def delete(self, key):
+        return self.cache.delete(self.make_key(key))
+
+    async def aget(self, key, default=None):
+        return await self.cache.aget(self.make_key(key), default)
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return await self.cache.aset(self.make_key(key), value, timeout)
+
+    async def adelete(self, key):
+        return await self.cache.adelete(self.make_key(key))
+
+    def clear(self):
+        return self.cache.clear()
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Django cache backend storing entries in a memory-mapped file, so that all
+    worker processes on a host share one cache without an external service.
+
+    The file is divided into fixed-size slots. A key hashes to a short run
+    of candidate slots; a new entry takes the slot already holding its key,
+    else an empty or expired one, else the least recently used one. Entries
+    that do not fit in a slot are not cached; setting one drops the value
+    previously stored under its key.
+
+    Reads take no lock: every slot carries a sequence number that writers
+    make odd while they change the slot, and readers retry if it was odd or
+    changed while they copied the slot. Writers serialize on a file lock.
+    Last-use times, which reads update, are kept in a separate array outside
+    the slots so that reads never write to a slot.
+
+    CACHES = {
+        'weather_shared': {
+            'BACKEND': 'weather.cache.SharedMemoryCache',
+            'LOCATION': '/dev/shm/travel-weather-cache',
+            'OPTIONS': {'SLOTS': 512, 'SLOT_SIZE': 4096},
+        },
+    }
+    """
+
+    MAGIC = b'WXSHM002'
+    FILE_HEADER = struct.Struct('<8sII')
+    DATA_OFFSET = 64
+
+    # seq, expires_at, key hash, key length, value length
+    SLOT_HEADER = struct.Struct('<IdQHI')
+    SEQ = struct.Struct('<I')
+    # Last-use time of each slot, in the array between the file header and the slots
+    LAST_USED = struct.Struct('<d')
+
+    # Number of slots a key may occupy, and reads attempted before giving up on a busy slot
+    PROBES = 8
+    READ_RETRIES = 5
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.slots = int(options.get('SLOTS', 512))
+        self.slot_size = int(options.get('SLOT_SIZE', 4096))
+        self.slots_offset = self.DATA_OFFSET + self.slots * self.LAST_USED.size
+        self.path = location or os.path.join(
+            '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+            'django-weather-cache'
+        )
+        self.hits = 0
+        self.misses = 0
+        self._mmap = None
+        self._fd = None
+        self._open_lock = threading.Lock()
+        # flock() does not exclude threads sharing the file descriptor
+        self._write_lock = threading.Lock()
+
+    # Django cache API
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._locked():
+            if self._find(key) is not None:
+                return False
+            return self._write(key, value, self.get_backend_timeout(timeout))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found = self._find(key)
+        if found is None:
+            self.misses += 1
+            return default
+
+        index, payload = found
+        try:
+            value = pickle.loads(payload)
+        except Exception:
+            self.misses += 1
+            return default
+
+        # Unlocked: a lost update only makes eviction slightly less accurate
+        self._touch(index, time.time())
+        self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._locked():
+            if not self._write(key, value, self.get_backend_timeout(timeout)):
+                # Too large to cache: drop the old value rather than keep serving it
+                self._invalidate(key)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._locked():
+            found = self._find(key)
+            if found is None:
+                return False
+            expires_at = self.get_backend_timeout(timeout)
+            self._update_slot(found[0], expires_at=float('inf') if expires_at is None else expires_at)
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._locked():
+            return self._invalidate(key)
+
+    def clear(self):
+        with self._locked():
+            for index in range(self.slots):
+                self._update_slot(index, expires_at=0.0, key_hash=0)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self, **kwargs):
+        # The mapping is kept open for the life of the process
+        pass
+
+    def stats(self):
+        """
+        Return a dictionary of cache counters for monitoring. Hits and misses
+        are counted per process; size covers the whole shared cache.
+        """
+        mm = self._map()
+        now = time.time()
+        size = sum(
+            1 for index in range(self.slots)
+            if self.SLOT_HEADER.unpack_from(mm, self._offset(index))[1] > now
+        )
+        return {
+            'size': size,
+            'maxsize': self.slots,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    # Slot storage
+
+    def _map(self):
+        """
+        Open, create or resize the shared file on first use and map it.
+        """
+        if self._mmap is None:
+            with self._open_lock:
+                if self._mmap is None:
+                    self._mmap = self._open()
+        return self._mmap
+
+    def _open(self):
+        size = self.slots_offset + self.slots * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, self.FILE_HEADER.size, 0)
+            expected = self.FILE_HEADER.pack(self.MAGIC, self.slots, self.slot_size)
+            if header != expected or os.fstat(fd).st_size != size:
+                # New file, or one laid out for other settings: start empty
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, expected, 0)
+            mm = mmap.mmap(fd, size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        return mm
+
+    @contextmanager
+    def _locked(self):
+        self._map()
+        with self._write_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return self.slots_offset + index * self.slot_size
+
+    def _last_used(self, index):
+        return self.LAST_USED.unpack_from(self._map(), self.DATA_OFFSET + index * self.LAST_USED.size)[0]
+
+    def _touch(self, index, now):
+        self.LAST_USED.pack_into(self._map(), self.DATA_OFFSET + index * self.LAST_USED.size, now)
+
+    def _hash(self, key):
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+    def _candidates(self, key_hash):
+        start = key_hash % self.slots
+        return [(start + probe) % self.slots for probe in range(min(self.PROBES, self.slots))]
+
+    def _read_slot(self, index):
+        """
+        Copy a slot consistently without locking.
+
+        Returns:
+            tuple: (header fields, key and value bytes), or None if the slot
+                kept changing while being read
+        """
+        mm = self._map()
+        offset = self._offset(index)
+        for _ in range(self.READ_RETRIES):
+            seq = self.SEQ.unpack_from(mm, offset)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            header = self.SLOT_HEADER.unpack_from(mm, offset)
+            start = offset + self.SLOT_HEADER.size
+            data = mm[start:start + header[3] + header[4]] if header[2] else b''
+            if self.SEQ.unpack_from(mm, offset)[0] == seq:
+                return header, data
+        return None
+
+    def _find(self, key):
+        """
+        Look up a live entry.
+
+        Returns:
+            tuple: (slot index, pickled value), or None if missing or expired
+        """
+        key_bytes = key.encode()
+        key_hash = self._hash(key_bytes)
+        now = time.time()
+        for index in self._candidates(key_hash):
+            slot = self._read_slot(index)
+            if slot is None:
+                continue
+            (_, expires_at, slot_hash, key_length, _), data = slot
+            if slot_hash == key_hash and data[:key_length] == key_bytes and expires_at > now:
+                return index, data[key_length:]
+        return None
+
+    def _write(self, key, value, expires_at):
+        """
+        Store an entry; the caller must hold the write lock.
+
+        Returns:
+            bool: False if the entry is too large for a slot
+        """
+        key_bytes = key.encode()
+        payload = pickle.dumps(value, self.pickle_protocol)
+        if self.SLOT_HEADER.size + len(key_bytes) + len(payload) > self.slot_size:
+            return False
+
+        key_hash = self._hash(key_bytes)
+        mm = self._map()
+        now = time.time()
+        chosen = None
+        oldest = None
+        for index in self._candidates(key_hash):
+            _, slot_expires, slot_hash, key_length, _ = self.SLOT_HEADER.unpack_from(mm, self._offset(index))
+            start = self._offset(index) + self.SLOT_HEADER.size
+            if slot_hash == key_hash and mm[start:start + key_length] == key_bytes:
+                chosen = index
+                break
+            if chosen is None and slot_expires <= now:
+                chosen = index
+            last_used = self._last_used(index)
+            if oldest is None or last_used < oldest[1]:
+                oldest = (index, last_used)
+        if chosen is None:
+            chosen = oldest[0]
+
+        offset = self._offset(chosen)
+        seq = self.SEQ.unpack_from(mm, offset)[0]
+        self.SEQ.pack_into(mm, offset, seq + 1)
+        self.SLOT_HEADER.pack_into(
+            mm, offset, seq + 1, float('inf') if expires_at is None else expires_at,
+            key_hash, len(key_bytes), len(payload)
+        )
+        start = offset + self.SLOT_HEADER.size
+        mm[start:start + len(key_bytes) + len(payload)] = key_bytes + payload
+        self.SEQ.pack_into(mm, offset, seq + 2)
+        self._touch(chosen, now)
+        return True
+
+    def _invalidate(self, key):
+        """
+        Empty the slot holding a key; the caller must hold the write lock.
+
+        Returns:
+            bool: Whether the key was cached
+        """
+        found = self._find(key)
+        if found is None:
+            return False
+        self._update_slot(found[0], expires_at=0.0, key_hash=0)
+        return True
+
+    def _update_slot(self, index, **fields):
+        """
+        Change header fields of a slot; the caller must hold the write lock.
+        """
+        mm = self._map()
+        offset = self._offset(index)
+        seq, expires_at, key_hash, key_length, value_length = self.SLOT_HEADER.unpack_from(mm, offset)
+        self.SEQ.pack_into(mm, offset, seq + 1)
+        self.SLOT_HEADER.pack_into(
+            mm, offset, seq + 1,
+            fields.get('expires_at', expires_at),
+            fields.get('key_hash', key_hash), key_length, value_length
+        )
+        self.SEQ.pack_into(mm, offset, seq + 2)
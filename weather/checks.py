@@ -0,0 +1,43 @@
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.checks import Tags, Warning, register
+from django.db import DatabaseError, connections, router
+
+from weather.circuit import CIRCUIT_CACHE
+
+
+@register(Tags.database)
+def check_circuit_cache_table(app_configs, databases=None, **kwargs):
+    """
+    Warn when the circuit breaker's cache is a database cache whose table
+    has not been created: every breaker call would then fail, be logged and
+    leave the breaker inert.
+
+    Like Django's own database checks, this only runs for commands that
+    request database checks, such as migrate or check --database.
+    """
+    if databases is None:
+        return []
+    cache = caches[CIRCUIT_CACHE]
+    if not isinstance(cache, DatabaseCache):
+        return []
+
+    alias = router.db_for_read(cache.cache_model_class)
+    if alias not in databases:
+        return []
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+    except DatabaseError:
+        # The database itself is unavailable, which other checks report
+        return []
+
+    if cache._table in tables:
+        return []
+    return [Warning(
+        f"The table {cache._table!r} of the {CIRCUIT_CACHE!r} cache does not exist, "
+        "so the weather API circuit breaker is disabled.",
+        hint="Run `python manage.py createcachetable`.",
+        id='weather.W001',
+    )]
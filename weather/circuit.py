@@ -0,0 +1,175 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Cache alias holding the breaker state; it must be shared between worker
+# processes (e.g. a database or Redis cache) for the breaker to be shared
+CIRCUIT_CACHE = getattr(settings, 'WEATHER_CIRCUIT_CACHE', 'default')
+
+# The circuit opens when at least MIN_CALLS calls were made in the last
+# WINDOW seconds and at least FAILURE_RATE of them failed
+FAILURE_RATE = getattr(settings, 'WEATHER_CIRCUIT_FAILURE_RATE', 0.5)
+MIN_CALLS = getattr(settings, 'WEATHER_CIRCUIT_MIN_CALLS', 5)
+WINDOW = getattr(settings, 'WEATHER_CIRCUIT_WINDOW', 60)
+
+# Seconds the circuit stays open before a single trial call is let through
+COOLDOWN = getattr(settings, 'WEATHER_CIRCUIT_COOLDOWN', 30)
+
+# Number of buckets the sliding window is divided into
+WINDOW_BUCKETS = 6
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to an upstream service, with its state kept in
+    a Django cache so that all worker processes share it.
+
+    While closed, calls go through and their outcomes are counted in a
+    sliding window. Once the failure rate in the window is too high the
+    circuit opens and calls are refused. After the cooldown it is half-open:
+    one trial call is let through, and its outcome closes or reopens it.
+
+    Cache errors never block calls; the breaker then behaves as closed.
+    """
+
+    def __init__(self, name, failure_rate=FAILURE_RATE, min_calls=MIN_CALLS,
+                 window=WINDOW, cooldown=COOLDOWN, cache_alias=CIRCUIT_CACHE):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.cache_alias = cache_alias
+        self.bucket_size = window / WINDOW_BUCKETS
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, *parts):
+        return ':'.join(('circuit', self.name) + parts)
+
+    def allow(self):
+        """
+        Check whether a call may be made now.
+
+        In the half-open state only the first caller gets True, as the trial call.
+
+        Returns:
+            bool: False if the circuit is open
+        """
+        try:
+            opened_until = self.cache.get(self._key('opened_until'))
+            if opened_until is None:
+                return True
+            if time.time() < opened_until:
+                return False
+            # Half-open: cache.add is atomic, so only one caller wins the trial
+            return self.cache.add(self._key('trial'), True, timeout=self.cooldown)
+        except Exception as e:
+            logger.warning(f"Circuit breaker {self.name} unavailable: {str(e)}")
+            return True
+
+    def record_success(self):
+        """
+        Count a successful call, closing the circuit if it was a trial call.
+        """
+        try:
+            if self.cache.get(self._key('opened_until')) is not None:
+                logger.info(f"Circuit breaker {self.name} closed")
+                self.reset()
+                return
+            self._count('successes')
+        except Exception as e:
+            logger.warning(f"Circuit breaker {self.name} unavailable: {str(e)}")
+
+    def record_failure(self):
+        """
+        Count a failed call, opening the circuit if the failure rate is too
+        high or if it was a trial call.
+        """
+        try:
+            if self.cache.get(self._key('opened_until')) is not None:
+                self._open()
+                return
+            self._count('failures')
+            successes, failures = self._totals()
+            total = successes + failures
+            if total >= self.min_calls and failures / total >= self.failure_rate:
+                self._open()
+        except Exception as e:
+            logger.warning(f"Circuit breaker {self.name} unavailable: {str(e)}")
+
+    def state(self):
+        """
+        Get the current state: 'closed', 'open' or 'half-open'.
+        """
+        try:
+            opened_until = self.cache.get(self._key('opened_until'))
+        except Exception:
+            return CLOSED
+        if opened_until is None:
+            return CLOSED
+        return OPEN if time.time() < opened_until else HALF_OPEN
+
+    def stats(self):
+        """
+        Return the state and the counts in the current window for monitoring.
+        """
+        try:
+            successes, failures = self._totals()
+            opened_until = self.cache.get(self._key('opened_until'))
+        except Exception:
+            successes = failures = 0
+            opened_until = None
+        total = successes + failures
+        return {
+            'state': self.state(),
+            'successes': successes,
+            'failures': failures,
+            'failure_rate': round(failures / total, 3) if total else 0.0,
+            'opened_until': opened_until,
+        }
+
+    def reset(self):
+        """
+        Close the circuit and forget all counted calls.
+        """
+        keys = [self._key('opened_until'), self._key('trial')]
+        keys += [self._key(outcome, str(bucket)) for bucket in self._buckets() for outcome in ('successes', 'failures')]
+        self.cache.delete_many(keys)
+
+    def _open(self):
+        logger.warning(f"Circuit breaker {self.name} opened for {self.cooldown}s")
+        self.cache.set(self._key('opened_until'), time.time() + self.cooldown, timeout=None)
+        self.cache.delete(self._key('trial'))
+
+    def _buckets(self):
+        current = int(time.time() // self.bucket_size)
+        return range(current - WINDOW_BUCKETS + 1, current + 1)
+
+    def _count(self, outcome):
+        key = self._key(outcome, str(self._buckets()[-1]))
+        self.cache.add(key, 0, timeout=self.window + self.bucket_size)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # The bucket expired between add and incr
+            self.cache.set(key, 1, timeout=self.window + self.bucket_size)
+
+    def _totals(self):
+        buckets = [str(bucket) for bucket in self._buckets()]
+        keys = {outcome: [self._key(outcome, bucket) for bucket in buckets] for outcome in ('successes', 'failures')}
+        values = self.cache.get_many(keys['successes'] + keys['failures'])
+        return (
+            sum(values.get(key, 0) for key in keys['successes']),
+            sum(values.get(key, 0) for key in keys['failures']),
+        )
@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+logger = logging.getLogger(__name__)
+
+# Number of keep-alive connections kept open per host
+POOL_SIZE = getattr(settings, 'WEATHER_HTTP_POOL_SIZE', 10)
+
+# Timeouts in seconds for establishing a connection and waiting for a response
+CONNECT_TIMEOUT = getattr(settings, 'WEATHER_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'WEATHER_READ_TIMEOUT', 5)
+
+# Number of retries after the first attempt for 5xx, 429 and connection errors
+MAX_RETRIES = getattr(settings, 'WEATHER_MAX_RETRIES', 2)
+
+# Exponential backoff: the n-th retry waits a random time up to BACKOFF_FACTOR * 2**n seconds
+BACKOFF_FACTOR = getattr(settings, 'WEATHER_BACKOFF_FACTOR', 0.5)
+BACKOFF_MAX = 8
+
+# Longest Retry-After (in seconds) we are willing to wait for on a 429 response
+RETRY_AFTER_MAX = getattr(settings, 'WEATHER_RETRY_AFTER_MAX', 10)
+
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+
+class WeatherHTTPClient:
+    """
+    HTTP client for the weather provider.
+
+    Keeps a pooled requests.Session so connections are reused between calls,
+    and retries server errors and connection failures with jittered
+    exponential backoff. Rate-limited (429) responses are retried after the
+    delay given in their Retry-After header.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_factor=BACKOFF_FACTOR, retry_after_max=RETRY_AFTER_MAX):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_after_max = retry_after_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, params=None, deadline=None):
+        """
+        Send a GET request, retrying transient failures.
+
+        Args:
+            url (str): The URL to request
+            params (dict): Query string parameters
+            deadline (float): Optional time.monotonic() value by which the
+                request must finish; timeouts are shortened and retries
+                skipped so that it is never exceeded
+
+        Returns:
+            requests.Response: The final response, which may still be an error
+                response once retries are exhausted
+
+        Raises:
+            requests.exceptions.Timeout: If the last attempt timed out
+            requests.exceptions.ConnectionError: If the last attempt could not connect
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, timeout=self._timeout(deadline))
+            except (Timeout, ConnectionError) as e:
+                delay = self._backoff(attempt)
+                if attempt >= self.max_retries or self._past(deadline, delay):
+                    raise
+                reason = str(e)
+            else:
+                if response.status_code == 429:
+                    delay = self._retry_after(response, attempt)
+                elif response.status_code in RETRY_STATUS_CODES:
+                    delay = self._backoff(attempt)
+                else:
+                    return response
+
+                if attempt >= self.max_retries or delay is None or self._past(deadline, delay):
+                    return response
+                reason = f"HTTP {response.status_code}"
+
+            logger.warning(f"Retrying weather API request in {delay:.2f}s ({reason})")
+            time.sleep(delay)
+            attempt += 1
+
+    def _timeout(self, deadline):
+        """
+        Get the (connect, read) timeout for an attempt, capped by the deadline.
+        """
+        if deadline is None:
+            return self.timeout
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise Timeout("Weather API request deadline exceeded")
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    def _past(self, deadline, delay):
+        """
+        Check whether waiting delay seconds would run past the deadline.
+        """
+        return deadline is not None and time.monotonic() + delay >= deadline
+
+    def _backoff(self, attempt):
+        """
+        Get a jittered exponential backoff delay for a retry attempt.
+        """
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff_factor * (2 ** attempt)))
+
+    def _retry_after(self, response, attempt):
+        """
+        Get the delay requested by a 429 response's Retry-After header.
+
+        Returns:
+            float: The delay in seconds, or None if it exceeds retry_after_max
+        """
+        header = response.headers.get('Retry-After')
+        if not header:
+            return self._backoff(attempt)
+
+        try:
+            delay = float(header)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(header) - timezone.now()).total_seconds()
+            except (TypeError, ValueError):
+                return self._backoff(attempt)
+
+        delay = max(delay, 0)
+        if delay > self.retry_after_max:
+            logger.warning(f"Not retrying weather API request: Retry-After of {delay:.0f}s is too long")
+            return None
+        return delay
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_weather_client():
+    """
+    Get the shared weather HTTP client, creating it on first use.
+
+    Returns:
+        WeatherHTTPClient: The module-level client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WeatherHTTPClient()
+    return _client
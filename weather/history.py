@@ -0,0 +1,128 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
+
+from weather.models import WeatherHistory
+
+logger = logging.getLogger(__name__)
+
+# History rows older than this many days are deleted
+HISTORY_RETENTION_DAYS = getattr(settings, 'WEATHER_HISTORY_RETENTION_DAYS', 90)
+
+# History rows older than this many days are thinned to the last one per location per day
+HISTORY_DOWNSAMPLE_AFTER_DAYS = getattr(settings, 'WEATHER_HISTORY_DOWNSAMPLE_AFTER_DAYS', 7)
+
+# Number of rows removed per DELETE statement when pruning
+PRUNE_CHUNK_SIZE = getattr(settings, 'WEATHER_HISTORY_PRUNE_CHUNK_SIZE', 1000)
+
+
+def record_weather_history(weather_data):
+    """
+    Append a copy of a fetched WeatherData row to the history table.
+
+    Args:
+        weather_data (WeatherData): The weather data that was just stored
+
+    Returns:
+        WeatherHistory: The new history row
+    """
+    return WeatherHistory.objects.create(**_history_fields(weather_data))
+
+
+def record_weather_history_batch(weather_rows):
+    """
+    Append copies of several fetched WeatherData rows to the history table
+    with one INSERT.
+
+    Args:
+        weather_rows (list): The weather data objects that were just stored
+
+    Returns:
+        list: The new history rows
+    """
+    return WeatherHistory.objects.bulk_create(
+        WeatherHistory(**_history_fields(weather_data)) for weather_data in weather_rows
+    )
+
+
+def _history_fields(weather_data):
+    return {
+        'location': weather_data.location,
+        'temperature': weather_data.temperature,
+        'conditions': weather_data.conditions,
+        'forecast': weather_data.forecast,
+        'retrieved_at': weather_data.retrieved_at,
+    }
+
+
+def prune_weather_history(retention_days=HISTORY_RETENTION_DAYS,
+                          downsample_after_days=HISTORY_DOWNSAMPLE_AFTER_DAYS,
+                          chunk_size=PRUNE_CHUNK_SIZE, dry_run=False):
+    """
+    Apply the history retention policy.
+
+    Rows older than retention_days are deleted. Rows older than
+    downsample_after_days are thinned to the last row per location per day.
+    Deletes run in chunks so no single statement locks many rows.
+
+    Args:
+        retention_days (int): Age in days after which rows are deleted
+        downsample_after_days (int): Age in days after which rows are thinned
+        chunk_size (int): Maximum number of rows per DELETE
+        dry_run (bool): Count the rows that would be deleted without deleting them
+
+    Returns:
+        dict: The number of rows removed by expiry and by downsampling
+    """
+    now = timezone.now()
+    retention_cutoff = now - timedelta(days=retention_days)
+    downsample_cutoff = now - timedelta(days=downsample_after_days)
+
+    expired = WeatherHistory.objects.filter(retrieved_at__lt=retention_cutoff)
+
+    # Within each location and day, number rows from the latest down; all but the first go
+    superseded = WeatherHistory.objects.filter(
+        retrieved_at__gte=retention_cutoff,
+        retrieved_at__lt=downsample_cutoff,
+    ).annotate(
+        position=Window(
+            expression=RowNumber(),
+            partition_by=[F('location'), TruncDate('retrieved_at')],
+            order_by=F('retrieved_at').desc(),
+        )
+    ).filter(position__gt=1)
+
+    if dry_run:
+        return {
+            'expired': expired.count(),
+            'downsampled': superseded.count(),
+        }
+
+    result = {
+        'expired': _delete_in_chunks(expired, chunk_size),
+        'downsampled': _delete_in_chunks(superseded, chunk_size),
+    }
+    logger.info(
+        f"Pruned weather history: {result['expired']} expired, "
+        f"{result['downsampled']} downsampled"
+    )
+    return result
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    """
+    Delete the rows matched by queryset, at most chunk_size at a time.
+
+    Returns:
+        int: The number of rows deleted
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += WeatherHistory.objects.filter(pk__in=pks).delete()[0]
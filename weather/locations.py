@@ -0,0 +1,200 @@
+import re
+import unicodedata
+
+from weather.cache import TTLCache
+from weather.models import LocationAlias, WeatherData
+
+# Characters other than letters, digits, whitespace, commas, apostrophes and hyphens
+_PUNCTUATION = re.compile(r"[^\w\s,'\-]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Resolved aliases and city ids change rarely, so they are cached in-process
+_alias_cache = TTLCache(maxsize=1024, default_timeout=3600)
+_city_id_cache = TTLCache(maxsize=1024, default_timeout=3600)
+
+# Cached marker for a location known to have no city id
+_NO_CITY_ID = 0
+
+
+def normalize_location(location):
+    """
+    Normalize a location string: Unicode-normalized, case-folded, punctuation
+    stripped, whitespace collapsed and comma-separated parts joined by ", ".
+
+    "  Paris ", "PARIS." and "paris" all become "paris";
+    "Paris,France" becomes "paris, france".
+
+    Args:
+        location (str): The location as entered by a user
+
+    Returns:
+        str: The normalized location, or '' if nothing is left
+    """
+    if not location:
+        return ''
+
+    text = unicodedata.normalize('NFKC', location).casefold()
+    text = _PUNCTUATION.sub(' ', text)
+    parts = (_WHITESPACE.sub(' ', part).strip(" '-") for part in text.split(','))
+    return ', '.join(part for part in parts if part)
+
+
+def resolve_location(location):
+    """
+    Get the canonical weather key for a location string.
+
+    Args:
+        location (str): The location as entered by a user
+
+    Returns:
+        str: The canonical key, or '' if the location is blank
+    """
+    key = normalize_location(location)
+    if not key:
+        return ''
+
+    canonical = _alias_cache.get(key)
+    if canonical is None:
+        canonical = LocationAlias.objects.filter(alias=key).values_list('canonical', flat=True).first() or key
+        _alias_cache.set(key, canonical)
+    return canonical
+
+
+async def aresolve_location(location):
+    """
+    Async version of resolve_location.
+    """
+    key = normalize_location(location)
+    if not key:
+        return ''
+
+    canonical = _alias_cache.get(key)
+    if canonical is None:
+        canonical = await LocationAlias.objects.filter(alias=key).values_list('canonical', flat=True).afirst() or key
+        _alias_cache.set(key, canonical)
+    return canonical
+
+
+def resolve_locations(locations):
+    """
+    Get canonical weather keys for several location strings with one query.
+
+    Args:
+        locations (iterable): Location strings as entered by users
+
+    Returns:
+        dict: Each non-blank location mapped to its canonical key
+    """
+    keys, unknown = _normalize_all(locations)
+    if unknown:
+        _remember_aliases(unknown, LocationAlias.objects.filter(alias__in=unknown).values_list('alias', 'canonical'))
+    return {location: _alias_cache.get(key, key) for location, key in keys.items()}
+
+
+async def aresolve_locations(locations):
+    """
+    Async version of resolve_locations.
+    """
+    keys, unknown = _normalize_all(locations)
+    if unknown:
+        aliases = LocationAlias.objects.filter(alias__in=unknown).values_list('alias', 'canonical')
+        _remember_aliases(unknown, [row async for row in aliases])
+    return {location: _alias_cache.get(key, key) for location, key in keys.items()}
+
+
+def _normalize_all(locations):
+    """
+    Normalize several location strings.
+
+    Returns:
+        tuple: The non-blank locations mapped to their normalized keys, and the
+            set of keys whose alias is not cached yet
+    """
+    keys = {location: normalize_location(location) for location in locations if location}
+    keys = {location: key for location, key in keys.items() if key}
+    unknown = {key for key in keys.values() if _alias_cache.get(key) is None}
+    return keys, unknown
+
+
+def _remember_aliases(keys, aliases):
+    """
+    Cache the canonical key for each of keys, given (alias, canonical) pairs
+    for those that have an alias row.
+    """
+    aliases = dict(aliases)
+    for key in keys:
+        _alias_cache.set(key, aliases.get(key, key))
+
+
+def get_city_id(location):
+    """
+    Get the provider's city id for a canonical location key, if known.
+
+    Args:
+        location (str): The canonical location key
+
+    Returns:
+        int: The city id, or None
+    """
+    city_id = _city_id_cache.get(location)
+    if city_id is None:
+        city_id = LocationAlias.objects.filter(
+            canonical=location, city_id__isnull=False
+        ).values_list('city_id', flat=True).first() or _NO_CITY_ID
+        _city_id_cache.set(location, city_id)
+    return city_id or None
+
+
+async def aget_city_id(location):
+    """
+    Async version of get_city_id.
+    """
+    city_id = _city_id_cache.get(location)
+    if city_id is None:
+        city_id = await LocationAlias.objects.filter(
+            canonical=location, city_id__isnull=False
+        ).values_list('city_id', flat=True).afirst() or _NO_CITY_ID
+        _city_id_cache.set(location, city_id)
+    return city_id or None
+
+
+def register_city_id(location, city_id):
+    """
+    Record the provider's city id for a location key.
+
+    If another key already resolved to the same city, the location becomes
+    an alias of that key, so both share one cache entry from then on.
+
+    Args:
+        location (str): The location key that was fetched
+        city_id (int): The city id returned by the provider
+
+    Returns:
+        str: The canonical key the weather should be stored under
+    """
+    if _city_id_cache.get(location) == city_id:
+        return location
+
+    canonical = LocationAlias.objects.filter(city_id=city_id).exclude(
+        alias=location
+    ).values_list('canonical', flat=True).first() or location
+
+    LocationAlias.objects.update_or_create(
+        alias=location,
+        defaults={'canonical': canonical, 'city_id': city_id}
+    )
+    if canonical != location:
+        # The weather now lives under the other key
+        WeatherData.objects.filter(location=location).delete()
+
+    _alias_cache.set(location, canonical)
+    _city_id_cache.set(canonical, city_id)
+    return canonical
+
+
+def clear_location_caches():
+    """
+    Empty the in-process alias and city id caches.
+    """
+    _alias_cache.clear()
+    _city_id_cache.clear()
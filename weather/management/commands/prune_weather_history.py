@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from weather.history import (
+    prune_weather_history,
+    HISTORY_RETENTION_DAYS,
+    HISTORY_DOWNSAMPLE_AFTER_DAYS,
+    PRUNE_CHUNK_SIZE
+)
+
+
+class Command(BaseCommand):
+    help = "Delete and downsample old weather history according to the retention policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=HISTORY_RETENTION_DAYS,
+            help=f"Delete history older than this many days (default: {HISTORY_RETENTION_DAYS})."
+        )
+        parser.add_argument(
+            '--downsample-after-days',
+            type=int,
+            default=HISTORY_DOWNSAMPLE_AFTER_DAYS,
+            help=(
+                "Keep only the last row per location per day for history older than "
+                f"this many days (default: {HISTORY_DOWNSAMPLE_AFTER_DAYS})."
+            )
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=PRUNE_CHUNK_SIZE,
+            help=f"Maximum rows removed per DELETE (default: {PRUNE_CHUNK_SIZE})."
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report how many rows would be removed without deleting anything."
+        )
+
+    def handle(self, *args, **options):
+        result = prune_weather_history(
+            retention_days=options['retention_days'],
+            downsample_after_days=options['downsample_after_days'],
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['expired']} expired and {result['downsampled']} "
+            f"downsampled weather history rows."
+        ))
@@ -0,0 +1,78 @@
+from argparse import ArgumentTypeError
+
+from django.core.management.base import BaseCommand
+
+from weather.services import (
+    refresh_weather_data,
+    GROUP_BATCH_SIZE,
+    MAX_GROUP_BATCH_SIZE,
+    REFRESH_WORKERS,
+    REFRESH_RATE_LIMIT
+)
+
+
+def batch_size(value):
+    size = int(value)
+    if size > MAX_GROUP_BATCH_SIZE:
+        raise ArgumentTypeError(f"the provider accepts at most {MAX_GROUP_BATCH_SIZE} locations per call")
+    return size
+
+
+class Command(BaseCommand):
+    help = "Refresh weather data for destinations of ongoing and upcoming trips."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'locations',
+            nargs='*',
+            help="Refresh only these locations instead of those of active trips."
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=REFRESH_WORKERS,
+            help=f"Number of concurrent fetches (default: {REFRESH_WORKERS})."
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=REFRESH_RATE_LIMIT,
+            help=f"Maximum fetches started per second, 0 for no limit (default: {REFRESH_RATE_LIMIT})."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=batch_size,
+            default=GROUP_BATCH_SIZE,
+            help=f"Locations per multi-city API call, at most {MAX_GROUP_BATCH_SIZE}; "
+                 f"0 to fetch each one separately (default: {GROUP_BATCH_SIZE})."
+        )
+        parser.add_argument(
+            '--include-activities',
+            action='store_true',
+            help="Also refresh the locations of active trips' activities."
+        )
+
+    def handle(self, *args, **options):
+        report = refresh_weather_data(
+            locations=options['locations'] or None,
+            max_workers=options['workers'],
+            rate_limit=options['rate'],
+            include_activities=options['include_activities'],
+            batch_size=options['batch_size'],
+        )
+
+        if options['verbosity'] >= 2:
+            for result in report['locations']:
+                line = f"{result['location']}: {result['status']} in {result['duration']:.2f}s"
+                if result['error']:
+                    line += f" ({result['error']})"
+                self.stdout.write(line)
+
+        summary = (
+            f"Refreshed {report['refreshed']} of {report['total']} locations "
+            f"in {report['duration']:.2f}s ({report['failed']} failed)."
+        )
+        if report['failed']:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,126 @@
+# Generated by Django 4.2 on 2026-10-18 19:30
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+def split_history(apps, schema_editor):
+    """
+    Copy every existing weather row into the history table, then keep only
+    the latest row per location as the current weather.
+    """
+    WeatherData = apps.get_model("weather", "WeatherData")
+    WeatherHistory = apps.get_model("weather", "WeatherHistory")
+
+    batch = []
+    for row in WeatherData.objects.order_by("retrieved_at").iterator(chunk_size=1000):
+        batch.append(
+            WeatherHistory(
+                location=row.location,
+                temperature=row.temperature,
+                conditions=row.conditions,
+                forecast=row.forecast,
+                retrieved_at=row.retrieved_at,
+            )
+        )
+        if len(batch) >= 1000:
+            WeatherHistory.objects.bulk_create(batch)
+            batch = []
+    WeatherHistory.objects.bulk_create(batch)
+
+    seen = set()
+    stale_ids = []
+    for pk, location in WeatherData.objects.order_by(
+        "location", "-retrieved_at"
+    ).values_list("pk", "location"):
+        if location in seen:
+            stale_ids.append(pk)
+        seen.add(location)
+    for start in range(0, len(stale_ids), 1000):
+        WeatherData.objects.filter(pk__in=stale_ids[start : start + 1000]).delete()
+
+
+def restore_history(apps, schema_editor):
+    """
+    Move history rows back into the weather table.
+    """
+    WeatherData = apps.get_model("weather", "WeatherData")
+    WeatherHistory = apps.get_model("weather", "WeatherHistory")
+
+    latest = set(WeatherData.objects.values_list("location", "retrieved_at"))
+    WeatherData.objects.bulk_create(
+        WeatherData(
+            location=row.location,
+            temperature=row.temperature,
+            conditions=row.conditions,
+            forecast=row.forecast,
+            retrieved_at=row.retrieved_at,
+        )
+        for row in WeatherHistory.objects.iterator(chunk_size=1000)
+        if (row.location, row.retrieved_at) not in latest
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherHistory",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("location", models.CharField(max_length=255)),
+                ("temperature", models.FloatField()),
+                ("conditions", models.CharField(max_length=100)),
+                ("forecast", models.TextField()),
+                (
+                    "retrieved_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Weather History",
+                "verbose_name_plural": "Weather History",
+                "ordering": ["-retrieved_at"],
+            },
+        ),
+        migrations.RunPython(split_history, restore_history),
+        migrations.RemoveConstraint(
+            model_name="weatherdata",
+            name="unique_location_time",
+        ),
+        migrations.AlterField(
+            model_name="weatherdata",
+            name="location",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="weatherdata",
+            name="retrieved_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="weatherhistory",
+            index=models.Index(
+                fields=["location", "retrieved_at"], name="weather_history_loc_time_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="weatherhistory",
+            index=models.Index(
+                fields=["retrieved_at"], name="weather_history_time_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2 on 2026-10-18 19:34
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# A frozen copy of weather.locations.normalize_location as of this migration,
+# so later changes to it do not alter what this migration does
+
+_PUNCTUATION = re.compile(r"[^\w\s,'\-]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_location(location):
+    if not location:
+        return ""
+
+    text = unicodedata.normalize("NFKC", location).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    parts = (_WHITESPACE.sub(" ", part).strip(" '-") for part in text.split(","))
+    return ", ".join(part for part in parts if part)
+
+
+def normalize_locations(apps, schema_editor):
+    """
+    Rewrite stored locations to their canonical keys, keeping only the latest
+    current-weather row where several spellings collapse to one key.
+    """
+    WeatherData = apps.get_model("weather", "WeatherData")
+    WeatherHistory = apps.get_model("weather", "WeatherHistory")
+
+    seen = set()
+    stale_ids = []
+    renames = []
+    for pk, location in WeatherData.objects.order_by("-retrieved_at").values_list(
+        "pk", "location"
+    ):
+        key = normalize_location(location)
+        if not key:
+            continue
+        if key in seen:
+            stale_ids.append(pk)
+            continue
+        seen.add(key)
+        if key != location:
+            renames.append((pk, key))
+
+    # Remove superseded rows first so renames cannot collide on the unique location
+    for start in range(0, len(stale_ids), 1000):
+        WeatherData.objects.filter(pk__in=stale_ids[start : start + 1000]).delete()
+    for pk, key in renames:
+        WeatherData.objects.filter(pk=pk).update(location=key)
+
+    locations = WeatherHistory.objects.values_list("location", flat=True).distinct()
+    for location in list(locations):
+        key = normalize_location(location)
+        if key and key != location:
+            WeatherHistory.objects.filter(location=location).update(location=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0002_weatherhistory_latest_weather"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LocationAlias",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("alias", models.CharField(max_length=255, unique=True)),
+                ("canonical", models.CharField(db_index=True, max_length=255)),
+                (
+                    "city_id",
+                    models.PositiveIntegerField(blank=True, db_index=True, null=True),
+                ),
+            ],
+            options={
+                "verbose_name": "Location Alias",
+                "verbose_name_plural": "Location Aliases",
+                "ordering": ["alias"],
+            },
+        ),
+        migrations.RunPython(normalize_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+import json
+
+from django.db import migrations, models
+
+
+def parse_forecasts(apps, schema_editor):
+    """
+    Decode the JSON text in forecast into the new structured column.
+    Rows whose text does not decode to a list get an empty forecast.
+    """
+    for model_name in ("WeatherData", "WeatherHistory"):
+        Model = apps.get_model("weather", model_name)
+        batch = []
+        for row in Model.objects.only("pk", "forecast").iterator(chunk_size=1000):
+            try:
+                forecast = json.loads(row.forecast)
+            except ValueError:
+                forecast = []
+            row.forecast_data = forecast if isinstance(forecast, list) else []
+            batch.append(row)
+            if len(batch) >= 1000:
+                Model.objects.bulk_update(batch, ["forecast_data"])
+                batch = []
+        Model.objects.bulk_update(batch, ["forecast_data"])
+
+
+def serialize_forecasts(apps, schema_editor):
+    """
+    Write the structured forecast back out as JSON text.
+    """
+    for model_name in ("WeatherData", "WeatherHistory"):
+        Model = apps.get_model("weather", model_name)
+        batch = []
+        for row in Model.objects.only("pk", "forecast_data").iterator(chunk_size=1000):
+            row.forecast = json.dumps(row.forecast_data)
+            batch.append(row)
+            if len(batch) >= 1000:
+                Model.objects.bulk_update(batch, ["forecast"])
+                batch = []
+        Model.objects.bulk_update(batch, ["forecast"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0003_location_alias"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="weatherdata",
+            name="forecast_data",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="weatherhistory",
+            name="forecast_data",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name="weatherdata",
+            name="forecast",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AlterField(
+            model_name="weatherhistory",
+            name="forecast",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(parse_forecasts, serialize_forecasts),
+        migrations.RemoveField(
+            model_name="weatherdata",
+            name="forecast",
+        ),
+        migrations.RemoveField(
+            model_name="weatherhistory",
+            name="forecast",
+        ),
+        migrations.RenameField(
+            model_name="weatherdata",
+            old_name="forecast_data",
+            new_name="forecast",
+        ),
+        migrations.RenameField(
+            model_name="weatherhistory",
+            old_name="forecast_data",
+            new_name="forecast",
+        ),
+    ]
@@ -1,31 +1,116 @@
+import json
 import uuid
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 
 class WeatherData(models.Model):
+    """
+    The latest weather for each location, updated in place on every fetch.
+    """
     id = models.UUIDField(
         primary_key=True,
         default=uuid.uuid4,
         editable=False
     )
-    location = models.CharField(max_length=255)
+    location = models.CharField(max_length=255, unique=True)
     temperature = models.FloatField()
     conditions = models.CharField(max_length=100)
-    forecast = models.TextField()
-    retrieved_at = models.DateTimeField(auto_now_add=True)
+    forecast = models.JSONField(default=list, blank=True)
+    retrieved_at = models.DateTimeField(default=timezone.now)
+
+    # Set by weather.services when a row older than the cache duration is
+    # served while a fresh one is fetched in the background
+    is_stale = False
 
     class Meta:
         ordering = ['-retrieved_at']
         verbose_name = "Weather Data"
         verbose_name_plural = "Weather Data"
-        # Add a unique constraint for the location and time to prevent duplicate entries
-        # This allows getting the latest weather data for a location easily
-        constraints = [
-            models.UniqueConstraint(
-                fields=['location', 'retrieved_at'],
-                name='unique_location_time'
-            )
+
+    def __str__(self):
+        return f"{self.location} - {self.conditions} ({self.temperature}°C) at {self.retrieved_at.strftime('%Y-%m-%d %H:%M')}"
+
+    @cached_property
+    def daily_forecast(self):
+        """
+        The forecast as a list of per-day dictionaries, computed once per instance.
+        """
+        forecast = self.forecast
+        if isinstance(forecast, str):
+            # Unsaved instances may still be given the old JSON string form
+            try:
+                forecast = json.loads(forecast)
+            except ValueError:
+                return []
+        return forecast if isinstance(forecast, list) else []
+
+
+class WeatherHistory(models.Model):
+    """
+    Append-only record of every weather fetch, pruned by the
+    prune_weather_history management command.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    location = models.CharField(max_length=255)
+    temperature = models.FloatField()
+    conditions = models.CharField(max_length=100)
+    forecast = models.JSONField(default=list, blank=True)
+    retrieved_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-retrieved_at']
+        verbose_name = "Weather History"
+        verbose_name_plural = "Weather History"
+        indexes = [
+            models.Index(fields=['location', 'retrieved_at'], name='weather_history_loc_time_idx'),
+            models.Index(fields=['retrieved_at'], name='weather_history_time_idx'),
         ]
 
     def __str__(self):
         return f"{self.location} - {self.conditions} ({self.temperature}°C) at {self.retrieved_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class LocationAlias(models.Model):
+    """
+    Maps a normalized location string to the canonical key its weather is
+    stored under, optionally with the provider's resolved city id.
+    """
+    alias = models.CharField(max_length=255, unique=True)
+    canonical = models.CharField(max_length=255, db_index=True)
+    city_id = models.PositiveIntegerField(blank=True, null=True, db_index=True)
+
+    class Meta:
+        ordering = ['alias']
+        verbose_name = "Location Alias"
+        verbose_name_plural = "Location Aliases"
+
+    def __str__(self):
+        return f"{self.alias} -> {self.canonical}"
+
+
+class RateLimitBucket(models.Model):
+    """
+    Shared token bucket state for rate limiting calls to the weather
+    provider across all worker processes. See weather.ratelimit.TokenBucket.
+    """
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    name = models.CharField(max_length=100, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Rate Limit Bucket"
+        verbose_name_plural = "Rate Limit Buckets"
+
+    def __str__(self):
+        return f"{self.name}: {self.tokens:.1f} tokens"
@@ -0,0 +1,139 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from weather.models import RateLimitBucket
+
+# Set while doing background work, whose calls yield to interactive ones
+_background = contextvars.ContextVar('weather_background_priority', default=False)
+
+
+class RateLimiter:
+    """
+    Thread-safe pacing helper that spaces calls evenly at a maximum rate.
+
+    Each call to acquire() reserves the next free slot and sleeps until it
+    arrives, so callers on several threads share one overall rate.
+    """
+
+    def __init__(self, rate):
+        """
+        Args:
+            rate (float): Maximum calls per second; None or 0 disables pacing
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until the caller may proceed.
+        """
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+@contextmanager
+def background_priority():
+    """
+    Mark calls made inside the block as background work, which TokenBucket
+    serves only while tokens are left over for interactive requests.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def is_background_priority():
+    """
+    Check whether the caller is inside a background_priority() block.
+    """
+    return _background.get()
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all worker processes through a database row.
+
+    Tokens refill continuously at rate per second up to capacity, and each
+    call to the rate-limited service takes one. Background callers (see
+    background_priority) may not take the last reserve tokens, which are
+    kept for interactive requests.
+    """
+
+    def __init__(self, name, rate, capacity, reserve=0):
+        """
+        Args:
+            name (str): Identifies the bucket's row
+            rate (float): Tokens added per second; None or 0 disables limiting
+            capacity (float): Maximum number of tokens, i.e. the largest burst
+            reserve (float): Tokens only interactive callers may take
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = min(reserve, capacity)
+
+    def acquire(self, tokens=1, timeout=0):
+        """
+        Take tokens, waiting up to timeout seconds for them to refill.
+
+        Args:
+            tokens (int): The number of tokens needed
+            timeout (float): The longest time to wait
+
+        Returns:
+            bool: True if the tokens were taken, False if they did not
+                become available in time
+        """
+        if not self.rate:
+            return True
+
+        floor = self.reserve if _background.get() else 0
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take(tokens, floor)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def _take(self, tokens, floor):
+        """
+        Refill the bucket and take tokens if more than floor would remain.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        with transaction.atomic():
+            now = timezone.now()
+            bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+                name=self.name,
+                defaults={'tokens': self.capacity, 'updated_at': now}
+            )
+            elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+            available = min(self.capacity, bucket.tokens + elapsed * self.rate)
+
+            if available - tokens >= floor:
+                available -= tokens
+                wait = 0
+            else:
+                wait = (tokens + floor - available) / self.rate
+
+            RateLimitBucket.objects.filter(pk=bucket.pk).update(tokens=available, updated_at=now)
+        return wait
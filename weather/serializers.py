@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+from api.serializers import SparseFieldsetsMixin
+from weather.models import WeatherData
+
+
+class WeatherDataSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    forecast = serializers.ListField(source='daily_forecast', read_only=True)
+    is_stale = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = WeatherData
+        fields = ['location', 'temperature', 'conditions', 'forecast', 'retrieved_at', 'is_stale']
+        read_only_fields = fields
@@ -1,14 +1,33 @@
+import asyncio
 import logging
 import os
-import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from datetime import timedelta
+from django.db import connection, connections, transaction
+from django.db.models import Min
 from django.utils import timezone
 
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import caches
 from requests.exceptions import RequestException, Timeout, ConnectionError, HTTPError, TooManyRedirects
 
-from weather.models import WeatherData
+from itineraries.models import Activity
+from trips.models import Trip
+from weather.cache import HashedKeyCache, TTLCache
+from weather.circuit import CircuitBreaker
+from weather.client import get_weather_client
+from weather.history import record_weather_history, record_weather_history_batch
+from weather.locations import (
+    aget_city_id, aresolve_location, aresolve_locations, clear_location_caches, get_city_id,
+    register_city_id, resolve_location, resolve_locations
+)
+from weather.models import LocationAlias, WeatherData
+from weather.ratelimit import RateLimiter, TokenBucket, background_priority, is_background_priority
 
 logger = logging.getLogger(__name__)
 
@@ -19,33 +38,884 @@ WEATHER_API_URL = getattr(settings, 'WEATHER_API_URL', os.environ.get('WEATHER_A
 # Cache duration (in hours)
 CACHE_DURATION = 3
 
-# Request timeout in seconds
-REQUEST_TIMEOUT = 5
+# Stale-while-revalidate window (in hours) after CACHE_DURATION: rows this much
+# older are still served, flagged as stale, while a background refresh runs.
+# Past CACHE_DURATION + STALE_GRACE a synchronous fetch is forced. 0 disables it.
+STALE_GRACE = getattr(settings, 'WEATHER_STALE_GRACE', 0)
 
 # Whether to use mock data when API key is missing or API is unreachable
 USE_MOCK_DATA = getattr(settings, 'WEATHER_USE_MOCK_DATA', True)
 
+# Overall time budget (in seconds) for fetching current weather and forecast together
+FETCH_DEADLINE = getattr(settings, 'WEATHER_FETCH_DEADLINE', 5)
+
+# Time budget (in milliseconds) for the weather work of a page render; a fetch
+# that takes longer finishes in the background. None or 0 means no budget
+RENDER_BUDGET_MS = getattr(settings, 'WEATHER_RENDER_BUDGET_MS', None)
+
+# Threads used to issue upstream requests concurrently
+_request_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'WEATHER_REQUEST_WORKERS', 8),
+    thread_name_prefix='weather-request'
+)
+
+# Threads used for background refreshes of stale weather data
+_background_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'WEATHER_BACKGROUND_WORKERS', 4),
+    thread_name_prefix='weather-background'
+)
+
+# Threads used to fetch several locations at once for get_weather_for_locations
+_fetch_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'WEATHER_FETCH_WORKERS', 8),
+    thread_name_prefix='weather-fetch'
+)
+
+# Concurrent fetches and maximum fetches started per second for refresh_weather_data
+REFRESH_WORKERS = getattr(settings, 'WEATHER_REFRESH_WORKERS', 4)
+REFRESH_RATE_LIMIT = getattr(settings, 'WEATHER_REFRESH_RATE_LIMIT', 1.0)
+
+# Most city ids the provider accepts in one call to its group endpoint
+MAX_GROUP_BATCH_SIZE = 20
+
+# City ids per call to the provider's multi-city group endpoint, at most
+# MAX_GROUP_BATCH_SIZE; 0 or 1 refreshes every location individually
+GROUP_BATCH_SIZE = min(getattr(settings, 'WEATHER_GROUP_BATCH_SIZE', 20), MAX_GROUP_BATCH_SIZE)
+
+# Maximum number of locations held in the in-process weather cache
+CACHE_SIZE = getattr(settings, 'WEATHER_CACHE_SIZE', 256)
+
+# Django cache alias to use in front of the database lookup instead of the
+# in-process cache, e.g. one using weather.cache.SharedMemoryCache so that
+# all workers on a host share it
+CACHE_ALIAS = getattr(settings, 'WEATHER_CACHE_ALIAS', None)
+
+# Cache in front of the database lookup, keyed by location.
+# Entries expire when the underlying row falls outside CACHE_DURATION + STALE_GRACE.
+if CACHE_ALIAS:
+    _weather_cache = HashedKeyCache(caches[CACHE_ALIAS], prefix='weather')
+else:
+    _weather_cache = TTLCache(maxsize=CACHE_SIZE, default_timeout=(CACHE_DURATION + STALE_GRACE) * 3600)
+
+# How long (in seconds) a caller waits for another in-flight fetch of the same location
+SINGLE_FLIGHT_TIMEOUT = getattr(settings, 'WEATHER_SINGLE_FLIGHT_TIMEOUT', 15)
+
+# Interval (in seconds) between attempts to take the cross-process fetch lock
+LOCK_POLL_INTERVAL = 0.05
+
+# Fetches currently in progress in this process, keyed by location
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Locations with a background refresh queued or running
+_background_refreshes = set()
+
+# Async fetches started by callers with a deadline, referenced until done so
+# that the event loop's weak references do not let them be garbage-collected
+_background_tasks = set()
+
+# Fetches started by callers with a deadline, keyed by location, kept until
+# they finish so that later callers wait on the same future
+_pending_fetches = {}
+
+# Stops calling the provider while it is failing; shared by all workers through the cache
+_circuit = CircuitBreaker('weather-api')
+
+# Provider quota shared by all workers: calls per minute, the largest burst, and
+# how many of the burst's calls are kept for page requests. None or 0 disables it
+QUOTA_PER_MINUTE = getattr(settings, 'WEATHER_QUOTA_PER_MINUTE', 60)
+QUOTA_BURST = getattr(settings, 'WEATHER_QUOTA_BURST', 20)
+QUOTA_RESERVE = getattr(settings, 'WEATHER_QUOTA_RESERVE', 5)
+
+# How long (in seconds) page requests and background work wait for quota
+QUOTA_INTERACTIVE_WAIT = getattr(settings, 'WEATHER_QUOTA_INTERACTIVE_WAIT', 0.25)
+QUOTA_BACKGROUND_WAIT = getattr(settings, 'WEATHER_QUOTA_BACKGROUND_WAIT', 60)
+
+_quota = TokenBucket(
+    'weather-api',
+    rate=QUOTA_PER_MINUTE / 60 if QUOTA_PER_MINUTE else 0,
+    capacity=QUOTA_BURST,
+    reserve=QUOTA_RESERVE
+)
+
 class WeatherServiceException(Exception):
     """Base exception for weather service errors"""
     pass
 
-class WeatherAPIKeyMissingException(WeatherServiceException):
-    """Exception raised when API key is missing"""
-    pass
+class WeatherAPIKeyMissingException(WeatherServiceException):
+    """Exception raised when API key is missing"""
+    pass
+
+class WeatherAPIException(WeatherServiceException):
+    """Exception raised for API errors"""
+    pass
+
+class WeatherCircuitOpenException(WeatherAPIException):
+    """Exception raised when the API is not called because the circuit breaker is open"""
+    pass
+
+class WeatherQuotaExceededException(WeatherAPIException):
+    """Exception raised when the API is not called because the shared quota is used up"""
+    pass
+
+
+def get_weather_for_location(location, deadline=None):
+    """
+    Get weather data for a specific location.
+    The location is first resolved to its canonical key, so spelling
+    variants such as "Paris" and " paris. " share one cache entry.
+    Then tries to retrieve from cache (in-process, then the latest-weather
+    table in the database), if recent enough.
+    If not available or outdated, fetches from the API.
+    
+    With a deadline, the caller waits for the fetch only until then; the
+    fetch carries on in the background, and the stored row is returned
+    regardless of age (flagged as stale), or None if there is none.
+    is_weather_pending() tells whether such a fetch is still running.
+    
+    Args:
+        location (str): The location to get weather for
+        deadline (float): Optional time.monotonic() value, see render_deadline()
+        
+    Returns:
+        WeatherData: The weather data object or None if unsuccessful
+    """
+    if not location:
+        logger.error("No location provided for weather data")
+        return None
+    
+    try:
+        location = resolve_location(location)
+        if not location:
+            logger.error("Location is blank after normalization")
+            return None
+        
+        # Check the in-process cache before touching the database
+        cached_weather = _weather_cache.get(location)
+        if cached_weather is not None:
+            logger.debug(f"Retrieved in-process cached weather data for {location}")
+        else:
+            # Check for cached data in the database, including stale rows within the grace window
+            cached_weather = _get_recent_weather(location, max_age=CACHE_DURATION + STALE_GRACE)
+            if cached_weather:
+                logger.info(f"Retrieved cached weather data for {location}")
+                _cache_weather(cached_weather)
+        
+        if cached_weather:
+            return _serve_cached_weather(cached_weather)
+        
+        # If no recent data, fetch from API (sharing any fetch already in flight)
+        if deadline is not None:
+            return _fetch_many_within([location], deadline).get(location)
+        return _fetch_or_none(location)
+    
+    except Exception as e:
+        logger.error(f"Error getting weather for {location}: {str(e)}")
+        return None
+
+
+def get_weather_for_locations(locations, deadline=None):
+    """
+    Get weather data for several locations at once.
+    
+    Cached rows for all of the locations are read with a single query, and
+    only the locations without a usable row are fetched from the API,
+    concurrently. The cost therefore stays flat as locations are added.
+    A deadline works as for get_weather_for_location.
+    
+    Args:
+        locations (iterable): The locations to get weather for
+        deadline (float): Optional time.monotonic() value, see render_deadline()
+        
+    Returns:
+        dict: Each non-blank location mapped to its weather data object, or
+            to None if unsuccessful
+    """
+    locations = [location for location in dict.fromkeys(locations) if location]
+    if not locations:
+        return {}
+    
+    try:
+        keys = resolve_locations(locations)
+        weather, missing = _split_cached_weather(set(keys.values()))
+        if missing:
+            for weather_data in _recent_weather_rows(missing):
+                _cache_weather(weather_data)
+                weather[weather_data.location] = _serve_cached_weather(weather_data)
+        
+        misses = [key for key in missing if key not in weather]
+        if deadline is not None:
+            weather.update(_fetch_many_within(misses, deadline))
+        elif len(misses) == 1:
+            weather[misses[0]] = _fetch_or_none(misses[0])
+        elif misses:
+            futures = {
+                key: _fetch_executor.submit(_in_worker_thread, _fetch_or_none, key)
+                for key in misses
+            }
+            for key, future in futures.items():
+                weather[key] = future.result()
+    
+    except Exception as e:
+        logger.error(f"Error getting weather for {len(locations)} locations: {str(e)}")
+        return {location: None for location in locations}
+    
+    return {location: weather.get(keys.get(location)) for location in locations}
+
+
+def render_deadline():
+    """
+    Get the deadline for the weather work of a page render that starts now.
+    
+    Returns:
+        float: A time.monotonic() value, or None if WEATHER_RENDER_BUDGET_MS is not set
+    """
+    if not RENDER_BUDGET_MS:
+        return None
+    return time.monotonic() + RENDER_BUDGET_MS / 1000
+
+
+def is_weather_pending(location):
+    """
+    Check whether a fetch for a location is still running, e.g. because it
+    outlived the deadline of the request that started it.
+    
+    Args:
+        location (str): The location as passed to get_weather_for_location
+        
+    Returns:
+        bool: True if fresh weather for the location is on its way
+    """
+    key = resolve_location(location)
+    with _inflight_lock:
+        return key in _pending_fetches or key in _inflight
+
+
+def _fetch_many_within(locations, deadline):
+    """
+    Fetch locations concurrently, waiting for them only until the deadline.
+    
+    Fetches still running at the deadline carry on in the background; for
+    those locations the stored row is returned regardless of age, flagged
+    as stale, if there is one.
+    
+    Args:
+        locations (list): Canonical location keys
+        deadline (float): A time.monotonic() value
+        
+    Returns:
+        dict: The locations mapped to their weather data objects or None
+    """
+    if not locations:
+        return {}
+    
+    futures = {location: _pending_future(location) for location in locations}
+    wait(futures.values(), timeout=_time_left(deadline))
+    
+    weather = {location: _future_weather(future) for location, future in futures.items() if future.done()}
+    late = [location for location in locations if location not in weather]
+    if late:
+        logger.info(f"Weather for {', '.join(late)} not ready before the deadline")
+        for weather_data in WeatherData.objects.filter(location__in=late):
+            weather_data.is_stale = True
+            weather[weather_data.location] = weather_data
+    return weather
+
+
+def _pending_future(location):
+    """
+    Get a future for the weather of a location, reusing the fetch already
+    running for it in this process, if any, instead of queueing another.
+    """
+    with _inflight_lock:
+        future = _pending_fetches.get(location) or _inflight.get(location)
+        if future is not None:
+            return future
+        future = _fetch_executor.submit(_in_worker_thread, _fetch_or_none, location)
+        _pending_fetches[location] = future
+    # Outside the lock: the callback runs at once if the fetch already finished
+    future.add_done_callback(lambda done: _forget_pending_fetch(location, done))
+    return future
+
+
+def _forget_pending_fetch(location, future):
+    with _inflight_lock:
+        if _pending_fetches.get(location) is future:
+            del _pending_fetches[location]
+
+
+def _future_weather(future):
+    """
+    Get the weather from a finished fetch future, or None if it failed.
+    """
+    if future.exception() is not None:
+        logger.error(f"Error fetching weather: {str(future.exception())}")
+        return None
+    return future.result()
+
+
+def _split_cached_weather(keys):
+    """
+    Look up location keys in the in-process cache.
+    
+    Returns:
+        tuple: The cached weather, served through _serve_cached_weather and
+            keyed by location, and the list of keys that were not cached
+    """
+    weather = {}
+    missing = []
+    for key in keys:
+        cached_weather = _weather_cache.get(key)
+        if cached_weather is not None:
+            weather[key] = _serve_cached_weather(cached_weather)
+        else:
+            missing.append(key)
+    return weather, missing
+
+
+async def _asplit_cached_weather(keys):
+    """
+    Async version of _split_cached_weather.
+    """
+    weather = {}
+    missing = []
+    for key in keys:
+        cached_weather = await _weather_cache.aget(key)
+        if cached_weather is not None:
+            weather[key] = _serve_cached_weather(cached_weather)
+        else:
+            missing.append(key)
+    return weather, missing
+
+
+def _recent_weather_rows(locations):
+    """
+    Get the current weather rows for several locations that are within
+    CACHE_DURATION plus the stale grace window.
+    
+    Returns:
+        QuerySet: The matching WeatherData rows, one per location at most
+    """
+    return WeatherData.objects.filter(
+        location__in=locations,
+        retrieved_at__gte=timezone.now() - timedelta(hours=CACHE_DURATION + STALE_GRACE)
+    )
+
+
+def _fetch_or_none(location):
+    """
+    Fetch weather for a location, sharing any fetch already in flight, and
+    log rather than raise errors.
+    
+    Returns:
+        WeatherData: The weather data object or None if unsuccessful
+    """
+    try:
+        return fetch_weather_single_flight(location)
+    except WeatherAPIKeyMissingException as e:
+        logger.error(f"API key missing: {str(e)}")
+        return None
+    except WeatherAPIException as e:
+        logger.error(f"API error: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error fetching weather: {str(e)}")
+        return None
+
+
+def _time_left(deadline):
+    """
+    Get the number of seconds remaining before a time.monotonic() deadline.
+    """
+    return max(deadline - time.monotonic(), 0)
+
+
+def _get_recent_weather(location, max_age=CACHE_DURATION):
+    """
+    Get the most recent WeatherData row for a location.
+    
+    Args:
+        location (str): The location to look up
+        max_age (float): The maximum age of the row in hours
+        
+    Returns:
+        WeatherData: The cached weather data object or None
+    """
+    return WeatherData.objects.filter(
+        location=location,
+        retrieved_at__gte=timezone.now() - timedelta(hours=max_age)
+    ).first()
+
+
+def _serve_cached_weather(weather_data):
+    """
+    Return a cached row, flagging it and scheduling a background refresh if
+    it is older than CACHE_DURATION (i.e. inside the stale grace window).
+    
+    Args:
+        weather_data (WeatherData): The cached weather data object
+        
+    Returns:
+        WeatherData: The same weather data object
+    """
+    if weather_data.retrieved_at < timezone.now() - timedelta(hours=CACHE_DURATION):
+        logger.info(f"Serving stale weather data for {weather_data.location} while refreshing")
+        weather_data.is_stale = True
+        _refresh_in_background(weather_data.location)
+    return weather_data
+
+
+def _refresh_in_background(location):
+    """
+    Start fetching fresh weather for a location on a background thread,
+    unless a fetch for it is already in flight.
+    
+    Args:
+        location (str): The location to refresh
+    """
+    with _inflight_lock:
+        if location in _inflight or location in _background_refreshes:
+            return
+        _background_refreshes.add(location)
+    _background_executor.submit(_in_worker_thread, _background_refresh, location)
+
+
+def _background_refresh(location):
+    """
+    Fetch fresh weather for a location, logging rather than raising errors.
+    """
+    try:
+        with background_priority():
+            fetch_weather_single_flight(location)
+    except Exception as e:
+        logger.error(f"Background weather refresh failed for {location}: {str(e)}")
+    finally:
+        with _inflight_lock:
+            _background_refreshes.discard(location)
+
+
+def fetch_weather_single_flight(location, fresh_since=None):
+    """
+    Fetch weather data for a location, coalescing concurrent fetches.
+    
+    Only one fetch per location runs at a time in this process; concurrent
+    callers wait for it and share its result. Across worker processes the
+    fetch is serialized by a database lock, and a worker that gets the lock
+    after another one has finished reuses the row that was just stored.
+    
+    Args:
+        location (str): The location to get weather for
+        fresh_since (datetime): Only reuse a stored row retrieved at or after
+            this time; by default any row within CACHE_DURATION is reused
+        
+    Returns:
+        WeatherData: The weather data object
+        
+    Raises:
+        WeatherServiceException: If the fetch failed
+        concurrent.futures.TimeoutError: If the in-flight fetch did not finish
+            within SINGLE_FLIGHT_TIMEOUT
+    """
+    with _inflight_lock:
+        flight = _inflight.get(location)
+        is_leader = flight is None
+        if is_leader:
+            flight = Future()
+            # Mark the flight as running so a waiter that gives up cannot cancel it
+            flight.set_running_or_notify_cancel()
+            _inflight[location] = flight
+    
+    if not is_leader:
+        logger.info(f"Waiting for in-flight weather fetch for {location}")
+        return flight.result(timeout=SINGLE_FLIGHT_TIMEOUT)
+    
+    try:
+        with _location_lock(location):
+            # Another worker may have stored fresh data while we waited for the lock
+            if fresh_since is None:
+                weather_data = _get_recent_weather(location)
+            else:
+                max_age = (timezone.now() - fresh_since).total_seconds() / 3600
+                weather_data = _get_recent_weather(location, max_age=max_age)
+            if weather_data:
+                _cache_weather(weather_data)
+            else:
+                weather_data = fetch_weather_from_api(location)
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    else:
+        flight.set_result(weather_data)
+        return weather_data
+    finally:
+        with _inflight_lock:
+            _inflight.pop(location, None)
+
+
+@contextmanager
+def _location_lock(location):
+    """
+    Hold a PostgreSQL advisory lock for a location while fetching it, so that
+    only one worker process calls the API for it at a time.
+    
+    Gives up waiting after SINGLE_FLIGHT_TIMEOUT and proceeds unlocked rather
+    than blocking the request. On other database backends this is a no-op.
+    
+    Args:
+        location (str): The location being fetched
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    
+    key = f"weather:{location}"
+    deadline = time.monotonic() + SINGLE_FLIGHT_TIMEOUT
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", [key])
+            acquired = cursor.fetchone()[0]
+            if acquired or time.monotonic() >= deadline:
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+    
+    if not acquired:
+        logger.warning(f"Timed out waiting for weather fetch lock for {location}")
+    
+    try:
+        yield
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", [key])
+
+
+def fetch_weather_from_api(location):
+    """
+    Fetch weather data from OpenWeatherMap API.
+    
+    Queries by the provider's city id when one is known for the location, and
+    records the city id the provider returns so that keys naming the same
+    city are merged.
+    
+    Args:
+        location (str): The canonical location key to get weather for
+        
+    Returns:
+        WeatherData: The newly created weather data object
+        
+    Raises:
+        WeatherAPIKeyMissingException: If the API key is not configured
+        WeatherAPIException: If there's an error with the API request
+        Exception: For any other unexpected errors
+    """
+    if not WEATHER_API_KEY or WEATHER_API_KEY == 'your_weather_api_key':
+        logger.error("Weather API key is not configured")
+        if USE_MOCK_DATA:
+            logger.info(f"Using mock data for location: {location}")
+            return create_mock_weather_data(location)
+        raise WeatherAPIKeyMissingException("Weather API key is not configured")
+    
+    if not _circuit.allow():
+        return _serve_without_fetching(location, WeatherCircuitOpenException("Weather API circuit breaker is open"))
+    
+    # Current weather and forecast are two calls against the quota
+    if not _acquire_quota(2):
+        return _serve_without_fetching(location, WeatherQuotaExceededException("Weather API quota exhausted"))
+    
+    try:
+        (current_url, current_params), (forecast_url, forecast_params) = _weather_requests(
+            location, get_city_id(location)
+        )
+        
+        # Issue both requests at once; together they must finish within FETCH_DEADLINE.
+        # The shared client applies connect/read timeouts and retries transient errors.
+        deadline = time.monotonic() + FETCH_DEADLINE
+        client = get_weather_client()
+        current_future = _request_executor.submit(client.get, current_url, current_params, deadline)
+        forecast_future = _request_executor.submit(client.get, forecast_url, forecast_params, deadline)
+        
+        try:
+            current_response = current_future.result(timeout=_time_left(deadline))
+            _record_upstream_response(current_response)
+            current_data = _read_current_response(current_response, location)
+        except (Timeout, ConnectionError, FutureTimeoutError) as e:
+            forecast_future.cancel()
+            _circuit.record_failure()
+            logger.error(f"Connection error or timeout for current weather API: {str(e)}")
+            if USE_MOCK_DATA:
+                logger.info(f"Using mock data for location: {location}")
+                return create_mock_weather_data(location)
+            raise WeatherAPIException(f"Connection error: {str(e)}")
+        except WeatherAPIException:
+            forecast_future.cancel()
+            raise
+        
+        try:
+            forecast_response = forecast_future.result(timeout=_time_left(deadline))
+            forecast_data = _read_forecast_response(forecast_response)
+        except (RequestException, ValueError, FutureTimeoutError) as e:
+            logger.error(f"Error fetching forecast data: {str(e)}")
+            # If we can't get forecast data but have current weather, continue with empty forecast
+            forecast_data = {'list': []}
+        
+        # Store under the key of any other location the provider resolved to the same city
+        if current_data.get('id'):
+            location = _register_city_id(location, current_data['id'])
+        
+        # Update the current WeatherData row from the API response
+        weather_data = _store_weather(_weather_fields(location, current_data, forecast_data))
+        
+        logger.info(f"Successfully fetched new weather data for {location}")
+        return weather_data
+        
+    except (WeatherAPIKeyMissingException, WeatherAPIException):
+        # Re-raise these specific exceptions for better error handling
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error processing weather data: {str(e)}")
+        if USE_MOCK_DATA:
+            logger.info(f"Using mock data for location: {location}")
+            return create_mock_weather_data(location)
+        raise
+
+
+def _register_city_id(location, city_id):
+    """
+    Record a location's city id with register_city_id, dropping any cached
+    weather for the location if it became an alias: its row was deleted and
+    the weather now lives under the canonical key.
+    
+    Returns:
+        str: The canonical key the weather should be stored under
+    """
+    canonical = register_city_id(location, city_id)
+    if canonical != location:
+        _weather_cache.delete(location)
+    return canonical
+
+
+def _record_upstream_response(response):
+    """
+    Count a provider response towards the circuit breaker. Server errors and
+    rate limiting count as failures; anything else shows the provider is up.
+    """
+    if response.status_code >= 500 or response.status_code == 429:
+        _circuit.record_failure()
+    else:
+        _circuit.record_success()
+
+
+def _acquire_quota(tokens):
+    """
+    Take tokens from the API quota shared by all workers. Background work
+    waits longer for them but may not use the reserve kept for page requests.
+    
+    Returns:
+        bool: False if the tokens did not become available in time
+    """
+    timeout = QUOTA_BACKGROUND_WAIT if is_background_priority() else QUOTA_INTERACTIVE_WAIT
+    return _quota.acquire(tokens, timeout=timeout)
+
+
+def _serve_without_fetching(location, error):
+    """
+    Get weather for a location without calling the provider, when the
+    circuit breaker is open or the quota is used up.
+    
+    Returns the stored row regardless of age, flagged as stale, or mock data
+    if there is none and mock data is enabled.
+    
+    Args:
+        location (str): The location to get weather for
+        error (WeatherAPIException): Why the provider is not called
+        
+    Raises:
+        WeatherAPIException: The given error, if there is nothing to fall back to
+    """
+    logger.warning(f"Not fetching weather for {location}: {str(error)}")
+    weather_data = WeatherData.objects.filter(location=location).first()
+    if weather_data:
+        weather_data.is_stale = True
+        return weather_data
+    if USE_MOCK_DATA:
+        logger.info(f"Using mock data for location: {location}")
+        return create_mock_weather_data(location)
+    raise error
+
+
+def get_circuit_breaker_stats():
+    """
+    Get the state of the weather API circuit breaker and its recent call counts.
+    
+    Returns:
+        dict: The circuit breaker statistics
+    """
+    return _circuit.stats()
+
+
+def _weather_requests(location, city_id=None):
+    """
+    Build the URLs and query parameters for the current weather and forecast requests.
+    
+    Args:
+        location (str): The location to get weather for
+        city_id (int): The provider's city id for the location, if known
+        
+    Returns:
+        tuple: (url, params) pairs for the current weather and forecast endpoints
+    """
+    # A city id is unambiguous, so prefer it over a free-text query
+    query = {'id': city_id} if city_id else {'q': location}
+    current_params = {
+        **query,
+        'appid': WEATHER_API_KEY,
+        'units': 'metric'  # Get temperature in Celsius
+    }
+    forecast_params = {
+        **query,
+        'appid': WEATHER_API_KEY,
+        'units': 'metric',
+        'cnt': 5  # Limit to 5 days data
+    }
+    return (
+        (f"{WEATHER_API_URL}/weather", current_params),
+        (f"{WEATHER_API_URL}/forecast", forecast_params),
+    )
+
+
+def _read_current_response(response, location):
+    """
+    Check a current weather response and decode its JSON body.
+    
+    Args:
+        response (requests.Response): The API response
+        location (str): The location that was requested
+        
+    Returns:
+        dict: The decoded current weather data
+        
+    Raises:
+        WeatherAPIException: For HTTP errors or an invalid response body
+    """
+    try:
+        response.raise_for_status()  # Raise exception for HTTP errors
+        return response.json()
+    except HTTPError as e:
+        # Check for specific error codes
+        if response.status_code == 401:
+            logger.error("Unauthorized: Invalid API key")
+            raise WeatherAPIException("Invalid API key")
+        elif response.status_code == 404:
+            logger.error(f"Location not found: {location}")
+            raise WeatherAPIException(f"Location not found: {location}")
+        elif response.status_code == 429:
+            logger.error("Rate limit exceeded")
+            raise WeatherAPIException("Rate limit exceeded")
+        else:
+            logger.error(f"HTTP error: {str(e)}")
+            raise WeatherAPIException(f"HTTP error: {str(e)}")
+    except ValueError as e:
+        logger.error(f"Invalid JSON response: {str(e)}")
+        raise WeatherAPIException(f"Invalid API response format: {str(e)}")
+
+
+def _read_forecast_response(response):
+    """
+    Check a forecast response and decode its JSON body.
+    
+    Raises:
+        requests.exceptions.HTTPError: For HTTP errors
+        ValueError: For an invalid response body
+    """
+    response.raise_for_status()
+    return response.json()
+
 
-class WeatherAPIException(WeatherServiceException):
-    """Exception raised for API errors"""
-    pass
+def _store_weather(fields, record_history=True):
+    """
+    Upsert the current weather for a location and append it to the history.
+    
+    Args:
+        fields (dict): WeatherData field values, including the location
+        record_history (bool): Whether to add the row to the history table
+        
+    Returns:
+        WeatherData: The current weather data object for the location
+    """
+    weather_data = _save_weather(fields, record_history)
+    _cache_weather(weather_data)
+    return weather_data
 
 
-def get_weather_for_location(location):
+async def _astore_weather(fields, record_history=True):
     """
-    Get weather data for a specific location.
-    First, tries to retrieve from cache (database), if recent enough.
-    If not available or outdated, fetches from the API.
+    Async version of _store_weather.
+    
+    The rows are written in a thread, since the async ORM cannot run the
+    two writes in one transaction.
+    """
+    weather_data = await sync_to_async(_save_weather)(fields, record_history)
+    await _acache_weather(weather_data)
+    return weather_data
+
+
+def _save_weather(fields, record_history):
+    """
+    Write the current weather row and its history row in one transaction.
+    """
+    defaults = dict(fields, retrieved_at=timezone.now())
+    location = defaults.pop('location')
+    
+    with transaction.atomic():
+        weather_data, _ = WeatherData.objects.update_or_create(location=location, defaults=defaults)
+        if record_history:
+            record_weather_history(weather_data)
+    return weather_data
+
+
+def _weather_fields(location, current_data, forecast_data):
+    """
+    Build WeatherData field values from decoded API responses.
+    
+    Args:
+        location (str): The location the data is for
+        current_data (dict): The decoded current weather response
+        forecast_data (dict): The decoded forecast response
+        
+    Returns:
+        dict: Keyword arguments for creating a WeatherData object
+    """
+    # Process forecast data (take the daily average from 3-hour forecasts)
+    daily_forecasts = process_forecast_data(forecast_data)
+    
+    return {
+        'location': location,
+        **_current_fields(current_data),
+        'forecast': daily_forecasts,
+    }
+
+
+def _current_fields(current_data):
+    """
+    Build the current-conditions WeatherData field values from one city's
+    current weather, as returned by the weather and group endpoints.
+    """
+    return {
+        'temperature': current_data.get('main', {}).get('temp', 0.0),
+        'conditions': current_data.get('weather', [{}])[0].get('main', 'Unknown'),
+    }
+
+
+async def aget_weather_for_location(location, deadline=None):
+    """
+    Async version of get_weather_for_location.
+    
+    Uses the async ORM for the cache lookup and afetch_weather_from_api on a
+    miss, so a slow upstream call does not block the event loop.
     
     Args:
         location (str): The location to get weather for
+        deadline (float): Optional time.monotonic() value, see render_deadline()
         
     Returns:
         WeatherData: The weather data object or None if unsuccessful
@@ -55,37 +925,167 @@ def get_weather_for_location(location):
         return None
     
     try:
-        # Check for cached data first
-        cached_weather = WeatherData.objects.filter(
-            location=location,
-            retrieved_at__gte=timezone.now() - timedelta(hours=CACHE_DURATION)
-        ).order_by('-retrieved_at').first()
+        location = await aresolve_location(location)
+        if not location:
+            logger.error("Location is blank after normalization")
+            return None
+        
+        cached_weather = await _weather_cache.aget(location)
+        if cached_weather is not None:
+            logger.debug(f"Retrieved in-process cached weather data for {location}")
+        else:
+            cached_weather = await _aget_recent_weather(location, max_age=CACHE_DURATION + STALE_GRACE)
+            if cached_weather:
+                logger.info(f"Retrieved cached weather data for {location}")
+                await _acache_weather(cached_weather)
         
         if cached_weather:
-            logger.info(f"Retrieved cached weather data for {location}")
-            return cached_weather
+            return _serve_cached_weather(cached_weather)
         
-        # If no recent data, fetch from API
-        try:
-            return fetch_weather_from_api(location)
-        except WeatherAPIKeyMissingException as e:
-            logger.error(f"API key missing: {str(e)}")
-            return None
-        except WeatherAPIException as e:
-            logger.error(f"API error: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error fetching weather: {str(e)}")
-            return None
+        if deadline is not None:
+            return (await _afetch_many_within([location], deadline)).get(location)
+        return await _afetch_or_none(location)
     
     except Exception as e:
         logger.error(f"Error getting weather for {location}: {str(e)}")
         return None
 
 
-def fetch_weather_from_api(location):
+async def aget_weather_for_locations(locations, deadline=None):
     """
-    Fetch weather data from OpenWeatherMap API.
+    Async version of get_weather_for_locations.
+    
+    Misses are fetched concurrently on the event loop with asyncio.gather.
+    """
+    locations = [location for location in dict.fromkeys(locations) if location]
+    if not locations:
+        return {}
+    
+    try:
+        keys = await aresolve_locations(locations)
+        weather, missing = await _asplit_cached_weather(set(keys.values()))
+        if missing:
+            async for weather_data in _recent_weather_rows(missing):
+                await _acache_weather(weather_data)
+                weather[weather_data.location] = _serve_cached_weather(weather_data)
+        
+        misses = [key for key in missing if key not in weather]
+        if deadline is not None:
+            weather.update(await _afetch_many_within(misses, deadline))
+        else:
+            results = await asyncio.gather(*(_afetch_or_none(key) for key in misses))
+            weather.update(zip(misses, results))
+    
+    except Exception as e:
+        logger.error(f"Error getting weather for {len(locations)} locations: {str(e)}")
+        return {location: None for location in locations}
+    
+    return {location: weather.get(keys.get(location)) for location in locations}
+
+
+async def _afetch_many_within(locations, deadline):
+    """
+    Async version of _fetch_many_within. Fetches still running at the
+    deadline carry on as tasks on the event loop.
+    """
+    if not locations:
+        return {}
+    
+    tasks = {location: asyncio.ensure_future(_afetch_or_none(location)) for location in locations}
+    for task in tasks.values():
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    await asyncio.wait(tasks.values(), timeout=_time_left(deadline))
+    
+    weather = {location: task.result() for location, task in tasks.items() if task.done()}
+    late = [location for location in locations if location not in weather]
+    if late:
+        logger.info(f"Weather for {', '.join(late)} not ready before the deadline")
+        async for weather_data in WeatherData.objects.filter(location__in=late):
+            weather_data.is_stale = True
+            weather[weather_data.location] = weather_data
+    return weather
+
+
+async def _afetch_or_none(location):
+    """
+    Async version of _fetch_or_none.
+    """
+    try:
+        return await afetch_weather_single_flight(location)
+    except WeatherAPIKeyMissingException as e:
+        logger.error(f"API key missing: {str(e)}")
+        return None
+    except WeatherAPIException as e:
+        logger.error(f"API error: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error fetching weather: {str(e)}")
+        return None
+
+
+async def _aget_recent_weather(location, max_age=CACHE_DURATION):
+    """
+    Async version of _get_recent_weather.
+    """
+    return await WeatherData.objects.filter(
+        location=location,
+        retrieved_at__gte=timezone.now() - timedelta(hours=max_age)
+    ).afirst()
+
+
+async def afetch_weather_single_flight(location):
+    """
+    Async version of fetch_weather_single_flight.
+    
+    Shares the in-flight registry with the sync version, so sync and async
+    callers in one process coalesce onto the same fetch. The cross-process
+    database lock is only taken on the sync path.
+    
+    Args:
+        location (str): The location to get weather for
+        
+    Returns:
+        WeatherData: The weather data object
+    """
+    with _inflight_lock:
+        flight = _inflight.get(location)
+        is_leader = flight is None
+        if is_leader:
+            flight = Future()
+            flight.set_running_or_notify_cancel()
+            _inflight[location] = flight
+    
+    if not is_leader:
+        logger.info(f"Waiting for in-flight weather fetch for {location}")
+        return await asyncio.wait_for(asyncio.wrap_future(flight), SINGLE_FLIGHT_TIMEOUT)
+    
+    try:
+        weather_data = await _aget_recent_weather(location)
+        if weather_data:
+            await _acache_weather(weather_data)
+        else:
+            weather_data = await afetch_weather_from_api(location)
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    else:
+        flight.set_result(weather_data)
+        return weather_data
+    finally:
+        with _inflight_lock:
+            _inflight.pop(location, None)
+
+
+async def afetch_weather_from_api(location):
+    """
+    Async version of fetch_weather_from_api.
+    
+    The upstream requests are made with the blocking pooled client on the
+    request thread pool (WEATHER_REQUEST_WORKERS threads, 8 by default) and
+    awaited without blocking the event loop. A slow upstream call therefore
+    still occupies one of those threads, and fetches beyond the pool size
+    wait for a free one. The result is stored in a thread, in a transaction.
     
     Args:
         location (str): The location to get weather for
@@ -102,100 +1102,139 @@ def fetch_weather_from_api(location):
         logger.error("Weather API key is not configured")
         if USE_MOCK_DATA:
             logger.info(f"Using mock data for location: {location}")
-            return create_mock_weather_data(location)
+            return await acreate_mock_weather_data(location)
         raise WeatherAPIKeyMissingException("Weather API key is not configured")
     
+    # The breaker's cache backend and the quota are synchronous-only
+    if not await sync_to_async(_circuit.allow)():
+        return await sync_to_async(_serve_without_fetching)(
+            location, WeatherCircuitOpenException("Weather API circuit breaker is open")
+        )
+    
+    if not await sync_to_async(_acquire_quota)(2):
+        return await sync_to_async(_serve_without_fetching)(
+            location, WeatherQuotaExceededException("Weather API quota exhausted")
+        )
+    
     try:
-        # OpenWeatherMap current weather endpoint
-        current_url = f"{WEATHER_API_URL}/weather"
-        
-        # Make API request for current weather
-        current_params = {
-            'q': location,
-            'appid': WEATHER_API_KEY,
-            'units': 'metric'  # Get temperature in Celsius
-        }
+        (current_url, current_params), (forecast_url, forecast_params) = _weather_requests(
+            location, await aget_city_id(location)
+        )
+        
+        deadline = time.monotonic() + FETCH_DEADLINE
+        client = get_weather_client()
+        current_future = asyncio.wrap_future(
+            _request_executor.submit(client.get, current_url, current_params, deadline)
+        )
+        forecast_future = asyncio.wrap_future(
+            _request_executor.submit(client.get, forecast_url, forecast_params, deadline)
+        )
         
         try:
-            # Set timeout to avoid hanging the application
-            current_response = requests.get(current_url, params=current_params, timeout=REQUEST_TIMEOUT)
-            current_response.raise_for_status()  # Raise exception for HTTP errors
-            current_data = current_response.json()
-        except (Timeout, ConnectionError) as e:
+            current_response = await asyncio.wait_for(current_future, _time_left(deadline))
+            await sync_to_async(_record_upstream_response)(current_response)
+            current_data = _read_current_response(current_response, location)
+        except (Timeout, ConnectionError, asyncio.TimeoutError) as e:
+            forecast_future.cancel()
+            await sync_to_async(_circuit.record_failure)()
             logger.error(f"Connection error or timeout for current weather API: {str(e)}")
             if USE_MOCK_DATA:
                 logger.info(f"Using mock data for location: {location}")
-                return create_mock_weather_data(location)
+                return await acreate_mock_weather_data(location)
             raise WeatherAPIException(f"Connection error: {str(e)}")
-        except HTTPError as e:
-            # Check for specific error codes
-            if current_response.status_code == 401:
-                logger.error("Unauthorized: Invalid API key")
-                raise WeatherAPIException("Invalid API key")
-            elif current_response.status_code == 404:
-                logger.error(f"Location not found: {location}")
-                raise WeatherAPIException(f"Location not found: {location}")
-            elif current_response.status_code == 429:
-                logger.error("Rate limit exceeded")
-                raise WeatherAPIException("Rate limit exceeded")
-            else:
-                logger.error(f"HTTP error: {str(e)}")
-                raise WeatherAPIException(f"HTTP error: {str(e)}")
-        except ValueError as e:
-            logger.error(f"Invalid JSON response: {str(e)}")
-            raise WeatherAPIException(f"Invalid API response format: {str(e)}")
-        
-        # Extract current weather information
-        temperature = current_data.get('main', {}).get('temp', 0.0)
-        conditions = current_data.get('weather', [{}])[0].get('main', 'Unknown')
-        description = current_data.get('weather', [{}])[0].get('description', '')
-        
-        # Fetch 5-day forecast
-        forecast_url = f"{WEATHER_API_URL}/forecast"
-        forecast_params = {
-            'q': location,
-            'appid': WEATHER_API_KEY,
-            'units': 'metric',
-            'cnt': 5  # Limit to 5 days data
-        }
+        except WeatherAPIException:
+            forecast_future.cancel()
+            raise
         
         try:
-            forecast_response = requests.get(forecast_url, params=forecast_params, timeout=REQUEST_TIMEOUT)
-            forecast_response.raise_for_status()
-            forecast_data = forecast_response.json()
-        except (RequestException, ValueError) as e:
+            forecast_response = await asyncio.wait_for(forecast_future, _time_left(deadline))
+            forecast_data = _read_forecast_response(forecast_response)
+        except (RequestException, ValueError, asyncio.TimeoutError) as e:
             logger.error(f"Error fetching forecast data: {str(e)}")
-            # If we can't get forecast data but have current weather, continue with empty forecast
             forecast_data = {'list': []}
         
-        # Process forecast data (take the daily average from 3-hour forecasts)
-        daily_forecasts = process_forecast_data(forecast_data)
-        
-        # Store forecast as JSON string
-        forecast_json = json.dumps(daily_forecasts)
+        if current_data.get('id'):
+            location = await sync_to_async(_register_city_id)(location, current_data['id'])
         
-        # Create new WeatherData object from API response
-        weather_data = WeatherData.objects.create(
-            location=location,
-            temperature=temperature,
-            conditions=conditions,
-            forecast=forecast_json
-        )
+        weather_data = await _astore_weather(_weather_fields(location, current_data, forecast_data))
         
         logger.info(f"Successfully fetched new weather data for {location}")
         return weather_data
-        
+    
     except (WeatherAPIKeyMissingException, WeatherAPIException):
-        # Re-raise these specific exceptions for better error handling
         raise
     except Exception as e:
         logger.error(f"Unexpected error processing weather data: {str(e)}")
         if USE_MOCK_DATA:
             logger.info(f"Using mock data for location: {location}")
-            return create_mock_weather_data(location)
+            return await acreate_mock_weather_data(location)
         raise
 
 
+def _cache_weather(weather_data):
+    """
+    Store a WeatherData object in the in-process cache until it falls outside
+    CACHE_DURATION plus the stale grace window, replacing any older entry for
+    the same location.
+    
+    Args:
+        weather_data (WeatherData): The weather data object to cache
+    """
+    if not weather_data or not weather_data.retrieved_at:
+        return
+    
+    remaining = _cache_timeout(weather_data)
+    if remaining > 0:
+        _weather_cache.set(weather_data.location, weather_data, remaining)
+    else:
+        _weather_cache.delete(weather_data.location)
+
+
+async def _acache_weather(weather_data):
+    """
+    Async version of _cache_weather, safe to call from the event loop
+    whatever the cache backend.
+    """
+    if not weather_data or not weather_data.retrieved_at:
+        return
+    
+    remaining = _cache_timeout(weather_data)
+    if remaining > 0:
+        await _weather_cache.aset(weather_data.location, weather_data, remaining)
+    else:
+        await _weather_cache.adelete(weather_data.location)
+
+
+def _cache_timeout(weather_data):
+    """
+    Get the seconds left until a row falls outside CACHE_DURATION plus the
+    stale grace window.
+    """
+    expires_at = weather_data.retrieved_at + timedelta(hours=CACHE_DURATION + STALE_GRACE)
+    return (expires_at - timezone.now()).total_seconds()
+
+
+def clear_weather_cache():
+    """
+    Empty the weather cache and reset its counters, along with the
+    cached location aliases.
+    """
+    _weather_cache.clear()
+    clear_location_caches()
+
+
+def get_weather_cache_stats():
+    """
+    Get hit/miss counters and the current size of the weather cache.
+    
+    Returns:
+        dict: The cache statistics, empty if the configured cache backend
+            does not report any
+    """
+    stats = getattr(_weather_cache, 'stats', None)
+    return stats() if stats else {}
+
+
 def create_mock_weather_data(location):
     """
     Create mock weather data when the API is unavailable.
@@ -206,6 +1245,32 @@ def create_mock_weather_data(location):
     Returns:
         WeatherData: A new WeatherData object with mock data
     """
+    weather_data = _store_weather(_mock_weather_fields(location), record_history=False)
+    
+    logger.info(f"Created mock weather data for {location}")
+    return weather_data
+
+
+async def acreate_mock_weather_data(location):
+    """
+    Async version of create_mock_weather_data.
+    """
+    weather_data = await _astore_weather(_mock_weather_fields(location), record_history=False)
+    
+    logger.info(f"Created mock weather data for {location}")
+    return weather_data
+
+
+def _mock_weather_fields(location):
+    """
+    Generate random WeatherData field values for a location.
+    
+    Args:
+        location (str): The location to create mock data for
+        
+    Returns:
+        dict: Keyword arguments for creating a WeatherData object
+    """
     import random
     
     # Mock conditions
@@ -236,19 +1301,12 @@ def create_mock_weather_data(location):
             'description': forecast_condition.lower()
         })
     
-    # Store forecast as JSON string
-    forecast_json = json.dumps(mock_forecast)
-    
-    # Create mock WeatherData object
-    weather_data = WeatherData.objects.create(
-        location=location,
-        temperature=temperature,
-        conditions=condition,
-        forecast=forecast_json
-    )
-    
-    logger.info(f"Created mock weather data for {location}")
-    return weather_data
+    return {
+        'location': location,
+        'temperature': temperature,
+        'conditions': condition,
+        'forecast': mock_forecast,
+    }
 
 
 def process_forecast_data(forecast_data):
@@ -315,7 +1373,10 @@ def process_forecast_data(forecast_data):
 
 def get_forecast_from_weather_data(weather_data):
     """
-    Parse the forecast JSON from a WeatherData object.
+    Get the daily forecast from a WeatherData object.
+    
+    The forecast is stored as JSON and decoded by the database layer, and the
+    result is memoized on the instance, so repeated calls are cheap.
     
     Args:
         weather_data (WeatherData): The weather data object
@@ -323,30 +1384,306 @@ def get_forecast_from_weather_data(weather_data):
     Returns:
         list: A list of daily forecast dictionaries
     """
-    if not weather_data or not weather_data.forecast:
+    if not weather_data:
         return []
     
-    try:
-        return json.loads(weather_data.forecast)
-    except json.JSONDecodeError:
-        logger.error(f"Error decoding forecast JSON for {weather_data.location}")
-        return []
+    return weather_data.daily_forecast
+
+
+def get_refresh_locations(include_activities=False):
+    """
+    Get the locations whose weather is worth refreshing.
+    
+    Only destinations of ongoing and upcoming trips are included (plus their
+    activity locations if requested), resolved to their canonical keys so
+    each city is fetched once. Locations never fetched or fetched
+    longest ago come first, then those whose trips start soonest.
+    
+    Args:
+        include_activities (bool): Also include locations of those trips' activities
+        
+    Returns:
+        list: The canonical location keys in refresh order
+    """
+    today = timezone.now().date()
+    
+    # Earliest start date of an active trip for each location
+    next_start = {}
+    rows = list(
+        Trip.objects.filter(end_date__gte=today)
+        .values_list('destination')
+        .annotate(start=Min('start_date'))
+    )
+    if include_activities:
+        rows += list(
+            Activity.objects.filter(trip__end_date__gte=today)
+            .values_list('location')
+            .annotate(start=Min('trip__start_date'))
+        )
+    canonical = resolve_locations(location for location, _ in rows)
+    for location, start in rows:
+        key = canonical.get(location)
+        if key and (key not in next_start or start < next_start[key]):
+            next_start[key] = start
+    
+    last_fetched = dict(
+        WeatherData.objects.filter(location__in=list(next_start))
+        .values_list('location', 'retrieved_at')
+    )
+    
+    def staleness(location):
+        retrieved_at = last_fetched.get(location)
+        return (retrieved_at.timestamp() if retrieved_at else float('-inf'), next_start[location])
+    
+    return sorted(next_start, key=staleness)
 
 
-def refresh_weather_data():
+def refresh_weather_data(locations=None, max_workers=REFRESH_WORKERS,
+                         rate_limit=REFRESH_RATE_LIMIT, include_activities=False,
+                         batch_size=GROUP_BATCH_SIZE):
     """
-    Utility function to refresh weather data for all known locations.
+    Utility function to refresh weather data for locations in use.
     This could be called by a periodic task/cron job.
     
+    Locations with a known city id and a forecast that is still current are
+    refreshed in batches through the provider's group endpoint, one call per
+    batch_size locations. The rest get a full individual fetch. Work is done
+    by a bounded pool of worker threads, paced so that no more than
+    rate_limit API calls start per second, and draws on the shared API
+    quota with background priority.
+    
+    Args:
+        locations (list): The locations to refresh; defaults to get_refresh_locations()
+        max_workers (int): Number of concurrent fetches; 1 fetches in the calling thread
+        rate_limit (float): Maximum fetches started per second; None or 0 for no limit
+        include_activities (bool): Passed to get_refresh_locations() when locations is None
+        batch_size (int): Locations per group call, capped at MAX_GROUP_BATCH_SIZE;
+            0 or 1 disables group calls
+        
+    Returns:
+        dict: Totals plus a per-location list of outcome, timing and error
+    """
+    batch_size = min(batch_size, MAX_GROUP_BATCH_SIZE)
+    if locations is None:
+        locations = get_refresh_locations(include_activities=include_activities)
+    else:
+        # Resolve to canonical keys, dropping duplicates but keeping the given order
+        locations = list(dict.fromkeys(resolve_locations(locations).values()))
+    
+    limiter = RateLimiter(rate_limit)
+    started = time.monotonic()
+    
+    grouped = list(_group_refresh_city_ids(locations).items()) if batch_size > 1 else []
+    tasks = [
+        (_refresh_group, grouped[start:start + batch_size])
+        for start in range(0, len(grouped), max(batch_size, 1))
+    ]
+    grouped_locations = {location for location, _ in grouped}
+    tasks += [(_refresh_location, location) for location in locations if location not in grouped_locations]
+    
+    if max_workers <= 1 or len(tasks) <= 1:
+        with background_priority():
+            outcomes = [func(arg, limiter) for func, arg in tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='weather-refresh') as executor:
+            outcomes = list(executor.map(
+                lambda task: _in_worker_thread(_in_background, task[0], task[1], limiter),
+                tasks
+            ))
+    
+    # Report in the order the locations were given
+    by_location = {}
+    for outcome in outcomes:
+        for result in outcome if isinstance(outcome, list) else [outcome]:
+            by_location[result['location']] = result
+    results = [by_location[location] for location in locations]
+    
+    refreshed = sum(1 for result in results if result['status'] == 'ok')
+    return {
+        'total': len(results),
+        'refreshed': refreshed,
+        'failed': len(results) - refreshed,
+        'duration': round(time.monotonic() - started, 3),
+        'locations': results,
+    }
+
+
+def _group_refresh_city_ids(locations):
+    """
+    Pick the locations that can be refreshed through the group endpoint.
+    
+    The group endpoint only returns current conditions, so a location
+    qualifies when its city id is known and its stored forecast still starts
+    today or later; otherwise it needs a full fetch.
+    
+    Args:
+        locations (list): Canonical location keys
+        
+    Returns:
+        dict: The qualifying locations mapped to their city ids
+    """
+    if not WEATHER_API_KEY or WEATHER_API_KEY == 'your_weather_api_key':
+        return {}
+    
+    city_ids = dict(
+        LocationAlias.objects.filter(canonical__in=locations, city_id__isnull=False)
+        .values_list('canonical', 'city_id')
+    )
+    today = timezone.localdate().isoformat()
+    current = WeatherData.objects.filter(location__in=list(city_ids)).values_list('location', 'forecast')
+    return {
+        location: city_ids[location]
+        for location, forecast in current
+        if isinstance(forecast, list) and forecast and forecast[0].get('date', '') >= today
+    }
+
+
+def _refresh_group(batch, limiter):
+    """
+    Refresh current conditions for a batch of locations with one group call.
+    
+    Args:
+        batch (list): (location, city id) pairs
+        limiter (RateLimiter): Paces the API call
+        
+    Returns:
+        list: The location, status ('ok' or 'failed'), duration and any error for each location
+    """
+    limiter.acquire()
+    started = time.monotonic()
+    stored = set()
+    error = None
+    try:
+        if not _circuit.allow():
+            raise WeatherCircuitOpenException("Weather API circuit breaker is open")
+        if not _acquire_quota(1):
+            raise WeatherQuotaExceededException("Weather API quota exhausted")
+        try:
+            response = get_weather_client().get(
+                f"{WEATHER_API_URL}/group",
+                {
+                    'id': ','.join(str(city_id) for _, city_id in batch),
+                    'appid': WEATHER_API_KEY,
+                    'units': 'metric'
+                },
+                time.monotonic() + FETCH_DEADLINE
+            )
+        except (Timeout, ConnectionError):
+            _circuit.record_failure()
+            raise
+        _record_upstream_response(response)
+        data = _read_current_response(response, ', '.join(location for location, _ in batch))
+        by_city_id = {item.get('id'): item for item in data.get('list', [])}
+        stored = _store_current_weather_batch({
+            location: by_city_id[city_id] for location, city_id in batch if city_id in by_city_id
+        })
+    except Exception as e:
+        logger.error(f"Error refreshing weather for {len(batch)} locations: {str(e)}")
+        error = str(e)
+    
+    duration = round(time.monotonic() - started, 3)
+    return [
+        {
+            'location': location,
+            'status': 'ok' if location in stored else 'failed',
+            'duration': duration,
+            'error': None if location in stored else error or "Missing from group response",
+        }
+        for location, _ in batch
+    ]
+
+
+def _store_current_weather_batch(current_by_location):
+    """
+    Upsert current conditions for several locations with one INSERT ... ON
+    CONFLICT, keeping each location's stored forecast, and append them to
+    the history.
+    
+    Args:
+        current_by_location (dict): Locations mapped to their current weather data
+        
     Returns:
-        int: The number of locations successfully refreshed
+        set: The locations that were stored
+    """
+    if not current_by_location:
+        return set()
+    
+    now = timezone.now()
+    forecasts = dict(
+        WeatherData.objects.filter(location__in=list(current_by_location)).values_list('location', 'forecast')
+    )
+    rows = [
+        WeatherData(
+            location=location,
+            forecast=forecasts.get(location, []),
+            retrieved_at=now,
+            **_current_fields(current_data)
+        )
+        for location, current_data in current_by_location.items()
+    ]
+    
+    with transaction.atomic():
+        WeatherData.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['location'],
+            update_fields=['temperature', 'conditions', 'retrieved_at'],
+        )
+        record_weather_history_batch(rows)
+    
+    # The upserted objects may not carry the stored primary keys, so drop
+    # cached entries and let the next lookup read the new rows
+    for location in current_by_location:
+        _weather_cache.delete(location)
+    return set(current_by_location)
+
+
+def _refresh_location(location, limiter):
     """
-    # Get distinct locations we have stored
-    locations = WeatherData.objects.values_list('location', flat=True).distinct()
+    Fetch fresh weather for one location and record how it went.
     
-    success_count = 0
-    for location in locations:
-        if fetch_weather_from_api(location):
-            success_count += 1
+    The fetch is coalesced with any other fetch of the location, such as
+    one for a page request, in this or another worker process; only a row
+    stored after the refresh started is reused.
+    
+    Returns:
+        dict: The location, its status ('ok' or 'failed'), duration and any error
+    """
+    limiter.acquire()
+    started = time.monotonic()
+    error = None
+    try:
+        weather_data = fetch_weather_single_flight(location, fresh_since=timezone.now())
+        if weather_data and weather_data.is_stale:
+            # The stored row was served because the provider could not be called
+            error = "Weather API unavailable"
+            weather_data = None
+    except Exception as e:
+        logger.error(f"Error refreshing weather for {location}: {str(e)}")
+        weather_data = None
+        error = str(e)
     
-    return success_count
\ No newline at end of file
+    return {
+        'location': location,
+        'status': 'ok' if weather_data else 'failed',
+        'duration': round(time.monotonic() - started, 3),
+        'error': error,
+    }
+
+
+def _in_background(func, *args):
+    """
+    Run func with background priority for the API quota.
+    """
+    with background_priority():
+        return func(*args)
+
+
+def _in_worker_thread(func, *args):
+    """
+    Run func in a pool thread, closing the thread's database connections afterwards.
+    """
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
@@ -1,20 +1,144 @@
+import asyncio
 import json
-from unittest.mock import patch, Mock
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import warnings
+from unittest.mock import AsyncMock, patch, Mock
+from urllib.parse import urlparse, parse_qs
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
 from django.test import TestCase
 from django.utils import timezone
 from datetime import timedelta
 
-from weather.models import WeatherData
+from requests.exceptions import ConnectionError, Timeout
+
+from itineraries.models import Activity
+from trips.models import Trip
+from weather.cache import HashedKeyCache, SharedMemoryCache, TTLCache
+from weather.checks import check_circuit_cache_table
+from weather.circuit import CIRCUIT_CACHE, CircuitBreaker
+from weather.client import WeatherHTTPClient
+from weather.ratelimit import RateLimiter, TokenBucket, background_priority
+from weather.history import prune_weather_history
+from weather.locations import normalize_location, resolve_location
+from weather.models import LocationAlias, WeatherData, WeatherHistory
+from weather import services
 from weather.services import (
     get_weather_for_location,
+    get_weather_for_locations,
+    aget_weather_for_location,
+    aget_weather_for_locations,
     fetch_weather_from_api,
+    create_mock_weather_data,
     process_forecast_data,
     get_forecast_from_weather_data,
+    clear_weather_cache,
+    get_weather_cache_stats,
+    fetch_weather_single_flight,
+    get_refresh_locations,
+    refresh_weather_data,
+    is_weather_pending,
     WeatherAPIKeyMissingException,
     WeatherAPIException
 )
 
 
+
+class FakeWeatherServer:
+    """
+    Local stand-in for the OpenWeatherMap API, served from a background thread.
+    
+    Usage:
+    with FakeWeatherServer(delay=0.2) as server:
+        with patch('weather.services.WEATHER_API_URL', server.url):
+            ...
+    """
+    
+    def __init__(self, delay=0, temperature=15.0, conditions='Clouds', city_id=None):
+        self.delay = delay
+        self.temperature = temperature
+        self.conditions = conditions
+        self.city_id = city_id
+        self.requests = []
+    
+    def current_weather(self, query):
+        data = {
+            'main': {'temp': self.temperature},
+            'weather': [{'main': self.conditions, 'description': self.conditions.lower()}],
+        }
+        if self.city_id:
+            data['id'] = self.city_id
+        return data
+    
+    def forecast(self, query):
+        return {'list': [{
+            'dt_txt': '2023-01-01 12:00:00',
+            'main': {'temp': self.temperature},
+            'weather': [{'main': self.conditions, 'description': self.conditions.lower()}],
+        }]}
+    
+    def group(self, query):
+        city_ids = [int(city_id) for city_id in query['id'].split(',')]
+        return {'cnt': len(city_ids), 'list': [
+            dict(self.current_weather(query), id=city_id) for city_id in city_ids
+        ]}
+    
+    def handle(self, path, query):
+        """Return (status, body) for a request."""
+        routes = {
+            '/weather': self.current_weather,
+            '/forecast': self.forecast,
+            '/group': self.group,
+        }
+        if path not in routes:
+            return 404, {'message': 'not found'}
+        return 200, routes[path](query)
+    
+    def __enter__(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                server.requests.append((parsed.path, query))
+                time.sleep(server.delay)
+                status, body = server.handle(parsed.path, query)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+    
+    def paths(self):
+        return [path for path, query in self.requests]
+
 class WeatherModelTest(TestCase):
     """Test cases for the WeatherData model."""
     
@@ -33,6 +157,17 @@ class WeatherModelTest(TestCase):
         self.assertIn("Sunny", weather.forecast)
         self.assertIsNotNone(weather.retrieved_at)
     
+    def test_forecast_is_stored_as_structured_data(self):
+        """Test that the forecast round-trips as a list and is parsed once per instance."""
+        forecast = [{"date": "2023-01-01", "temperature": 19.0, "condition": "Sunny"}]
+        WeatherData.objects.create(location="london", temperature=20.5, conditions="Sunny", forecast=forecast)
+        
+        weather = WeatherData.objects.get(location="london")
+        
+        self.assertEqual(weather.forecast, forecast)
+        self.assertEqual(get_forecast_from_weather_data(weather), forecast)
+        self.assertIs(get_forecast_from_weather_data(weather), get_forecast_from_weather_data(weather))
+    
     def test_weather_data_string_representation(self):
         """Test the string representation of a WeatherData record."""
         weather = WeatherData.objects.create(
@@ -52,9 +187,11 @@ class WeatherServiceTest(TestCase):
     
     def setUp(self):
         """Set up test data."""
+        clear_weather_cache()
+        
         # Create a test weather record for caching tests
         self.test_weather = WeatherData.objects.create(
-            location="Paris",
+            location="paris",
             temperature=22.0,
             conditions="Clear",
             forecast=json.dumps([{"date": "2023-01-01", "temperature": 21.0, "condition": "Clear"}]),
@@ -85,7 +222,7 @@ class WeatherServiceTest(TestCase):
         # This should call the API function
         result = get_weather_for_location("Rome")
         
-        mock_fetch.assert_called_once_with("Rome")
+        mock_fetch.assert_called_once_with("rome")
         self.assertEqual(result, mock_weather)
     
     @patch('weather.services.fetch_weather_from_api')
@@ -93,7 +230,7 @@ class WeatherServiceTest(TestCase):
         """Test retrieving weather when cache is expired."""
         # Create an expired weather record
         expired_weather = WeatherData.objects.create(
-            location="Madrid",
+            location="madrid",
             temperature=30.0,
             conditions="Hot",
             forecast="{}",
@@ -112,20 +249,20 @@ class WeatherServiceTest(TestCase):
         # This should call the API function due to expired cache
         result = get_weather_for_location("Madrid")
         
-        mock_fetch.assert_called_once_with("Madrid")
+        mock_fetch.assert_called_once_with("madrid")
         self.assertEqual(result, mock_weather)
     
-    @patch('weather.services.requests.get')
+    @patch('weather.client.requests.Session.get')
     def test_fetch_weather_from_api_success(self, mock_get):
         """Test successful API fetch."""
         # Mock the API responses
-        mock_current_response = Mock()
+        mock_current_response = Mock(status_code=200)
         mock_current_response.json.return_value = {
             'main': {'temp': 18.5},
             'weather': [{'main': 'Clouds', 'description': 'scattered clouds'}]
         }
         
-        mock_forecast_response = Mock()
+        mock_forecast_response = Mock(status_code=200)
         mock_forecast_response.json.return_value = {
             'list': [
                 {
@@ -236,4 +373,1275 @@ class WeatherServiceTest(TestCase):
             conditions="Unknown",
             forecast="not-valid-json"
         )
-        self.assertEqual(get_forecast_from_weather_data(weather), [])
\ No newline at end of file
+        self.assertEqual(get_forecast_from_weather_data(weather), [])
+
+
+class TTLCacheTest(TestCase):
+    """Test cases for the in-process TTL cache."""
+    
+    def test_get_and_set(self):
+        """Test storing and retrieving a value."""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted when full."""
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3)
+        
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+    
+    @patch('weather.cache.time.monotonic')
+    def test_entry_expires(self, mock_monotonic):
+        """Test that entries are dropped once their timeout has passed."""
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache()
+        cache.set("a", 1, timeout=10)
+        
+        mock_monotonic.return_value = 1011.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class SharedMemoryCacheTest(TestCase):
+    """Test cases for the memory-mapped cache shared between worker processes."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'weather-cache')
+    
+    def make_cache(self, slots=16, slot_size=1024):
+        return SharedMemoryCache(self.path, {'OPTIONS': {'SLOTS': slots, 'SLOT_SIZE': slot_size}})
+    
+    def test_entries_are_shared_between_instances(self):
+        """Test that a value written by one worker is read by another."""
+        writer = self.make_cache()
+        reader = self.make_cache()
+        writer.set("paris", {"temperature": 21.5})
+        
+        self.assertEqual(reader.get("paris"), {"temperature": 21.5})
+        self.assertIsNone(reader.get("missing"))
+        self.assertEqual(reader.stats()['hits'], 1)
+        self.assertEqual(reader.stats()['size'], 1)
+        
+        writer.delete("paris")
+        self.assertIsNone(reader.get("paris"))
+    
+    @patch('weather.cache.time.time')
+    def test_entry_expires(self, mock_time):
+        """Test that entries are dropped once their timeout has passed."""
+        mock_time.return_value = 1000.0
+        cache = self.make_cache()
+        cache.set("a", 1, timeout=10)
+        self.assertFalse(cache.add("a", 2))
+        
+        mock_time.return_value = 1011.0
+        self.assertIsNone(cache.get("a"))
+        self.assertTrue(cache.add("a", 2))
+        self.assertEqual(cache.get("a"), 2)
+    
+    @patch('weather.cache.time.time')
+    def test_lru_eviction(self, mock_time):
+        """Test that the least recently used slot is reused when all are taken."""
+        cache = self.make_cache(slots=2)
+        mock_time.return_value = 1000.0
+        cache.set("a", 1)
+        mock_time.return_value = 1001.0
+        cache.set("b", 2)
+        mock_time.return_value = 1002.0
+        cache.get("a")  # "b" is now least recently used
+        mock_time.return_value = 1003.0
+        cache.set("c", 3)
+        
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+    
+    def test_oversized_value_is_not_cached(self):
+        """Test that values larger than a slot are skipped."""
+        cache = self.make_cache(slot_size=256)
+        cache.set("big", "x" * 1000)
+        
+        self.assertIsNone(cache.get("big"))
+    
+    def test_oversized_set_drops_existing_value(self):
+        """Test that setting a value too large for a slot evicts the key's old value."""
+        cache = self.make_cache(slot_size=512)
+        cache.set("k", "old")
+        cache.set("k", "x" * 5000)
+        
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()['size'], 0)
+    
+    def test_get_leaves_slot_unchanged(self):
+        """Test that reads record recency outside the seqlocked slot."""
+        cache = self.make_cache()
+        cache.set("a", 1)
+        index = cache._find(":1:a")[0]
+        offset = cache._offset(index)
+        before = cache._map()[offset:offset + cache.slot_size]
+        
+        with patch('weather.cache.time.time', return_value=time.time() + 5):
+            self.assertEqual(cache.get("a"), 1)
+        
+        self.assertEqual(cache._map()[offset:offset + cache.slot_size], before)
+        self.assertGreater(cache._last_used(index), time.time())
+    
+    def test_changed_layout_starts_empty(self):
+        """Test that a file created with other slot settings is reinitialized."""
+        self.make_cache().set("a", 1)
+        
+        self.assertIsNone(self.make_cache(slots=32).get("a"))
+    
+    def test_weather_lookup_uses_shared_cache(self):
+        """Test that the weather service can use the shared cache backend."""
+        cache = HashedKeyCache(self.make_cache(slot_size=4096), prefix='weather')
+        WeatherData.objects.create(
+            location="new york",
+            temperature=24.0,
+            conditions="Clear",
+            forecast=[{"date": "2024-06-01", "temperature": 25.0}]
+        )
+        
+        with patch('weather.services._weather_cache', cache), warnings.catch_warnings():
+            # Location keys with spaces must not trip Django's key validation
+            warnings.simplefilter('error', CacheKeyWarning)
+            first = get_weather_for_location("New York")
+            
+            with self.assertNumQueries(0):
+                second = get_weather_for_location("New York")
+        
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.daily_forecast, first.daily_forecast)
+    
+    async def test_async_lookup_uses_backend_async_api(self):
+        """Test that the async weather lookup never calls a cache backend's sync methods."""
+        weather = WeatherData(location="porto", temperature=19.0, conditions="Clouds", retrieved_at=timezone.now())
+        # Sync calls into a database-backed cache would fail on the event loop
+        backend = Mock(spec=['get', 'aget', 'set', 'aset', 'delete', 'adelete'])
+        backend.get.side_effect = AssertionError("sync cache access from async code")
+        backend.aget = AsyncMock(return_value=weather)
+        cache = HashedKeyCache(backend, prefix='weather')
+        
+        with patch('weather.services._weather_cache', cache):
+            result = await aget_weather_for_location("Porto")
+        
+        self.assertIs(result, weather)
+        backend.aget.assert_awaited_once_with(cache.make_key("porto"), None)
+
+
+class WeatherInProcessCacheTest(TestCase):
+    """Test cases for the in-process cache in front of the weather lookup."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.weather = WeatherData.objects.create(
+            location="lisbon",
+            temperature=24.0,
+            conditions="Clear",
+            forecast="[]"
+        )
+    
+    def test_repeat_lookup_skips_database(self):
+        """Test that a second lookup is served without any queries."""
+        first = get_weather_for_location("Lisbon")
+        
+        with self.assertNumQueries(0):
+            second = get_weather_for_location("Lisbon")
+        
+        self.assertEqual(first.id, self.weather.id)
+        self.assertIs(second, first)
+        self.assertEqual(get_weather_cache_stats()['hits'], 1)
+    
+    def test_new_row_replaces_cached_entry(self):
+        """Test that writing fresher weather data invalidates the cached row."""
+        get_weather_for_location("Lisbon")
+        
+        with patch('weather.services.WEATHER_API_KEY', ''):
+            fresh = create_mock_weather_data("lisbon")
+        
+        self.assertIs(get_weather_for_location("Lisbon"), fresh)
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_expired_row_is_not_cached(self, mock_fetch):
+        """Test that rows outside CACHE_DURATION are not served from the cache."""
+        WeatherData.objects.filter(pk=self.weather.pk).update(
+            retrieved_at=timezone.now() - timedelta(hours=4)
+        )
+        mock_fetch.return_value = None
+        
+        get_weather_for_location("Lisbon")
+        
+        mock_fetch.assert_called_once_with("lisbon")
+
+
+class SingleFlightTest(TestCase):
+    """Test cases for coalescing concurrent weather fetches."""
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    def _run_concurrently(self, count):
+        """Call fetch_weather_single_flight from several threads at once."""
+        results = []
+        errors = []
+        
+        def worker():
+            try:
+                results.append(fetch_weather_single_flight("Oslo"))
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results, errors
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_concurrent_misses_share_one_fetch(self, mock_fetch, mock_recent):
+        """Test that concurrent callers for one location trigger a single fetch."""
+        started = threading.Event()
+        release = threading.Event()
+        weather = WeatherData(location="Oslo", temperature=5.0, conditions="Snow", forecast="[]")
+        
+        def slow_fetch(location):
+            started.set()
+            release.wait(5)
+            return weather
+        
+        mock_fetch.side_effect = slow_fetch
+        
+        leader, results, errors = self._run_concurrently(1)
+        started.wait(5)
+        followers, _, _ = self._run_concurrently(4)
+        time.sleep(0.2)
+        release.set()
+        for thread in leader + followers:
+            thread.join(5)
+        
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual(errors, [])
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_followers_receive_leader_exception(self, mock_fetch, mock_recent):
+        """Test that a failed fetch is reported to every waiting caller."""
+        started = threading.Event()
+        release = threading.Event()
+        
+        def failing_fetch(location):
+            started.set()
+            release.wait(5)
+            raise WeatherAPIException("Rate limit exceeded")
+        
+        mock_fetch.side_effect = failing_fetch
+        
+        leader, _, leader_errors = self._run_concurrently(1)
+        started.wait(5)
+        followers, _, follower_errors = self._run_concurrently(2)
+        time.sleep(0.2)
+        release.set()
+        for thread in leader + followers:
+            thread.join(5)
+        
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual(len(leader_errors + follower_errors), 3)
+        self.assertTrue(all(isinstance(e, WeatherAPIException) for e in follower_errors))
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_reuses_row_stored_by_another_worker(self, mock_fetch):
+        """Test that the leader re-checks the database before calling the API."""
+        weather = WeatherData.objects.create(
+            location="Oslo",
+            temperature=5.0,
+            conditions="Snow",
+            forecast="[]"
+        )
+        
+        result = fetch_weather_single_flight("Oslo")
+        
+        self.assertEqual(result.id, weather.id)
+        mock_fetch.assert_not_called()
+
+
+@patch('weather.client.time.sleep')
+@patch('weather.client.requests.Session.get')
+class WeatherHTTPClientTest(TestCase):
+    """Test cases for the pooled, retrying weather HTTP client."""
+    
+    def _response(self, status_code, headers=None):
+        return Mock(status_code=status_code, headers=headers or {})
+    
+    def test_success_is_not_retried(self, mock_get, mock_sleep):
+        """Test that a successful response is returned immediately."""
+        mock_get.return_value = self._response(200)
+        
+        response = WeatherHTTPClient().get("https://test.com/weather", params={'q': 'Paris'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(mock_get.call_args.kwargs['timeout'], (3.05, 5))
+        mock_sleep.assert_not_called()
+    
+    def test_server_error_is_retried_with_backoff(self, mock_get, mock_sleep):
+        """Test that 5xx responses are retried until one succeeds."""
+        mock_get.side_effect = [self._response(503), self._response(502), self._response(200)]
+        
+        response = WeatherHTTPClient(max_retries=2, backoff_factor=1).get("https://test.com/weather")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_count, 3)
+        delays = [c.args[0] for c in mock_sleep.call_args_list]
+        self.assertTrue(0 <= delays[0] <= 1)
+        self.assertTrue(0 <= delays[1] <= 2)
+    
+    def test_server_error_returned_when_retries_exhausted(self, mock_get, mock_sleep):
+        """Test that the last error response is returned after the final retry."""
+        mock_get.return_value = self._response(500)
+        
+        response = WeatherHTTPClient(max_retries=1).get("https://test.com/weather")
+        
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(mock_get.call_count, 2)
+    
+    def test_rate_limit_respects_retry_after(self, mock_get, mock_sleep):
+        """Test that a 429 response is retried after its Retry-After delay."""
+        mock_get.side_effect = [self._response(429, {'Retry-After': '2'}), self._response(200)]
+        
+        response = WeatherHTTPClient().get("https://test.com/weather")
+        
+        self.assertEqual(response.status_code, 200)
+        mock_sleep.assert_called_once_with(2.0)
+    
+    def test_long_retry_after_is_not_waited_for(self, mock_get, mock_sleep):
+        """Test that a 429 asking for a long wait is returned without retrying."""
+        mock_get.return_value = self._response(429, {'Retry-After': '3600'})
+        
+        response = WeatherHTTPClient(retry_after_max=10).get("https://test.com/weather")
+        
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(mock_get.call_count, 1)
+        mock_sleep.assert_not_called()
+    
+    def test_no_retry_past_deadline(self, mock_get, mock_sleep):
+        """Test that retries are skipped when they would overrun the deadline."""
+        mock_get.return_value = self._response(503)
+        
+        response = WeatherHTTPClient(max_retries=3, backoff_factor=1).get(
+            "https://test.com/weather", deadline=time.monotonic() + 0.001
+        )
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_get.call_count, 1)
+    
+    def test_expired_deadline_raises_timeout(self, mock_get, mock_sleep):
+        """Test that no request is made once the deadline has passed."""
+        with self.assertRaises(Timeout):
+            WeatherHTTPClient().get("https://test.com/weather", deadline=time.monotonic() - 1)
+        
+        mock_get.assert_not_called()
+    
+    def test_connection_error_raised_when_retries_exhausted(self, mock_get, mock_sleep):
+        """Test that connection errors are retried and then re-raised."""
+        mock_get.side_effect = ConnectionError("refused")
+        
+        with self.assertRaises(ConnectionError):
+            WeatherHTTPClient(max_retries=2).get("https://test.com/weather")
+        
+        self.assertEqual(mock_get.call_count, 3)
+
+
+@patch('weather.services.WEATHER_API_URL', 'https://test.com')
+@patch('weather.services.WEATHER_API_KEY', 'test_key')
+class ConcurrentFetchTest(TestCase):
+    """Test cases for fetching current weather and forecast concurrently."""
+    
+    CURRENT = {'main': {'temp': 12.0}, 'weather': [{'main': 'Rain', 'description': 'light rain'}]}
+    FORECAST = {'list': [{
+        'dt_txt': '2023-01-01 12:00:00',
+        'main': {'temp': 11.0},
+        'weather': [{'main': 'Rain', 'description': 'light rain'}]
+    }]}
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    def _fake_get(self, current_delay=0, forecast_delay=0):
+        def fake_get(url, params=None, timeout=None):
+            is_forecast = url.endswith('/forecast')
+            time.sleep(forecast_delay if is_forecast else current_delay)
+            response = Mock(status_code=200, headers={})
+            response.json.return_value = self.FORECAST if is_forecast else self.CURRENT
+            return response
+        return fake_get
+    
+    @patch('weather.client.requests.Session.get')
+    def test_requests_run_concurrently(self, mock_get):
+        """Test that the two upstream calls overlap rather than run back to back."""
+        mock_get.side_effect = self._fake_get(current_delay=0.3, forecast_delay=0.3)
+        
+        started = time.monotonic()
+        result = fetch_weather_from_api("Dublin")
+        elapsed = time.monotonic() - started
+        
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertLess(elapsed, 0.55)
+        self.assertEqual(result.temperature, 12.0)
+        self.assertEqual(len(get_forecast_from_weather_data(result)), 1)
+    
+    @patch('weather.services.FETCH_DEADLINE', 0.3)
+    @patch('weather.client.requests.Session.get')
+    def test_slow_forecast_gives_empty_forecast(self, mock_get):
+        """Test that a forecast missing the deadline still yields current weather."""
+        mock_get.side_effect = self._fake_get(forecast_delay=1)
+        
+        result = fetch_weather_from_api("Dublin")
+        
+        self.assertEqual(result.conditions, "Rain")
+        self.assertEqual(get_forecast_from_weather_data(result), [])
+    
+    @patch('weather.services.USE_MOCK_DATA', False)
+    @patch('weather.services.FETCH_DEADLINE', 0.3)
+    @patch('weather.client.requests.Session.get')
+    def test_slow_current_weather_times_out(self, mock_get):
+        """Test that current weather missing the deadline is treated as a timeout."""
+        mock_get.side_effect = self._fake_get(current_delay=1)
+        
+        with self.assertRaises(WeatherAPIException):
+            fetch_weather_from_api("Dublin")
+
+
+class AsyncWeatherServiceTest(TestCase):
+    """Test cases for the async weather service against a local fake server."""
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    async def test_aget_weather_for_location_fetches_and_caches(self):
+        """Test that a miss is fetched upstream and the next lookup is cached."""
+        with FakeWeatherServer(temperature=9.5) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                weather = await aget_weather_for_location("Vienna")
+                again = await aget_weather_for_location("Vienna")
+        
+        self.assertEqual(weather.temperature, 9.5)
+        self.assertIs(again, weather)
+        self.assertEqual(sorted(server.paths()), ['/forecast', '/weather'])
+        self.assertTrue(await WeatherData.objects.filter(location="vienna").aexists())
+    
+    async def test_concurrent_lookups_share_one_fetch(self):
+        """Test that concurrent async lookups for one location call upstream once."""
+        with FakeWeatherServer(delay=0.2) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                results = await asyncio.gather(
+                    *(aget_weather_for_location("Prague") for _ in range(5))
+                )
+        
+        self.assertEqual(len({result.id for result in results}), 1)
+        self.assertEqual(len(server.requests), 2)
+    
+    async def test_distinct_locations_fetched_concurrently(self):
+        """Test that a slow upstream does not serialize lookups for different locations."""
+        with FakeWeatherServer(delay=0.3) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                started = time.monotonic()
+                results = await asyncio.gather(
+                    aget_weather_for_location("Rome"),
+                    aget_weather_for_location("Milan"),
+                    aget_weather_for_location("Turin"),
+                )
+                elapsed = time.monotonic() - started
+        
+        self.assertTrue(all(results))
+        self.assertLess(elapsed, 0.8)
+    
+    async def test_late_fetch_is_kept_referenced(self):
+        """Test that a fetch outliving the deadline is held until it finishes."""
+        finished = asyncio.Event()
+        
+        async def slow_fetch(location):
+            await asyncio.sleep(0.2)
+            finished.set()
+            return WeatherData(location=location, temperature=2.0, conditions="Snow", forecast=[])
+        
+        with patch('weather.services._aget_recent_weather', AsyncMock(return_value=None)), \
+                patch('weather.services.afetch_weather_from_api', side_effect=slow_fetch):
+            result = await aget_weather_for_location("Oslo", deadline=time.monotonic() + 0.05)
+            
+            self.assertIsNone(result)
+            self.assertEqual(len(services._background_tasks), 1)
+            await asyncio.wait_for(finished.wait(), 1)
+            await asyncio.sleep(0)
+        
+        self.assertEqual(services._background_tasks, set())
+    
+    async def test_failed_history_write_rolls_back_current_weather(self):
+        """Test that the async store writes the current and history rows atomically."""
+        fields = {'location': "lisbon", 'temperature': 22.0, 'conditions': "Clear", 'forecast': []}
+        
+        with patch('weather.services.record_weather_history', side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                await services._astore_weather(fields)
+        
+        self.assertFalse(await WeatherData.objects.filter(location="lisbon").aexists())
+    
+    async def test_upstream_error_returns_none(self):
+        """Test that an upstream 404 is reported as no weather data."""
+        with FakeWeatherServer() as server:
+            with patch('weather.services.WEATHER_API_URL', f"{server.url}/missing"), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                result = await aget_weather_for_location("Atlantis")
+        
+        self.assertIsNone(result)
+
+
+class RateLimiterTest(TestCase):
+    """Test cases for the refresh pacing helper."""
+    
+    @patch('weather.ratelimit.time.sleep')
+    @patch('weather.ratelimit.time.monotonic', return_value=100.0)
+    def test_calls_are_spaced_at_rate(self, mock_monotonic, mock_sleep):
+        """Test that successive calls wait for their reserved slot."""
+        limiter = RateLimiter(rate=4)
+        
+        for _ in range(3):
+            limiter.acquire()
+        
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [0.25, 0.5])
+    
+    @patch('weather.ratelimit.time.sleep')
+    def test_no_rate_means_no_waiting(self, mock_sleep):
+        """Test that pacing can be disabled."""
+        limiter = RateLimiter(rate=None)
+        limiter.acquire()
+        limiter.acquire()
+        
+        mock_sleep.assert_not_called()
+
+
+class TokenBucketTest(TestCase):
+    """Test cases for the shared API quota."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.now = timezone.now()
+        self.bucket = TokenBucket('test', rate=1, capacity=5, reserve=2)
+    
+    def _at(self, seconds):
+        return patch('weather.ratelimit.timezone.now', return_value=self.now + timedelta(seconds=seconds))
+    
+    def test_burst_then_refill(self):
+        """Test that the burst is granted at once and tokens then refill at the rate."""
+        with self._at(0):
+            self.assertTrue(self.bucket.acquire(2))
+            self.assertTrue(self.bucket.acquire(3))
+            self.assertFalse(self.bucket.acquire())
+        with self._at(1.5):
+            self.assertTrue(self.bucket.acquire())
+            self.assertFalse(self.bucket.acquire())
+    
+    def test_background_leaves_reserve(self):
+        """Test that background work cannot take the tokens kept for page requests."""
+        with self._at(0):
+            with background_priority():
+                self.assertTrue(self.bucket.acquire(3))
+                self.assertFalse(self.bucket.acquire())
+            self.assertTrue(self.bucket.acquire(2))
+    
+    @patch('weather.ratelimit.time.sleep')
+    def test_waits_within_timeout(self, mock_sleep):
+        """Test that a caller sleeps for a refill if it fits within its timeout."""
+        with self._at(0):
+            self.bucket.acquire(5)
+        with self._at(0), patch.object(TokenBucket, '_take', side_effect=[1.0, 0]):
+            self.assertTrue(self.bucket.acquire(1, timeout=2))
+        
+        mock_sleep.assert_called_once_with(1.0)
+    
+    @patch('weather.services.get_weather_client')
+    def test_exhausted_quota_serves_stale_data(self, mock_client):
+        """Test that a page request without quota gets the stored row instead of waiting."""
+        WeatherData.objects.create(
+            location="bergen",
+            temperature=7.0,
+            conditions="Rain",
+            forecast=[],
+            retrieved_at=timezone.now() - timedelta(days=1)
+        )
+        
+        with patch('weather.services._quota', TokenBucket('empty', rate=0.001, capacity=1)), \
+                patch('weather.services.WEATHER_API_KEY', 'test_key'):
+            result = get_weather_for_location("Bergen")
+        
+        mock_client.return_value.get.assert_not_called()
+        self.assertEqual(result.temperature, 7.0)
+        self.assertTrue(result.is_stale)
+
+
+class RefreshWeatherTest(TestCase):
+    """Test cases for refreshing weather for locations in use."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        today = timezone.now().date()
+        
+        def trip(destination, start, end):
+            return Trip.objects.create(
+                name=destination,
+                destination=destination,
+                start_date=today + timedelta(days=start),
+                end_date=today + timedelta(days=end)
+            )
+        
+        trip("Past", -30, -20)
+        trip("Ongoing", -2, 3)
+        trip("Soon", 5, 10)
+        later = trip("Later", 40, 45)
+        Activity.objects.create(
+            trip=later,
+            name="Day trip",
+            date_time=timezone.now() + timedelta(days=41),
+            location="Excursion"
+        )
+        
+        # "Soon" was fetched recently, "Ongoing" a while ago; "Later" never
+        for location, hours in [("soon", 1), ("ongoing", 5), ("past", 2)]:
+            WeatherData.objects.create(
+                location=location,
+                temperature=10.0,
+                conditions="Clear",
+                forecast="[]",
+                retrieved_at=timezone.now()
+            )
+            WeatherData.objects.filter(location=location).update(
+                retrieved_at=timezone.now() - timedelta(hours=hours)
+            )
+    
+    def test_only_active_locations_ordered_by_staleness(self):
+        """Test that past trips are skipped and stalest locations come first."""
+        self.assertEqual(get_refresh_locations(), ["later", "ongoing", "soon"])
+    
+    def test_include_activity_locations(self):
+        """Test that activity locations of active trips can be included."""
+        locations = get_refresh_locations(include_activities=True)
+        
+        self.assertEqual(set(locations), {"later", "excursion", "ongoing", "soon"})
+        self.assertEqual(locations[:2], ["later", "excursion"])
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_refresh_reports_per_location_outcome(self, mock_fetch):
+        """Test that refresh returns totals and per-location results."""
+        def fake_fetch(location):
+            if location == "ongoing":
+                raise WeatherAPIException("HTTP error")
+            return WeatherData(location=location, temperature=1.0, conditions="Clear", forecast="[]")
+        
+        mock_fetch.side_effect = fake_fetch
+        
+        report = refresh_weather_data(max_workers=1, rate_limit=None)
+        
+        self.assertEqual(report['total'], 3)
+        self.assertEqual(report['refreshed'], 2)
+        self.assertEqual(report['failed'], 1)
+        by_location = {result['location']: result for result in report['locations']}
+        self.assertEqual(by_location["ongoing"]['status'], 'failed')
+        self.assertEqual(by_location["ongoing"]['error'], "HTTP error")
+        self.assertEqual(by_location["soon"]['status'], 'ok')
+        self.assertNotIn("past", by_location)
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_refresh_runs_fetches_concurrently(self, mock_fetch, mock_recent):
+        """Test that the worker pool overlaps slow fetches."""
+        def slow_fetch(location):
+            time.sleep(0.2)
+            return WeatherData(location=location, temperature=1.0, conditions="Clear", forecast="[]")
+        
+        mock_fetch.side_effect = slow_fetch
+        
+        report = refresh_weather_data(
+            locations=["A", "B", "C", "D"], max_workers=4, rate_limit=None
+        )
+        
+        self.assertEqual(report['refreshed'], 4)
+        self.assertLess(report['duration'], 0.6)
+        self.assertEqual([result['location'] for result in report['locations']], ["a", "b", "c", "d"])
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_refresh_joins_in_flight_fetch(self, mock_fetch):
+        """Test that a refresh waits for a page request's fetch of the same location."""
+        weather = WeatherData(location="soon", temperature=3.0, conditions="Clear", forecast=[])
+        flight = Future()
+        flight.set_running_or_notify_cancel()
+        services._inflight["soon"] = flight
+        self.addCleanup(services._inflight.pop, "soon", None)
+        threading.Timer(0.1, flight.set_result, [weather]).start()
+        
+        report = refresh_weather_data(locations=["Soon"], max_workers=1, rate_limit=None)
+        
+        mock_fetch.assert_not_called()
+        self.assertEqual(report['refreshed'], 1)
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_refresh_weather_command(self, mock_fetch):
+        """Test the refresh_weather management command."""
+        mock_fetch.return_value = WeatherData(
+            location="Soon", temperature=1.0, conditions="Clear", forecast="[]"
+        )
+        out = StringIO()
+        
+        call_command('refresh_weather', '--workers=1', '--rate=0', verbosity=2, stdout=out)
+        
+        self.assertEqual(mock_fetch.call_count, 3)
+        self.assertIn("later: ok", out.getvalue())
+        self.assertIn("Refreshed 3 of 3 locations", out.getvalue())
+
+
+class StaleWhileRevalidateTest(TestCase):
+    """Test cases for serving stale weather while refreshing in the background."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.weather = WeatherData.objects.create(
+            location="seville",
+            temperature=31.0,
+            conditions="Clear",
+            forecast="[]"
+        )
+    
+    def _age(self, hours):
+        WeatherData.objects.filter(pk=self.weather.pk).update(
+            retrieved_at=timezone.now() - timedelta(hours=hours)
+        )
+    
+    @patch('weather.services.STALE_GRACE', 2)
+    @patch('weather.services._refresh_in_background')
+    @patch('weather.services.fetch_weather_from_api')
+    def test_stale_row_served_within_grace(self, mock_fetch, mock_refresh):
+        """Test that a stale row is returned immediately and refreshed in the background."""
+        self._age(4)  # past CACHE_DURATION (3h), within the 2h grace window
+        
+        result = get_weather_for_location("Seville")
+        
+        self.assertEqual(result.id, self.weather.id)
+        self.assertTrue(result.is_stale)
+        mock_refresh.assert_called_once_with("seville")
+        mock_fetch.assert_not_called()
+    
+    @patch('weather.services.STALE_GRACE', 2)
+    @patch('weather.services._refresh_in_background')
+    @patch('weather.services.fetch_weather_from_api')
+    def test_fresh_row_not_flagged(self, mock_fetch, mock_refresh):
+        """Test that rows within CACHE_DURATION are served without a refresh."""
+        result = get_weather_for_location("Seville")
+        
+        self.assertFalse(result.is_stale)
+        mock_refresh.assert_not_called()
+    
+    @patch('weather.services.STALE_GRACE', 2)
+    @patch('weather.services._refresh_in_background')
+    @patch('weather.services.fetch_weather_from_api')
+    def test_row_past_max_age_fetched_synchronously(self, mock_fetch, mock_refresh):
+        """Test that rows older than the hard max-age force a synchronous fetch."""
+        self._age(6)
+        fresh = WeatherData(location="Seville", temperature=29.0, conditions="Clear", forecast="[]")
+        mock_fetch.return_value = fresh
+        
+        result = get_weather_for_location("Seville")
+        
+        self.assertIs(result, fresh)
+        mock_fetch.assert_called_once_with("seville")
+        mock_refresh.assert_not_called()
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_disabled_by_default(self, mock_fetch):
+        """Test that without a grace window expired rows are fetched synchronously."""
+        self._age(4)
+        mock_fetch.return_value = None
+        
+        get_weather_for_location("Seville")
+        
+        mock_fetch.assert_called_once_with("seville")
+
+
+class LatestWeatherStorageTest(TestCase):
+    """Test cases for the latest-weather table and its history."""
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    @patch('weather.client.requests.Session.get')
+    def test_fetch_updates_single_row_and_appends_history(self, mock_get):
+        """Test that repeated fetches upsert one current row and append history."""
+        response = Mock(status_code=200, headers={})
+        response.json.return_value = {'main': {'temp': 7.0}, 'weather': [{'main': 'Rain'}], 'list': []}
+        mock_get.return_value = response
+        
+        with patch('weather.services.WEATHER_API_KEY', 'test_key'):
+            first = fetch_weather_from_api("Bergen")
+            second = fetch_weather_from_api("Bergen")
+        
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(WeatherData.objects.filter(location="Bergen").count(), 1)
+        self.assertEqual(WeatherHistory.objects.filter(location="Bergen").count(), 2)
+    
+    def test_mock_data_is_not_recorded_in_history(self):
+        """Test that mock fallbacks update current weather without adding history."""
+        with patch('weather.services.WEATHER_API_KEY', ''):
+            create_mock_weather_data("Bergen")
+            create_mock_weather_data("Bergen")
+        
+        self.assertEqual(WeatherData.objects.filter(location="Bergen").count(), 1)
+        self.assertFalse(WeatherHistory.objects.exists())
+    
+    def test_lookup_is_single_query(self):
+        """Test that a database cache hit takes one query regardless of history size."""
+        WeatherData.objects.create(location="bergen", temperature=7.0, conditions="Rain", forecast="[]")
+        WeatherHistory.objects.bulk_create(
+            WeatherHistory(location="bergen", temperature=7.0, conditions="Rain", forecast="[]")
+            for _ in range(50)
+        )
+        
+        resolve_location("Bergen")
+        
+        with self.assertNumQueries(1):
+            get_weather_for_location("Bergen")
+
+
+class LocationNormalizationTest(TestCase):
+    """Test cases for canonical location keys."""
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    def test_normalize_location(self):
+        """Test that casing, whitespace and punctuation variants collapse."""
+        for variant in ["Paris", "  PARIS ", "paris.", "Paris!"]:
+            self.assertEqual(normalize_location(variant), "paris")
+        self.assertEqual(normalize_location("New   York,NY"), "new york, ny")
+        self.assertEqual(normalize_location("Aix-en-Provence"), "aix-en-provence")
+        self.assertEqual(normalize_location("ＭＵＮＩＣＨ"), "munich")
+        self.assertEqual(normalize_location(" ... "), "")
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_spelling_variants_share_cached_row(self, mock_fetch):
+        """Test that variants of a location are served from one row."""
+        weather = WeatherData.objects.create(location="paris", temperature=20.0, conditions="Clear", forecast="[]")
+        
+        for variant in ["Paris", " paris. ", "PARIS"]:
+            self.assertEqual(get_weather_for_location(variant).id, weather.id)
+        mock_fetch.assert_not_called()
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_alias_resolves_to_canonical_key(self, mock_fetch):
+        """Test that aliases from the alias table are followed."""
+        LocationAlias.objects.create(alias="nyc", canonical="new york")
+        weather = WeatherData.objects.create(location="new york", temperature=12.0, conditions="Rain", forecast="[]")
+        
+        self.assertEqual(get_weather_for_location("NYC").id, weather.id)
+        mock_fetch.assert_not_called()
+    
+    def test_city_id_merges_locations(self):
+        """Test that keys resolving to the same city id share the first key's row."""
+        with FakeWeatherServer(city_id=2988507) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                first = get_weather_for_location("Paris")
+                second = get_weather_for_location("Paris, FR")
+                WeatherData.objects.update(retrieved_at=timezone.now() - timedelta(hours=4))
+                clear_weather_cache()
+                third = get_weather_for_location("paris, fr")
+        
+        self.assertEqual(second.location, "paris")
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(third.id, first.id)
+        self.assertEqual(list(WeatherData.objects.values_list('location', flat=True)), ["paris"])
+        self.assertEqual(LocationAlias.objects.get(alias="paris, fr").canonical, "paris")
+        # Once the city id is known it is queried by id rather than by name
+        self.assertEqual(server.requests[0][1]['q'], "paris")
+        self.assertNotIn('q', server.requests[-1][1])
+        self.assertEqual(server.requests[-1][1]['id'], "2988507")
+    
+    def test_merged_location_leaves_cache(self):
+        """Test that a key becoming an alias of another city's key drops its cached weather."""
+        LocationAlias.objects.create(alias="paris", canonical="paris", city_id=2988507)
+        stale = WeatherData.objects.create(location="paris, fr", temperature=1.0, conditions="Fog", forecast="[]")
+        get_weather_for_location("Paris, FR")
+        
+        self.assertEqual(services._register_city_id("paris, fr", 2988507), "paris")
+        
+        self.assertIsNone(services._weather_cache.get("paris, fr"))
+        self.assertFalse(WeatherData.objects.filter(pk=stale.pk).exists())
+    
+    def test_refresh_locations_are_deduplicated(self):
+        """Test that trips naming one location differently are refreshed once."""
+        today = timezone.now().date()
+        for destination in ["Paris", "paris ", "PARIS."]:
+            Trip.objects.create(
+                name=destination,
+                destination=destination,
+                start_date=today,
+                end_date=today + timedelta(days=3)
+            )
+        
+        self.assertEqual(get_refresh_locations(), ["paris"])
+
+
+class BulkWeatherLookupTest(TestCase):
+    """Test cases for looking up weather for several locations at once."""
+    
+    CITIES = ["Oslo", "Rome", "Lima", "Cairo", "Quito", "Hanoi"]
+    
+    def setUp(self):
+        clear_weather_cache()
+        for city in self.CITIES:
+            WeatherData.objects.create(location=city.lower(), temperature=10.0, conditions="Clear", forecast=[])
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_cached_rows_read_in_one_query(self, mock_fetch):
+        """Test that the query count does not grow with the number of locations."""
+        for count in (2, len(self.CITIES)):
+            clear_weather_cache()
+            with self.assertNumQueries(2):  # aliases, then weather rows
+                result = get_weather_for_locations(self.CITIES[:count])
+            
+            self.assertEqual(list(result), self.CITIES[:count])
+            self.assertEqual(result["Rome"].location, "rome")
+        mock_fetch.assert_not_called()
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_misses_fetched_concurrently(self, mock_fetch, mock_recent):
+        """Test that only misses are fetched, and in parallel."""
+        def slow_fetch(location):
+            time.sleep(0.2)
+            return WeatherData(location=location, temperature=1.0, conditions="Rain", forecast=[])
+        
+        mock_fetch.side_effect = slow_fetch
+        misses = ["Perth", "Tunis", "Dakar", "Seoul"]
+        
+        started = time.monotonic()
+        result = get_weather_for_locations(["Oslo", " oslo ", ""] + misses)
+        
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(sorted(call.args[0] for call in mock_fetch.call_args_list), ["dakar", "perth", "seoul", "tunis"])
+        self.assertEqual(list(result), ["Oslo", " oslo ", "Perth", "Tunis", "Dakar", "Seoul"])
+        self.assertIs(result["Oslo"], result[" oslo "])
+        self.assertEqual(result["Dakar"].conditions, "Rain")
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_failed_fetch_maps_to_none(self, mock_fetch):
+        """Test that a failing location does not affect the others."""
+        mock_fetch.side_effect = WeatherAPIException("Location not found")
+        
+        result = get_weather_for_locations(["Oslo", "Atlantis"])
+        
+        self.assertEqual(result["Oslo"].location, "oslo")
+        self.assertIsNone(result["Atlantis"])
+    
+    async def test_async_lookup(self):
+        """Test the async variant against a local fake server."""
+        with FakeWeatherServer(temperature=3.0) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                result = await aget_weather_for_locations(["Lima", "Reykjavik", "Nuuk"])
+        
+        self.assertEqual(result["Lima"].temperature, 10.0)
+        self.assertEqual(result["Reykjavik"].temperature, 3.0)
+        self.assertEqual(sorted(server.paths()), ['/forecast', '/forecast', '/weather', '/weather'])
+
+
+class GroupRefreshTest(TestCase):
+    """Test cases for refreshing many locations through the group endpoint."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        today = timezone.localdate().isoformat()
+        self.forecast = [{"date": today, "temperature": 12.0, "condition": "Clear", "description": "clear"}]
+        self.locations = [f"city {number}" for number in range(25)]
+        for number, location in enumerate(self.locations):
+            LocationAlias.objects.create(alias=location, canonical=location, city_id=1000 + number)
+            WeatherData.objects.create(
+                location=location,
+                temperature=0.0,
+                conditions="Snow",
+                forecast=self.forecast,
+                retrieved_at=timezone.now() - timedelta(hours=4)
+            )
+    
+    def _refresh(self, locations, **kwargs):
+        with FakeWeatherServer(temperature=21.0) as server:
+            with patch('weather.services.WEATHER_API_URL', server.url), \
+                    patch('weather.services.WEATHER_API_KEY', 'test_key'):
+                report = refresh_weather_data(locations=locations, max_workers=1, rate_limit=None, **kwargs)
+        return report, server
+    
+    def test_locations_refreshed_in_batches(self):
+        """Test that 25 locations take two group calls and are upserted in place."""
+        report, server = self._refresh(self.locations)
+        
+        self.assertEqual(server.paths(), ['/group', '/group'])
+        self.assertEqual(len(server.requests[0][1]['id'].split(',')), 20)
+        self.assertEqual(report['refreshed'], 25)
+        self.assertEqual([result['location'] for result in report['locations']], self.locations)
+        self.assertEqual(WeatherData.objects.count(), 25)
+        self.assertFalse(WeatherData.objects.exclude(temperature=21.0).exists())
+        self.assertEqual(WeatherData.objects.get(location="city 3").forecast, self.forecast)
+        self.assertEqual(WeatherHistory.objects.count(), 25)
+    
+    def test_locations_needing_full_fetch(self):
+        """Test that unknown city ids and outdated forecasts fall back to individual fetches."""
+        WeatherData.objects.filter(location="city 1").update(forecast=[{"date": "2000-01-01"}])
+        
+        report, server = self._refresh(["city 0", "city 1", "Nowhere"])
+        
+        self.assertEqual(report['refreshed'], 3)
+        self.assertEqual(server.paths().count('/group'), 1)
+        self.assertEqual(server.paths().count('/weather'), 2)
+        self.assertEqual(server.requests[0][1]['id'], "1000")
+    
+    def test_batch_size_capped_at_provider_limit(self):
+        """Test that a batch size over the provider's maximum is capped, and rejected by the command."""
+        report, server = self._refresh(self.locations, batch_size=50)
+        
+        self.assertEqual([len(request[1]['id'].split(',')) for request in server.requests], [20, 5])
+        self.assertEqual(report['refreshed'], 25)
+        with self.assertRaises(CommandError):
+            call_command('refresh_weather', '--batch-size', '21')
+    
+    def test_batching_can_be_disabled(self):
+        """Test that a batch size of 0 fetches every location individually."""
+        report, server = self._refresh(self.locations[:3], batch_size=0)
+        
+        self.assertNotIn('/group', server.paths())
+        self.assertEqual(report['refreshed'], 3)
+
+
+class CircuitBreakerTest(TestCase):
+    """Test cases for the circuit breaker around the weather API."""
+    
+    def setUp(self):
+        clear_weather_cache()
+        self.breaker = CircuitBreaker('test', failure_rate=0.5, min_calls=4, window=60, cooldown=30, cache_alias='weather')
+    
+    def _record(self, successes, failures):
+        for _ in range(successes):
+            self.breaker.record_success()
+        for _ in range(failures):
+            self.breaker.record_failure()
+    
+    def test_opens_when_failure_rate_exceeded(self):
+        """Test that the circuit opens only once enough calls have failed."""
+        self._record(2, 1)
+        self.assertTrue(self.breaker.allow())
+        
+        self._record(0, 1)
+        
+        self.assertEqual(self.breaker.state(), 'open')
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['failure_rate'], 0.5)
+    
+    def test_half_open_lets_one_trial_through(self):
+        """Test that after the cooldown one trial call decides the state."""
+        self._record(0, 4)
+        
+        with patch('weather.circuit.time.time', return_value=time.time() + 31):
+            self.assertEqual(self.breaker.state(), 'half-open')
+            self.assertTrue(self.breaker.allow())
+            self.assertFalse(self.breaker.allow())
+            
+            self.breaker.record_success()
+            
+            self.assertEqual(self.breaker.state(), 'closed')
+            self.assertTrue(self.breaker.allow())
+    
+    def test_failed_trial_reopens(self):
+        """Test that a failing trial call opens the circuit for another cooldown."""
+        self._record(0, 4)
+        
+        with patch('weather.circuit.time.time', return_value=time.time() + 31):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+            
+            self.assertEqual(self.breaker.state(), 'open')
+    
+    @patch('weather.services.get_weather_client')
+    def test_outage_short_circuits_to_stale_data(self, mock_client):
+        """Test that repeated connection failures stop API calls and stale rows are served."""
+        mock_client.return_value.get.side_effect = ConnectionError("connection refused")
+        WeatherData.objects.create(
+            location="bergen",
+            temperature=7.0,
+            conditions="Rain",
+            forecast=[],
+            retrieved_at=timezone.now() - timedelta(days=2)
+        )
+        
+        with patch('weather.services.WEATHER_API_KEY', 'test_key'):
+            for city in ["Oslo", "Rome", "Lima", "Cairo", "Quito"]:
+                get_weather_for_location(city)
+            calls = mock_client.return_value.get.call_count
+            result = get_weather_for_location("Bergen")
+        
+        self.assertEqual(services.get_circuit_breaker_stats()['state'], 'open')
+        self.assertEqual(mock_client.return_value.get.call_count, calls)
+        self.assertEqual(result.temperature, 7.0)
+        self.assertTrue(result.is_stale)
+    
+    def test_missing_cache_table_is_reported(self):
+        """Test that the system check warns when the breaker's cache table is missing."""
+        with patch('weather.checks.caches', {CIRCUIT_CACHE: DatabaseCache('missing_cache_table', {})}):
+            warnings_found = check_circuit_cache_table(None, databases=['default'])
+            # Commands that do not request database checks never query the database
+            with self.assertNumQueries(0):
+                self.assertEqual(check_circuit_cache_table(None), [])
+        
+        self.assertEqual([warning.id for warning in warnings_found], ['weather.W001'])
+        self.assertEqual(check_circuit_cache_table(None, databases=['default']), [])
+    
+    def test_health_endpoint(self):
+        """Test that the circuit state is exposed to staff for monitoring."""
+        self.assertEqual(self.client.get('/weather/health/').status_code, 302)
+        self.client.force_login(User.objects.create_user("ops", is_staff=True))
+        
+        response = self.client.get('/weather/health/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['circuit']['state'], 'closed')
+        self.assertIn('hits', response.json()['cache'])
+
+
+class RenderDeadlineTest(TestCase):
+    """Test cases for bounding the time spent waiting for weather."""
+    
+    def setUp(self):
+        clear_weather_cache()
+    
+    def _slow_fetch(self, location):
+        time.sleep(0.4)
+        return WeatherData(location=location, temperature=1.0, conditions="Clear", forecast=[])
+    
+    def _wait_until_done(self, location):
+        for _ in range(100):
+            if not is_weather_pending(location):
+                return
+            time.sleep(0.02)
+        self.fail(f"Fetch for {location} never finished")
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_fetch_continues_after_deadline(self, mock_fetch, mock_recent):
+        """Test that the caller returns at the deadline while the fetch keeps going."""
+        mock_fetch.side_effect = self._slow_fetch
+        
+        started = time.monotonic()
+        result = get_weather_for_location("Riga", deadline=time.monotonic() + 0.1)
+        
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertIsNone(result)
+        self.assertTrue(is_weather_pending("Riga"))
+        self._wait_until_done("Riga")
+        mock_fetch.assert_called_once_with("riga")
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_late_callers_share_pending_fetch(self, mock_fetch, mock_recent):
+        """Test that requests made while a fetch is pending wait on it rather than queueing another."""
+        mock_fetch.side_effect = self._slow_fetch
+        
+        with patch.object(services._fetch_executor, 'submit', wraps=services._fetch_executor.submit) as submit:
+            for _ in range(3):
+                get_weather_for_location("Riga", deadline=time.monotonic() + 0.05)
+        
+        self.assertEqual(submit.call_count, 1)
+        self.assertTrue(is_weather_pending("Riga"))
+        self._wait_until_done("Riga")
+        mock_fetch.assert_called_once_with("riga")
+    
+    @patch('weather.services._get_recent_weather', return_value=None)
+    @patch('weather.services.fetch_weather_from_api')
+    def test_stored_row_served_after_deadline(self, mock_fetch, mock_recent):
+        """Test that an outdated stored row is served, flagged stale, when the fetch is late."""
+        mock_fetch.side_effect = self._slow_fetch
+        WeatherData.objects.create(
+            location="riga",
+            temperature=-3.0,
+            conditions="Snow",
+            forecast=[],
+            retrieved_at=timezone.now() - timedelta(days=1)
+        )
+        
+        result = get_weather_for_locations(["Riga", "Tallinn"], deadline=time.monotonic() + 0.1)
+        
+        self.assertEqual(result["Riga"].temperature, -3.0)
+        self.assertTrue(result["Riga"].is_stale)
+        self.assertIsNone(result["Tallinn"])
+        self._wait_until_done("Riga")
+        self._wait_until_done("Tallinn")
+    
+    @patch('weather.services.fetch_weather_from_api')
+    def test_fast_fetch_within_deadline(self, mock_fetch):
+        """Test that a fetch finishing in time is returned as usual."""
+        mock_fetch.return_value = WeatherData(location="vilnius", temperature=4.0, conditions="Rain", forecast=[])
+        
+        with patch('weather.services._get_recent_weather', return_value=None):
+            result = get_weather_for_location("Vilnius", deadline=time.monotonic() + 1)
+        
+        self.assertEqual(result.temperature, 4.0)
+
+
+class WeatherHistoryPruneTest(TestCase):
+    """Test cases for the weather history retention policy."""
+    
+    def _history(self, location, days, hour=12):
+        retrieved_at = (timezone.now() - timedelta(days=days)).replace(hour=hour, minute=0)
+        return WeatherHistory.objects.create(
+            location=location,
+            temperature=10.0,
+            conditions="Clear",
+            forecast="[]",
+            retrieved_at=retrieved_at
+        )
+    
+    def setUp(self):
+        self.recent = [self._history("Faro", 1, hour) for hour in (6, 12, 18)]
+        self.old = [self._history("Faro", 20, hour) for hour in (6, 12, 18)]
+        self.expired = [self._history("Faro", 200), self._history("Braga", 100)]
+    
+    def test_prune_expires_and_downsamples(self):
+        """Test that expired rows go and old rows are thinned to one per day."""
+        result = prune_weather_history(retention_days=90, downsample_after_days=7, chunk_size=1)
+        
+        self.assertEqual(result, {'expired': 2, 'downsampled': 2})
+        remaining = set(WeatherHistory.objects.values_list('pk', flat=True))
+        self.assertEqual(remaining, {row.pk for row in self.recent} | {self.old[-1].pk})
+    
+    def test_dry_run_deletes_nothing(self):
+        """Test that a dry run only counts rows."""
+        result = prune_weather_history(retention_days=90, downsample_after_days=7, dry_run=True)
+        
+        self.assertEqual(result, {'expired': 2, 'downsampled': 2})
+        self.assertEqual(WeatherHistory.objects.count(), 8)
+    
+    def test_prune_weather_history_command(self):
+        """Test the prune_weather_history management command."""
+        out = StringIO()
+        
+        call_command('prune_weather_history', '--retention-days=90', stdout=out)
+        
+        self.assertIn("Removed 2 expired and 2 downsampled", out.getvalue())
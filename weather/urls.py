@@ -0,0 +1,7 @@
+from django.urls import path
+
+from weather.views import weather_health
+
+urlpatterns = [
+    path('health/', weather_health, name='weather-health'),
+]
@@ -1,3 +1,18 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from weather.services import get_circuit_breaker_stats, get_weather_cache_stats
+
+
+@staff_member_required
+@require_GET
+def weather_health(request):
+    """
+    Report the state of the weather API circuit breaker and the in-process
+    weather cache, for monitoring. Only staff users may see it.
+    """
+    return JsonResponse({
+        'circuit': get_circuit_breaker_stats(),
+        'cache': get_weather_cache_stats(),
+    })